@@ -0,0 +1,447 @@
+"""
+Backend-uri de recunoaștere a vorbirii (ASR) pentru dictare în limba română.
+
+Toate backend-urile primesc un sr.AudioData și returnează textul transcris. Ca să poată fi
+înlănțuite, semnalează erorile ca SpeechRecognition: sr.UnknownValueError când nu s-a
+recunoscut nimic, sr.RequestError când motorul nu este disponibil (rețea, model lipsă).
+
+- google: serviciul Google Web Speech (necesită rețea)
+- vosk: model Kaldi local, rulat pe CPU, încărcat o singură dată și păstrat în memorie
+- stub: text fix, pentru teste și dezvoltare fără motor ASR
+"""
+import io
+import json
+import math
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import speech_recognition as sr
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+
+# Rata, numărul de canale și lățimea eșantionului la care se decodează toate înregistrările
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+
+def decode_segment(data, format=None):
+    """
+    Decodează un fișier audio (bytes, orice format suportat de ffmpeg) direct în memorie,
+    ca AudioSegment PCM mono 16 kHz / 16 biți. WAV-ul este citit fără ffmpeg; celelalte
+    formate trec prin ffmpeg pe stdin/stdout, fără fișiere temporare.
+    - format: extensia fișierului (ex. 'mp3', 'webm'), ca indiciu pentru ffmpeg
+    """
+    segment = AudioSegment.from_file(io.BytesIO(data), format=format,
+                                     parameters=['-ar', str(SAMPLE_RATE), '-ac', '1'])
+    return segment.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(SAMPLE_WIDTH)
+
+
+def to_audio_data(segment):
+    """AudioSegment (deja normalizat de decode_segment) -> sr.AudioData pentru backend-uri."""
+    return sr.AudioData(segment.raw_data, segment.frame_rate, segment.sample_width)
+
+
+def decode_audio(data, format=None):
+    """Ca decode_segment, dar returnează direct sr.AudioData."""
+    return to_audio_data(decode_segment(data, format))
+
+
+def split_at_silence(segment, max_segment_ms=30000, min_silence_ms=700, silence_offset_db=16, keep_silence_ms=200,
+                     seek_step_ms=50):
+    """
+    Intervalele (start_ms, end_ms) în care se împarte o înregistrare: zonele cu vorbire
+    (pydub.silence) sunt grupate în segmente de cel mult max_segment_ms, tăiate doar în pauze.
+    O zonă de vorbire mai lungă decât max_segment_ms este tăiată la lungime fixă.
+    - silence_offset_db: pragul de liniște, sub nivelul mediu al înregistrării
+    - keep_silence_ms: liniște păstrată la marginile fiecărui segment, ca să nu se taie cuvinte
+    """
+    if len(segment) <= max_segment_ms:
+        return [(0, len(segment))]
+    speech = detect_nonsilent(segment, min_silence_len=min_silence_ms,
+                              silence_thresh=segment.dBFS - silence_offset_db, seek_step=seek_step_ms)
+    if not speech:
+        return [(0, len(segment))]
+
+    pieces = []
+    for start, end in speech:
+        start = max(0, start - keep_silence_ms)
+        end = min(len(segment), end + keep_silence_ms)
+        while end - start > max_segment_ms:
+            pieces.append((start, start + max_segment_ms))
+            start += max_segment_ms
+        pieces.append((start, end))
+
+    ranges = [pieces[0]]
+    for start, end in pieces[1:]:
+        current_start, current_end = ranges[-1]
+        if end - current_start <= max_segment_ms:
+            ranges[-1] = (current_start, max(current_end, end))
+        else:
+            ranges.append((max(start, current_end), end))
+    return ranges
+
+
+def transcribe_segments(backend, segment, max_workers=4, **split_options):
+    """
+    Transcrie o înregistrare lungă pe bucăți: segmentele obținute cu split_at_silence rulează
+    în paralel, iar textele sunt lipite în ordinea din înregistrare. Un segment eșuat nu oprește
+    restul; rezultatul conține textul parțial și starea fiecărui segment:
+    {'text', 'complete', 'duration_ms', 'elapsed_ms', 'segments': [{'start_ms', 'end_ms', 'text',
+    'error', 'elapsed_ms'}, ...]}. Ridică eroarea primului segment doar dacă toate au eșuat.
+    """
+    started = time.time()
+    ranges = split_at_silence(segment, **split_options)
+
+    def run(bounds):
+        start_ms, end_ms = bounds
+        segment_started = time.time()
+        text, error = None, None
+        try:
+            text = backend.transcribe(to_audio_data(segment[start_ms:end_ms]))
+        except sr.UnknownValueError as e:
+            # liniște sau zgomot: segmentul nu conține text, dar nu este o eroare
+            error = e
+        except Exception as e:
+            error = e
+        return {
+            'start_ms': start_ms,
+            'end_ms': end_ms,
+            'text': text,
+            'error': error,
+            'elapsed_ms': (time.time() - segment_started) * 1000.0,
+        }
+
+    if len(ranges) == 1:
+        results = [run(ranges[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(ranges)), thread_name_prefix='asr-segment') as pool:
+            results = list(pool.map(run, ranges))
+
+    recognized = [r for r in results if r['text']]
+    failed = [r for r in results if r['error'] is not None and not isinstance(r['error'], sr.UnknownValueError)]
+    if not recognized:
+        raise failed[0]['error'] if failed else sr.UnknownValueError()
+
+    for r in results:
+        if isinstance(r['error'], sr.UnknownValueError):
+            r['error'] = None
+        elif r['error'] is not None:
+            r['error'] = str(r['error']) or type(r['error']).__name__
+    return {
+        'text': ' '.join(r['text'] for r in recognized),
+        'complete': not failed,
+        'duration_ms': len(segment),
+        'elapsed_ms': (time.time() - started) * 1000.0,
+        'segments': results,
+    }
+
+
+class BufferedStream:
+    """
+    Sesiune de transcriere pentru backend-urile fără recunoaștere incrementală: audio-ul frazei este
+    doar acumulat, fără transcrieri provizorii, și transcris o singură dată la sfârșitul frazei.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._audio = bytearray()
+
+    def accept(self, pcm):
+        self._audio += pcm
+
+    def partial(self):
+        return ''
+
+    def final(self):
+        """Textul frazei încheiate (ridică sr.UnknownValueError / sr.RequestError); sesiunea continuă cu fraza următoare."""
+        audio, self._audio = bytes(self._audio), bytearray()
+        return self.backend.transcribe(sr.AudioData(audio, SAMPLE_RATE, SAMPLE_WIDTH))
+
+
+class ASRBackend:
+    name = 'base'
+
+    def transcribe(self, audio):
+        """Transcrie un sr.AudioData; ridică sr.UnknownValueError / sr.RequestError."""
+        raise NotImplementedError
+
+    def stream(self):
+        """
+        Sesiune de transcriere incrementală pentru PCM mono 16 kHz / 16 biți: accept(pcm), partial()
+        (textul provizoriu al frazei curente) și final() (textul frazei încheiate). Implicit
+        BufferedStream; ridică sr.RequestError dacă backend-ul nu este disponibil.
+        """
+        return BufferedStream(self)
+
+    def warmup(self):
+        """Pregătește backend-ul înainte de primul request (implicit nimic)."""
+
+
+class GoogleBackend(ASRBackend):
+    name = 'google'
+
+    def __init__(self, language='ro-RO'):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def transcribe(self, audio):
+        return self._recognizer.recognize_google(audio, language=self.language)
+
+
+class VoskBackend(ASRBackend):
+    name = 'vosk'
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        self._model = None
+        self._load_error = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            # O încercare eșuată nu se repetă la fiecare request; eroarea este raportată imediat
+            if self._model is None and self._load_error is None:
+                try:
+                    import vosk
+                    vosk.SetLogLevel(-1)
+                    self._model = vosk.Model(self.model_dir)
+                except Exception as e:
+                    self._load_error = f'Modelul Vosk nu a putut fi încărcat din {self.model_dir}: {str(e)}'
+            if self._load_error:
+                raise sr.RequestError(self._load_error)
+            return self._model
+
+    def warmup(self):
+        try:
+            self._get_model()
+        except sr.RequestError:
+            pass
+
+    def transcribe(self, audio):
+        import vosk
+
+        model = self._get_model()
+        recognizer = vosk.KaldiRecognizer(model, SAMPLE_RATE)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=SAMPLE_WIDTH))
+        text = json.loads(recognizer.FinalResult()).get('text', '').strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def stream(self):
+        return VoskStream(self._get_model())
+
+
+class VoskStream:
+    """Un singur KaldiRecognizer pe toată sesiunea: fiecare cadru este decodat o singură dată."""
+
+    def __init__(self, model):
+        import vosk
+
+        self._recognizer = vosk.KaldiRecognizer(model, SAMPLE_RATE)
+
+    def accept(self, pcm):
+        self._recognizer.AcceptWaveform(pcm)
+
+    def partial(self):
+        return json.loads(self._recognizer.PartialResult()).get('partial', '').strip()
+
+    def final(self):
+        # FinalResult golește și resetează recognizer-ul pentru fraza următoare
+        text = json.loads(self._recognizer.FinalResult()).get('text', '').strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class StubBackend(ASRBackend):
+    name = 'stub'
+
+    def __init__(self, text='Pacientul prezintă tuse și febră de 3 zile.'):
+        self.text = text
+
+    def transcribe(self, audio):
+        if not self.text:
+            raise sr.UnknownValueError()
+        return self.text
+
+
+class FallbackChain(ASRBackend):
+    """Încearcă backend-urile în ordine; trece la următorul doar dacă cel curent nu este disponibil."""
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self.name = '+'.join(backend.name for backend in self.backends)
+        self._lock = threading.Lock()
+        self._stats = {backend.name: {'ok': 0, 'unknown': 0, 'unavailable': 0, 'total_ms': 0.0}
+                       for backend in self.backends}
+
+    def warmup(self):
+        for backend in self.backends:
+            backend.warmup()
+
+    def stream(self):
+        """Primul backend cu recunoaștere incrementală disponibil; altfel frazele sunt transcrise
+        întregi prin lanțul de backend-uri (cu trecere la următorul)."""
+        for backend in self.backends:
+            if type(backend).stream is ASRBackend.stream:
+                continue
+            try:
+                return backend.stream()
+            except sr.RequestError:
+                continue
+        return BufferedStream(self)
+
+    def transcribe(self, audio):
+        last_error = None
+        for backend in self.backends:
+            started = time.time()
+            outcome = 'unavailable'
+            try:
+                text = backend.transcribe(audio)
+                outcome = 'ok'
+            except sr.UnknownValueError:
+                outcome = 'unknown'
+                raise
+            except sr.RequestError as e:
+                last_error = e
+                continue
+            finally:
+                with self._lock:
+                    stats = self._stats[backend.name]
+                    stats[outcome] += 1
+                    stats['total_ms'] += (time.time() - started) * 1000.0
+            return text
+        raise last_error
+
+    def metrics(self):
+        """Număr de transcrieri reușite / nerecunoscute / indisponibile și latența medie per backend."""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                calls = stats['ok'] + stats['unknown'] + stats['unavailable']
+                result[name] = {key: value for key, value in stats.items() if key != 'total_ms'}
+                result[name]['avg_ms'] = stats['total_ms'] / calls if calls else 0.0
+            return result
+
+
+def pcm_rms(pcm):
+    """RMS-ul unui cadru PCM 16 biți little-endian (echivalentul audioop.rms, eliminat în Python 3.13)."""
+    samples = array('h')
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % SAMPLE_WIDTH])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    if not samples:
+        return 0
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+class StreamingTranscriber:
+    """
+    Transcriere incrementală pentru dictarea live: primește bucăți de PCM mono 16 kHz / 16 biți
+    (little-endian) pe măsură ce medicul vorbește și detectează sfârșitul unei fraze după o pauză.
+
+    Cadrele sunt trimise pe măsură ce sosesc unei singure sesiuni de transcriere (backend.stream()),
+    deci fiecare cadru este decodat o singură dată, nu la fiecare transcriere provizorie.
+
+    feed() și finish() returnează evenimente (tip, text):
+    - ('partial', text): transcrierea provizorie a frazei curente, cam la fiecare partial_every_ms de audio
+      (doar pentru backend-urile cu recunoaștere incrementală, ex. vosk)
+    - ('final', text): fraza s-a încheiat (pauză de end_silence_ms sau max_utterance_ms atins)
+    """
+
+    def __init__(self, backend, frame_ms=30, silence_rms=300, end_silence_ms=800, partial_every_ms=1500,
+                 max_utterance_ms=30000):
+        """
+        - silence_rms: sub acest RMS un cadru este considerat liniște
+        - end_silence_ms: pauza după care fraza este considerată încheiată
+        """
+        self.backend = backend
+        self.frame_bytes = SAMPLE_RATE * frame_ms // 1000 * SAMPLE_WIDTH
+        self.frame_ms = frame_ms
+        self.silence_rms = silence_rms
+        self.end_silence_ms = end_silence_ms
+        self.partial_every_ms = partial_every_ms
+        self.max_utterance_ms = max_utterance_ms
+        self._pending = b''
+        self._stream = None
+        self._utterance_ms = 0
+        self._in_speech = False
+        self._silence_ms = 0
+        self._since_partial_ms = 0
+
+    def feed(self, pcm):
+        """Adaugă audio; returnează evenimentele produse de cadrele complete."""
+        events = []
+        self._pending += pcm
+        while len(self._pending) >= self.frame_bytes:
+            frame = self._pending[:self.frame_bytes]
+            self._pending = self._pending[self.frame_bytes:]
+            voiced = pcm_rms(frame) >= self.silence_rms
+            if not self._in_speech:
+                if not voiced:
+                    continue
+                self._in_speech = True
+            if self._stream is None:
+                self._stream = self.backend.stream()
+            self._stream.accept(frame)
+            self._utterance_ms += self.frame_ms
+            self._silence_ms = 0 if voiced else self._silence_ms + self.frame_ms
+            self._since_partial_ms += self.frame_ms
+
+            if self._silence_ms >= self.end_silence_ms or self._utterance_ms >= self.max_utterance_ms:
+                events.extend(self._end_utterance())
+            elif self._since_partial_ms >= self.partial_every_ms and not self._silence_ms:
+                self._since_partial_ms = 0
+                text = self._stream.partial()
+                if text:
+                    events.append(('partial', text))
+        return events
+
+    def finish(self):
+        """Încheie fluxul: fraza în curs (dacă există) este transcrisă ca finală."""
+        if self._pending and self._in_speech:
+            self._stream.accept(self._pending)
+        self._pending = b''
+        return self._end_utterance() if self._in_speech else []
+
+    def _end_utterance(self):
+        try:
+            text = self._stream.final()
+        except sr.UnknownValueError:
+            text = ''
+        self._utterance_ms = 0
+        self._in_speech = False
+        self._silence_ms = 0
+        self._since_partial_ms = 0
+        return [('final', text)] if text else []
+
+
+BACKENDS = ('google', 'vosk', 'stub')
+
+
+def create_backend(name, model_dir=None, fallback=None, language='ro-RO'):
+    """
+    Construiește backend-ul configurat, urmat opțional de backend-urile de rezervă.
+    - name: 'google', 'vosk' sau 'stub'
+    - model_dir: directorul modelului pentru backend-urile locale (vosk)
+    - fallback: nume sau listă de nume încercate când backend-ul principal nu este disponibil
+    """
+    if isinstance(fallback, str):
+        fallback = [fallback]
+    backends = []
+    for backend_name in [name] + [f for f in (fallback or []) if f != name]:
+        if backend_name == 'google':
+            backends.append(GoogleBackend(language=language))
+        elif backend_name == 'vosk':
+            if not model_dir:
+                raise ValueError('Backend-ul vosk necesită model_dir')
+            backends.append(VoskBackend(model_dir))
+        elif backend_name == 'stub':
+            backends.append(StubBackend())
+        else:
+            raise ValueError(f"Backend ASR necunoscut: {backend_name} (disponibile: {', '.join(BACKENDS)})")
+    return FallbackChain(backends)
@@ -0,0 +1,99 @@
+"""
+Microbenchmark pentru regulile de extracție din documents.py, pe intrările din data.json.
+
+Măsoară costul mediu per apel (µs) pentru format_result (pe "output"), extract_istoric_medical
+(pe "input") și extract_medicamente_from_input (pe "input" + rezultatul formatat). Cu --baseline,
+aceleași apeluri rulează și pe o altă versiune a modulului, iar rezultatele sunt comparate:
+
+    git show HEAD~1:backend/documents.py > /tmp/documents_old.py
+    python backend/benchmark_documents.py --baseline /tmp/documents_old.py
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+import documents
+
+DEFAULT_DATA = os.path.join(os.path.dirname(BASE_DIR), 'data', 'models', 'data.json')
+
+
+def load_cases(path, limit=None):
+    """(input, output) din data.json; output lipsă devine șir gol."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    cases = [(item['input'], item.get('output') or '') for item in data if isinstance(item, dict) and item.get('input')]
+    return cases[:limit] if limit else cases
+
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location('documents_baseline', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench(module, cases, repeat):
+    """Timpul mediu per apel, în µs, pentru fiecare funcție."""
+    formatted = [module.format_result(output) for _, output in cases]
+    calls = {
+        'format_result': lambda: [module.format_result(output) for _, output in cases],
+        'extract_istoric_medical': lambda: [module.extract_istoric_medical(text) for text, _ in cases],
+        'extract_medicamente_from_input': lambda: [module.extract_medicamente_from_input(text, result)
+                                                   for (text, _), result in zip(cases, formatted)],
+    }
+    timings = {}
+    for name, run in calls.items():
+        run()  # încălzire
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best / len(cases) * 1e6
+    return timings
+
+
+def same_outputs(module, baseline, cases):
+    """Verifică faptul că cele două versiuni produc exact aceleași rezultate."""
+    for text, output in cases:
+        result = module.format_result(output)
+        if result != baseline.format_result(output):
+            return False
+        if module.extract_istoric_medical(text) != baseline.extract_istoric_medical(text):
+            return False
+        if module.extract_medicamente_from_input(text, result) != baseline.extract_medicamente_from_input(text, result):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark pentru extracția din documents.py.")
+    parser.add_argument("--json-path", "-j", default=DEFAULT_DATA, help="Fișierul data.json (listă de {input, output}).")
+    parser.add_argument("--limit", "-n", type=int, default=None, help="Numărul maxim de intrări folosite.")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="Repetări; se raportează cea mai rapidă (implicit 5).")
+    parser.add_argument("--baseline", default=None, help="Altă versiune a documents.py, pentru comparație.")
+    args = parser.parse_args()
+
+    cases = load_cases(args.json_path, args.limit)
+    if not cases:
+        sys.exit(f"Nicio intrare cu cheia 'input' în {args.json_path}")
+
+    report = {'cases': len(cases), 'us_per_call': bench(documents, cases, args.repeat)}
+    if args.baseline:
+        baseline = load_module(args.baseline)
+        report['baseline_us_per_call'] = bench(baseline, cases, args.repeat)
+        report['speedup'] = {name: report['baseline_us_per_call'][name] / us if us else None
+                             for name, us in report['us_per_call'].items()}
+        report['same_outputs'] = same_outputs(documents, baseline, cases)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
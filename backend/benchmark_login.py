@@ -0,0 +1,198 @@
+"""
+Benchmark pentru accesul concurent la tabela users, așa cum îl fac /login și /register.
+
+Mai multe thread-uri rulează în paralel login-uri (SELECT după username + verificarea parolei),
+iar o parte din operații (--write-ratio) sunt înregistrări de utilizatori noi. Același volum de
+lucru rulează în două moduri, fiecare pe o bază de date nouă, temporară:
+
+- per-request: un sqlite3.connect per operație, jurnal rollback (comportamentul vechi din server.py)
+- pooled: db.Database (pool limitat de conexiuni, WAL, busy_timeout, instrucțiuni cache-uite)
+
+Implicit, fiecare operație rulează într-un thread nou, ca la serverul Flask de dezvoltare
+(threaded=True), cu cel mult --threads operații simultane; --long-lived-threads folosește în schimb
+--threads thread-uri care rulează fiecare --ops operații.
+
+    python backend/benchmark_login.py --threads 16 --ops 500 --write-ratio 0.1
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+import db
+
+MODES = ('per-request', 'pooled')
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def seed(path, users):
+    """Creează tabela users cu utilizatorii dați (jurnalul rămâne cel implicit, rollback)."""
+    conn = sqlite3.connect(path)
+    conn.execute(db.CREATE_USERS)
+    conn.executemany(db.INSERT_USER, [(username, hash_password(password), username) for username, password in users])
+    conn.commit()
+    conn.close()
+
+
+class PerRequest:
+    """Tiparul vechi: o conexiune nouă la fiecare request, închisă la final."""
+
+    def __init__(self, path, busy_timeout_ms):
+        self.path = path
+        self.timeout = busy_timeout_ms / 1000
+
+    def login(self, username, password):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        user = conn.execute(db.SELECT_USER_BY_USERNAME, (username,)).fetchone()
+        conn.close()
+        return bool(user) and user[2] == hash_password(password)
+
+    def register(self, username, password):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            if conn.execute(db.SELECT_USER_ID_BY_USERNAME, (username,)).fetchone():
+                return False
+            conn.execute(db.INSERT_USER, (username, hash_password(password), username))
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+
+
+class Pooled:
+    """Stratul db.Database folosit de server."""
+
+    def __init__(self, path, busy_timeout_ms, pool_size=db.POOL_SIZE):
+        self.database = db.Database(path, pool_size=pool_size, busy_timeout_ms=busy_timeout_ms)
+
+    def login(self, username, password):
+        user = self.database.query_one(db.SELECT_USER_BY_USERNAME, (username,))
+        return bool(user) and user[2] == hash_password(password)
+
+    def register(self, username, password):
+        if self.database.query_one(db.SELECT_USER_ID_BY_USERNAME, (username,)):
+            return False
+        with self.database.transaction() as conn:
+            conn.execute(db.INSERT_USER, (username, hash_password(password), username))
+        return True
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(mode, users, threads, ops, write_ratio, busy_timeout_ms, pool_size, seed_value, long_lived_threads):
+    """Rulează threads x ops operații într-un mod; returnează throughput, latențe (ms) și erori."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.db')
+        seed(path, users)
+        backend = Pooled(path, busy_timeout_ms, pool_size) if mode == 'pooled' else PerRequest(path, busy_timeout_ms)
+        latencies = []
+        counters = {'locked_errors': 0, 'failed_logins': 0}
+        lock = threading.Lock()
+        # Operațiile sunt alese dinainte, ca ambele moduri să ruleze exact același volum de lucru
+        rng = random.Random(seed_value)
+        operations = [('register', (f'bench-{i}', 'parola123')) if rng.random() < write_ratio
+                      else ('login', rng.choice(users)) for i in range(threads * ops)]
+
+        def one(kind, args):
+            started = time.perf_counter()
+            error = failed = False
+            try:
+                if kind == 'register':
+                    backend.register(*args)
+                else:
+                    failed = not backend.login(*args)
+            except sqlite3.OperationalError:
+                error = True  # "database is locked" după busy_timeout
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                counters['locked_errors'] += error
+                counters['failed_logins'] += failed
+
+        started = time.perf_counter()
+        if long_lived_threads:
+            workers = [threading.Thread(target=lambda part: [one(*op) for op in part], args=(operations[i::threads],))
+                       for i in range(threads)]
+            for thread in workers:
+                thread.start()
+        else:
+            # Un thread nou per request, cel mult threads simultan
+            slots = threading.BoundedSemaphore(threads)
+            workers = []
+
+            def request_thread(op):
+                try:
+                    one(*op)
+                finally:
+                    slots.release()
+
+            for op in operations:
+                slots.acquire()
+                thread = threading.Thread(target=request_thread, args=(op,))
+                thread.start()
+                workers.append(thread)
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        connections = backend.database.stats()['connections'] if mode == 'pooled' else len(operations)
+
+    return {
+        'ops_per_s': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'locked_errors': counters['locked_errors'],
+        'failed_logins': counters['failed_logins'],
+        'connections_opened': connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de login-uri concurente pe tabela users.")
+    parser.add_argument("--threads", "-t", type=int, default=16, help="Request-uri concurente (implicit 16).")
+    parser.add_argument("--ops", "-n", type=int, default=500, help="Operații per thread (implicit 500).")
+    parser.add_argument("--users", "-u", type=int, default=100, help="Utilizatori existenți în bază (implicit 100).")
+    parser.add_argument("--write-ratio", "-w", type=float, default=0.05,
+                        help="Fracțiunea de operații care sunt înregistrări (implicit 0.05).")
+    parser.add_argument("--busy-timeout-ms", type=int, default=db.BUSY_TIMEOUT_MS,
+                        help=f"Cât așteaptă o scriere după lock (implicit {db.BUSY_TIMEOUT_MS}).")
+    parser.add_argument("--pool-size", type=int, default=db.POOL_SIZE,
+                        help=f"Conexiuni în pool pentru modul pooled (implicit {db.POOL_SIZE}).")
+    parser.add_argument("--long-lived-threads", action="store_true",
+                        help="Thread-uri care rulează fiecare --ops operații, în loc de un thread per request.")
+    parser.add_argument("--mode", choices=MODES, action="append", default=None,
+                        help="Modul testat; poate fi repetat (implicit ambele).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed pentru alegerea operațiilor.")
+    args = parser.parse_args()
+
+    users = [(f'user{i}', f'parola{i}') for i in range(args.users)]
+    report = {'threads': args.threads, 'ops_per_thread': args.ops, 'write_ratio': args.write_ratio,
+              'thread_per_request': not args.long_lived_threads, 'modes': {}}
+    for mode in args.mode or MODES:
+        report['modes'][mode] = run(mode, users, args.threads, args.ops, args.write_ratio, args.busy_timeout_ms,
+                                    args.pool_size, args.seed, args.long_lived_threads)
+    modes = report['modes']
+    if all(mode in modes for mode in MODES) and modes['per-request']['ops_per_s']:
+        report['speedup'] = modes['pooled']['ops_per_s'] / modes['per-request']['ops_per_s']
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
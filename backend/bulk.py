@@ -0,0 +1,178 @@
+"""
+Procesare în bulk a notelor clinice din fișiere JSONL de orice dimensiune.
+
+Fiecare linie de intrare este un obiect JSON cu cheia "input" (ca în data.json) sau "text"
+și, opțional, "id". Intrările sunt citite în flux, rulate în batch-uri prin model, iar pentru
+fiecare linie se scrie imediat o linie JSONL de rezultat (format_result, notă clinică, rețetă).
+O notă mai lungă decât limita encoder-ului este împărțită în fragmente (testModel.split_long_input)
+care rulează în același batch, iar rezultatele lor sunt combinate, ca la /api/process.
+Rulat din CLI, procesarea poate fi reluată după o oprire de la ultima linie terminată:
+
+    python backend/bulk.py --in istoric.jsonl --out rezultate.jsonl --batch-size 16
+"""
+import argparse
+import json
+import os
+import sys
+
+import testModel
+from documents import (RESULT_SECTIONS, format_result, generate_nota_clinica, generate_reteta_mediala,
+                       merge_formatted_results)
+
+
+def _parse_line(raw):
+    """Returnează (record, text, error) pentru o linie JSONL."""
+    try:
+        record = json.loads(raw)
+    except ValueError as e:
+        return None, None, f'JSON invalid: {str(e)}'
+    if not isinstance(record, dict):
+        return None, None, 'Linia trebuie să fie un obiect JSON'
+    text = str(record.get('input') or record.get('text') or '').strip()
+    if not text:
+        return record, None, 'Lipsește cheia "input" sau "text"'
+    return record, text, None
+
+
+def _build_output(line_no, record, text, generated_texts, patient_info):
+    # Un text generat per fragment; o notă scurtă are un singur fragment
+    formatted_result = merge_formatted_results([format_result({'generated_text': generated_text})
+                                                for generated_text in generated_texts])
+    return {
+        'line': line_no,
+        'id': record.get('id'),
+        'input': text,
+        'generated_text': '\n'.join(generated_texts),
+        'result': formatted_result,
+        'nota_clinica': generate_nota_clinica(formatted_result, text, patient_info),
+        'reteta_mediala': generate_reteta_mediala(formatted_result, text, patient_info),
+    }
+
+
+def process_lines(lines, model_dir=testModel.MODEL_DIR, batch_size=8, profile=testModel.DEFAULT_TEXT_PROFILE,
+                  start_line=0, patient_info=None, load_options=None, sections=None, runner=None,
+                  long_input_chunking=True):
+    """
+    Generator: consumă linii JSONL (str sau bytes) și produce câte un dict de rezultat per linie
+    nevidă, în ordinea intrării. Liniile cu numărul <= start_line sunt sărite (reluare).
+    Liniile invalide produc un rezultat cu cheia "error" în loc să oprească procesarea.
+    sections: oprire timpurie după secțiunile date (vezi testModel.generate_texts).
+    runner: funcție (inputs, max_out_len, profile, sections) -> list[str] (ex. pool-ul de workeri de
+    inferență); implicit modelul din registry, încărcat în procesul curent.
+    long_input_chunking: notele peste limita encoder-ului sunt împărțite în fragmente în loc să fie trunchiate.
+    """
+    tokenizer = None
+    if runner is None:
+        tokenizer, model, device = testModel.get_model(model_dir=model_dir, **(load_options or {}))
+
+        def runner(inputs, max_out_len, profile, sections):
+            return testModel.generate_texts(tokenizer, model, device, inputs, max_out_len, profile=profile,
+                                            sections=sections)
+    elif long_input_chunking:
+        tokenizer = testModel.get_tokenizer(model_dir)
+    pending = []  # (line_no, record, text, error)
+
+    def flush():
+        # Fragmentele tuturor notelor din batch rulează împreună
+        chunks = {line_no: testModel.split_long_input(tokenizer, text) if long_input_chunking else [text]
+                  for line_no, _, text, error in pending if error is None}
+        texts = [testModel.build_input(chunk) for line_chunks in chunks.values() for chunk in line_chunks]
+        preds = iter(runner(texts, testModel.MAX_OUTPUT_LEN, profile, sections) if texts else [])
+        for line_no, record, text, error in pending:
+            if error is not None:
+                yield {'line': line_no, 'id': record.get('id') if record else None, 'error': error}
+            else:
+                generated_texts = [next(preds) for _ in chunks[line_no]]
+                yield _build_output(line_no, record, text, generated_texts, patient_info)
+        pending.clear()
+
+    for line_no, raw in enumerate(lines, 1):
+        if line_no <= start_line:
+            continue
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        raw = raw.strip()
+        if not raw:
+            continue
+        record, text, error = _parse_line(raw)
+        pending.append((line_no, record, text, error))
+        if len(pending) >= batch_size:
+            yield from flush()
+
+    if pending:
+        yield from flush()
+
+
+def last_completed_line(out_path):
+    """
+    Ultima linie de intrare procesată complet, citită din fișierul de output.
+    O linie de output scrisă parțial (crash în timpul scrierii) este eliminată.
+    """
+    if not os.path.exists(out_path):
+        return 0
+    last = 0
+    good_size = 0
+    with open(out_path, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                last = json.loads(raw)['line']
+            except (ValueError, KeyError, TypeError):
+                break
+            good_size += len(raw)
+    if good_size != os.path.getsize(out_path):
+        with open(out_path, 'r+b') as f:
+            f.truncate(good_size)
+    return last
+
+
+def run(in_path, out_path, model_dir=testModel.MODEL_DIR, batch_size=8, profile=testModel.DEFAULT_TEXT_PROFILE,
+        resume=True, load_options=None, sections=None, long_input_chunking=True):
+    """Procesează in_path -> out_path; returnează (linia după care s-a reluat, numărul de rezultate scrise)."""
+    start_line = last_completed_line(out_path) if resume else 0
+    written = 0
+    with open(in_path, 'r', encoding='utf-8') as fin, \
+            open(out_path, 'a' if resume else 'w', encoding='utf-8') as fout:
+        for out in process_lines(fin, model_dir=model_dir, batch_size=batch_size, profile=profile,
+                                 start_line=start_line, load_options=load_options, sections=sections,
+                                 long_input_chunking=long_input_chunking):
+            fout.write(json.dumps(out, ensure_ascii=False) + '\n')
+            written += 1
+            # fiecare rezultat ajunge pe disc imediat, ca reluarea să nu refacă muncă
+            fout.flush()
+            os.fsync(fout.fileno())
+    return start_line, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesare în bulk a notelor clinice (JSONL -> JSONL).")
+    parser.add_argument("--in", dest="in_path", required=True, help="Fișier JSONL de intrare (cheia 'input' sau 'text').")
+    parser.add_argument("--out", dest="out_path", required=True, help="Fișier JSONL de rezultate.")
+    parser.add_argument("--batch-size", "-b", type=int, default=8, help="Număr de note per model.generate (implicit 8).")
+    parser.add_argument("--profile", "-p", choices=list(testModel.DECODING_PROFILES), default=testModel.DEFAULT_TEXT_PROFILE,
+                        help="Profil de decodare (implicit balanced).")
+    parser.add_argument("--model-dir", default=testModel.MODEL_DIR, help="Directorul modelului.")
+    parser.add_argument("--quantize", "-q", action="store_true", help="Folosește modelul cuantizat int8 (CPU).")
+    parser.add_argument("--mmap", action="store_true", help="Mapează greutățile modelului în memorie (partajate între procese).")
+    parser.add_argument("--onnx", action="store_true", help="Rulează modelul exportat în ONNX Runtime (CPU).")
+    parser.add_argument("--stop-after-sections", action="store_true",
+                        help="Oprește generarea când cele 4 secțiuni ale rezultatului sunt complete.")
+    parser.add_argument("--no-long-input-chunking", action="store_true",
+                        help="Trunchiază notele peste limita encoder-ului în loc să le împartă în fragmente.")
+    parser.add_argument("--no-resume", action="store_true", help="Rescrie fișierul de output în loc să reia procesarea.")
+    args = parser.parse_args()
+
+    start_line, written = run(args.in_path, args.out_path, model_dir=args.model_dir, batch_size=args.batch_size,
+                              profile=args.profile, resume=not args.no_resume,
+                              load_options={'quantize': args.quantize, 'mmap': args.mmap,
+                                            'backend': 'onnx' if args.onnx else None},
+                              sections=RESULT_SECTIONS if args.stop_after_sections else None,
+                              long_input_chunking=not args.no_long_input_chunking)
+    if start_line:
+        print(f"Reluat după linia {start_line}.", file=sys.stderr)
+    print(f"{written} rezultate scrise în {args.out_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
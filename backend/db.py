@@ -0,0 +1,187 @@
+"""
+Strat de acces la baza de date SQLite (medical_records.db).
+
+Conexiunile sunt ținute într-un pool limitat (pool_size), comun tuturor thread-urilor procesului:
+fiecare operație ia o conexiune liberă și o pune înapoi la final, în loc de un sqlite3.connect per
+request. Serverul Flask de dezvoltare pornește un thread nou pentru fiecare request, deci o
+conexiune per thread ar fi redeschisă la fiecare request; din pool, aceeași conexiune (cu
+instrucțiunile ei deja compilate) servește request-uri succesive. Conexiunile rulează în modul WAL
+(cititorii nu blochează scriitorul și invers), cu synchronous=NORMAL și un busy_timeout: o scriere
+care găsește baza blocată așteaptă în loc să eșueze imediat cu "database is locked". Interogările
+sunt constante cu nume; modulul sqlite3 păstrează per conexiune instrucțiunile compilate
+(cached_statements), astfel încât aceeași interogare nu mai este pregătită din nou.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 64
+
+CREATE_USERS = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+COUNT_USERS = 'SELECT COUNT(*) FROM users'
+SELECT_USER_BY_USERNAME = 'SELECT id, username, password_hash, full_name FROM users WHERE username = ?'
+SELECT_USER_ID_BY_USERNAME = 'SELECT id FROM users WHERE username = ?'
+INSERT_USER = 'INSERT INTO users (username, password_hash, full_name) VALUES (?, ?, ?)'
+
+
+class Result:
+    """Rezultatul unei instrucțiuni executate prin Database.execute (conexiunea e deja înapoi în pool)."""
+    __slots__ = ('rows', 'rowcount', 'lastrowid')
+
+    def __init__(self, rows, rowcount, lastrowid):
+        self.rows = rows
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+
+class Database:
+    def __init__(self, path, pool_size=POOL_SIZE, busy_timeout_ms=BUSY_TIMEOUT_MS, cached_statements=CACHED_STATEMENTS):
+        """
+        - pool_size: câte conexiuni pot fi deschise simultan; peste această limită, o operație
+          așteaptă (cel mult busy_timeout_ms) să se elibereze o conexiune
+        - busy_timeout_ms: cât așteaptă o scriere după lock-ul bazei înainte de a eșua
+        - cached_statements: câte instrucțiuni compilate păstrează fiecare conexiune
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()  # ultima conexiune eliberată e cea mai probabil caldă
+        self._created = 0
+        self._pid = os.getpid()
+        self._stats = {'connections': 0, 'checkouts': 0, 'waits': 0, 'transactions': 0, 'busy_errors': 0}
+
+    def _open(self):
+        # isolation_level=None: citirile rulează în autocommit, scrierile în transaction();
+        # check_same_thread=False: o conexiune trece de la un thread la altul prin pool
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Proces copil (fork): conexiunile părintelui nu sunt folosite și nici închise
+                self._idle = queue.LifoQueue()
+                self._created = 0
+                self._pid = os.getpid()
+            self._stats['checkouts'] += 1
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+                self._stats['connections'] += 1
+            else:
+                self._stats['waits'] += 1
+        if create:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.busy_timeout_ms / 1000)
+        except queue.Empty:
+            with self._lock:
+                self._stats['busy_errors'] += 1
+            raise sqlite3.OperationalError(f'database pool exhausted ({self.pool_size} connections in use)')
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """O conexiune din pool, pentru durata blocului with."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def execute(self, sql, params=()):
+        """O singură instrucțiune în autocommit; returnează rândurile (pentru SELECT) și rowcount/lastrowid."""
+        with self.connection() as conn:
+            try:
+                cursor = conn.execute(sql, params)
+                return Result(cursor.fetchall(), cursor.rowcount, cursor.lastrowid)
+            except sqlite3.OperationalError as e:
+                self._count_busy(e)
+                raise
+
+    def query_one(self, sql, params=()):
+        rows = self.execute(sql, params).rows
+        return rows[0] if rows else None
+
+    def query_all(self, sql, params=()):
+        return self.execute(sql, params).rows
+
+    @contextmanager
+    def transaction(self):
+        """
+        Tranzacție de scriere: BEGIN IMMEDIATE ia lock-ul de scriere de la început (așteptând cel mult
+        busy_timeout_ms), ca o tranzacție care citește și apoi scrie să nu eșueze la jumătate.
+        Commit la ieșire, rollback la excepție.
+        """
+        with self.connection() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+            except sqlite3.OperationalError as e:
+                self._count_busy(e)
+                raise
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        with self._lock:
+            self._stats['transactions'] += 1
+
+    def _count_busy(self, error):
+        if 'locked' in str(error) or 'busy' in str(error):
+            with self._lock:
+                self._stats['busy_errors'] += 1
+
+    def close(self):
+        """Închide conexiunile libere din pool (următoarea operație deschide altele)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        """Contoare pentru monitorizare."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['pool_size'] = self.pool_size
+        stats['journal_mode'] = self.query_one('PRAGMA journal_mode')[0]
+        stats['busy_timeout_ms'] = self.busy_timeout_ms
+        return stats
@@ -0,0 +1,539 @@
+"""
+Formatarea rezultatului modelului și generarea documentelor medicale
+(Notă Clinică și Rețetă Medicală). Folosit de server și de procesarea în bulk.
+"""
+import re
+from datetime import datetime
+
+import medlex
+
+NO_DIAGNOSIS = "Nu a fost identificată"
+NO_MEDICATION = "Nu sunt recomandate medicamente"
+NO_INVESTIGATIONS = "Nu sunt recomandate investigații"
+NO_RECOMMENDATIONS = "Nu sunt recomandări suplimentare"
+
+def _multi_pattern(patterns):
+    """
+    Compilează o listă de expresii într-una singură care parcurge textul o dată și raportează,
+    la fiecare poziție, care dintre ele se potrivesc acolo (grupurile p0..pN, prin lookahead).
+    Potrivirile nu consumă text, deci se găsesc și cele care s-ar suprapune între expresii.
+    Expresiile sunt scrise cu litere mici și rulează pe textul deja convertit la litere mici.
+    """
+    guard = '|'.join(f'(?:{pattern})' for pattern in patterns)
+    captures = ''.join(f'(?:(?=(?P<p{i}>{pattern})))?' for i, pattern in enumerate(patterns))
+    return re.compile(f'(?=(?:{guard})){captures}')
+
+def _first_match(patterns, text, pos, endpos):
+    """Prima potrivire a celei mai prioritare expresii care apare în text[pos:endpos], sau None."""
+    for pattern in patterns:
+        match = pattern.search(text, pos, endpos)
+        if match:
+            return match
+    return None
+
+# format_result: o singură trecere găsește etichetele celor 4 câmpuri (urmate de ':'); valoarea
+# fiecărui câmp este textul de după etichetă până la primul punct
+_RESULT_LABELS_RE = re.compile(
+    r'(?:(?P<boala>Boala)'
+    r'|(?P<tratament>Tratament\s+recomandat)'
+    r'|(?P<investigatii>Investigații\s+suplimentare)'
+    r'|(?P<recomandari>Recomandări\s+suplimentare))'
+    r'(?=:)',
+    re.IGNORECASE)
+_RESULT_VALUE_RE = re.compile(r':\s*([^.]*?)(?:\s*\.|$)')
+_RESULT_FIELDS = ('boala', 'tratament', 'investigatii', 'recomandari')
+RESULT_SECTIONS = _RESULT_FIELDS
+
+# extract_istoric_medical: expresiile specifice, în ordinea în care apar în rezultat
+_HISTORY_PATTERNS = [
+    # Smoking history
+    r'fumător\s+(?:de\s+)?\d+\s+ani',
+    r'fumat\s+(?:de\s+)?\d+\s+ani',
+    r'fumător\s+activ',
+    r'fumător\s+în\s+trecut',
+    # Medical history phrases
+    r'istoric\s+de\s+[^.!?]+',
+    r'antecedente\s+[^.!?]+',
+    r'în\s+trecut\s+[^.!?]+',
+    r'precedent\s+[^.!?]+',
+    # Chronic conditions
+    r'hipertensiune\s+(?:de\s+)?\d+\s+ani',
+    r'diabet\s+(?:de\s+)?\d+\s+ani',
+]
+_HISTORY_RE = _multi_pattern(_HISTORY_PATTERNS)
+_HISTORY_GROUPS = [_HISTORY_RE.groupindex[f'p{i}'] for i in range(len(_HISTORY_PATTERNS))]
+_SENTENCE_SPLIT_RE = re.compile(r'[.!?]\s+')
+_HISTORY_KEYWORDS = ('fumător', 'fumat', 'istoric', 'antecedente', 'în trecut', 'precedent', 'hipertensiune', 'diabet')
+_HISTORY_EXCLUDE_KEYWORDS = ('simptome', 'tratament', 'medicament', 'recomand', 'diagnostic', 'examen', 'investigație')
+
+# extract_medicamente_from_input: doza și modul de administrare, fiecare în ordinea priorității.
+# Rămân căutări separate, oprite la prima expresie găsită: combinate într-o singură trecere cu
+# lookahead, [^.]* ar fi reevaluat la fiecare cifră din context, ceea ce este mai lent.
+_DOSE_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\d+\s*-\s*\d+\s*(?:mg|mcg|ml|g|comprim|tablet|pastil|doz)',
+    r'\d+\s*(?:mg|mcg|ml|g|comprim|tablet|pastil|doz)',
+)]
+_ADMIN_PATTERNS = [re.compile(pattern) for pattern in (
+    r'\d+\s*(?:comprim|tablet|pastil|doz)[^.]*(?:pe\s+zi|zi)',
+    r'\d+\s*(?:comprim|tablet|pastil|doz)[^.]*',
+    r'\d+\s*(?:ori|dat)[^.]*(?:pe\s+zi|zi)',
+    r'pe\s+zi',
+    r'de\s+\d+\s+ori[^.]*',
+)]
+
+_ICD10_RE = re.compile(r'\(ICD-10:\s*([^)]+)\)')
+
+def _split_list(text):
+    return [item.strip() for item in text.split(',') if item.strip()] if text else []
+
+def format_result(result):
+    """Format result to show only the 4 required fields by parsing the generated text"""
+    # Extract generated_text from result
+    generated_text = ""
+    if isinstance(result, dict):
+        generated_text = result.get("generated_text", "")
+    elif isinstance(result, str):
+        generated_text = result
+    
+    if not generated_text:
+        return {
+            "boala": NO_DIAGNOSIS,
+            "tratament_recomandat": [NO_MEDICATION],
+            "investigatii_suplimentare": [NO_INVESTIGATIONS],
+            "recomandari_suplimentare": [NO_RECOMMENDATIONS]
+        }
+    
+    # Parse the text format: "Boala: ... Tratament recomandat: ... Investigații suplimentare: ... Recomandări suplimentare: ..."
+    # Each field is the text after its label up to the next period; the first occurrence of a label wins
+    values = {}
+    for match in _RESULT_LABELS_RE.finditer(generated_text):
+        if match.lastgroup not in values:
+            values[match.lastgroup] = _RESULT_VALUE_RE.match(generated_text, match.end()).group(1).strip()
+            if len(values) == len(_RESULT_FIELDS):
+                break
+    
+    boala = values.get('boala', '')
+    tratament_list = _split_list(values.get('tratament', ''))
+    investigatii_list = _split_list(values.get('investigatii', ''))
+    recomandari_list = _split_list(values.get('recomandari', ''))
+    
+    return {
+        "boala": boala if boala else NO_DIAGNOSIS,
+        "tratament_recomandat": tratament_list if tratament_list else [NO_MEDICATION],
+        "investigatii_suplimentare": investigatii_list if investigatii_list else [NO_INVESTIGATIONS],
+        "recomandari_suplimentare": recomandari_list if recomandari_list else [NO_RECOMMENDATIONS]
+    }
+
+def completed_sections(generated_text):
+    """Sections of the text format whose value format_result can already extract in full
+    (first occurrence of the label, value terminated by a period): subset of RESULT_SECTIONS"""
+    seen = set()
+    completed = set()
+    for match in _RESULT_LABELS_RE.finditer(generated_text):
+        if match.lastgroup not in seen:
+            seen.add(match.lastgroup)
+            if generated_text.find('.', match.end()) != -1:
+                completed.add(match.lastgroup)
+            if len(seen) == len(_RESULT_FIELDS):
+                break
+    return completed
+
+def _text_list(items):
+    return [str(item).strip() for item in items if item is not None and str(item).strip()] if isinstance(items, list) else []
+
+def structured_to_formatted(structured):
+    """Convert the model's structured (JSON) output to the same 4 fields as format_result.
+    Accepts partial objects (e.g. from json_stream on a truncated output): missing fields get the defaults"""
+    structured = structured if isinstance(structured, dict) else {}
+    boala = str(structured.get('boala') or '').strip()
+    
+    tratament_list = []
+    medicamente = structured.get('medicamente_recomandate')
+    for item in medicamente if isinstance(medicamente, list) else []:
+        if isinstance(item, dict):
+            nume = str(item.get('nume') or '').strip()
+            if nume:
+                tratament_list.append({
+                    'nume': nume,
+                    'doza': str(item.get('doza') or '').strip(),
+                    'administrare': str(item.get('administrare') or '').strip()
+                })
+        elif item is not None and str(item).strip():
+            tratament_list.append(str(item).strip())
+    investigatii_list = _text_list(structured.get('investigatii_recomandate'))
+    recomandari_list = _text_list(structured.get('recomandari_suplimentare'))
+    
+    return {
+        "boala": boala if boala else NO_DIAGNOSIS,
+        "tratament_recomandat": tratament_list if tratament_list else [NO_MEDICATION],
+        "investigatii_suplimentare": investigatii_list if investigatii_list else [NO_INVESTIGATIONS],
+        "recomandari_suplimentare": recomandari_list if recomandari_list else [NO_RECOMMENDATIONS]
+    }
+
+def _dedup_key(item):
+    text = item.get('nume', '') if isinstance(item, dict) else str(item)
+    return ' '.join(text.casefold().split())
+
+def merge_formatted_results(results):
+    """Merge the results of several chunks of one long input (see testModel.split_long_input).
+    Diagnoses and list items are kept in order of first appearance, without duplicates
+    (case and spacing ignored); the placeholders are kept only when no chunk found anything"""
+    if len(results) == 1:
+        return results[0]
+    defaults = {
+        "boala": NO_DIAGNOSIS,
+        "tratament_recomandat": NO_MEDICATION,
+        "investigatii_suplimentare": NO_INVESTIGATIONS,
+        "recomandari_suplimentare": NO_RECOMMENDATIONS
+    }
+    merged = {}
+    for field, default in defaults.items():
+        items = []
+        seen = set()
+        for result in results:
+            values = result.get(field)
+            for item in values if isinstance(values, list) else [values]:
+                key = _dedup_key(item) if item else ''
+                if key and key not in seen and item != default:
+                    seen.add(key)
+                    items.append(item)
+        if field == "boala":
+            merged[field] = '; '.join(items) if items else default
+        else:
+            merged[field] = items if items else [default]
+    return merged
+
+def extract_istoric_medical(input_text):
+    """Extract only medical history from input text (e.g., 'fumător de 30 de ani', 'istoric de hipertensiune')"""
+    if not input_text:
+        return ""
+    
+    istoric_parts = []
+    text_lower = input_text.lower()
+    
+    # One scan finds every pattern's matches; each pattern keeps its own non-overlapping matches
+    # and the results are ordered by pattern, then by position
+    matches = [[] for _ in _HISTORY_PATTERNS]
+    last_end = [0] * len(_HISTORY_PATTERNS)
+    for match in _HISTORY_RE.finditer(text_lower):
+        spans = match.regs
+        for i, group in enumerate(_HISTORY_GROUPS):
+            start, end = spans[group]
+            if start != -1 and start >= last_end[i]:
+                matches[i].append((start, end))
+                last_end[i] = end
+    
+    for spans in matches:
+        for start, end in spans:
+            # Get original case from input
+            extracted = input_text[start:end].strip()
+            # Clean up - remove if it's too long (probably not just history)
+            if len(extracted) < 100:  # Reasonable length for history
+                istoric_parts.append(extracted)
+    
+    # If no specific patterns, extract sentences with history keywords (but exclude current symptoms/treatment)
+    if not istoric_parts:
+        sentences = _SENTENCE_SPLIT_RE.split(input_text)
+        
+        for sentence in sentences:
+            sentence_lower = sentence.lower().strip()
+            # Check if sentence contains history keywords
+            has_history = any(keyword in sentence_lower for keyword in _HISTORY_KEYWORDS)
+            # Check if sentence is about current treatment/symptoms (exclude these)
+            has_current = any(keyword in sentence_lower for keyword in _HISTORY_EXCLUDE_KEYWORDS)
+            
+            if has_history and not has_current and len(sentence.strip()) < 150:
+                istoric_parts.append(sentence.strip())
+    
+    # Remove duplicates while preserving order
+    seen = set()
+    unique_parts = []
+    for part in istoric_parts:
+        part_lower = part.lower()
+        if part_lower not in seen:
+            seen.add(part_lower)
+            unique_parts.append(part)
+    
+    # Join all history parts
+    if unique_parts:
+        return ', '.join(unique_parts)
+    
+    return ""
+
+def _medication_details(input_text, input_lower, context_start, context_end):
+    """Dose and administration spans (in input_text) found in input_text[context_start:context_end]"""
+    # Dose ("100-200 mcg", "200 mg", ...) and administration ("pe zi", "de X ori",
+    # "X comprimat pe zi") are searched in the context window of the lowercased input;
+    # lowercasing keeps offsets aligned except for a few characters (e.g. 'İ' -> 'i̇')
+    if len(input_lower) == len(input_text):
+        search_text, offset, pos, endpos = input_lower, 0, context_start, context_end
+    else:
+        context_lower = input_text[context_start:context_end].lower()
+        search_text, offset, pos, endpos = context_lower, context_start, 0, len(context_lower)
+    
+    dose_match = _first_match(_DOSE_PATTERNS, search_text, pos, endpos)
+    admin_match = _first_match(_ADMIN_PATTERNS, search_text, pos, endpos)
+    dose_span = (offset + dose_match.start(), offset + dose_match.end()) if dose_match else None
+    admin_span = (offset + admin_match.start(), offset + admin_match.end()) if admin_match else None
+    return dose_span, admin_span
+
+def find_medication_mentions(input_text, lexicon=None):
+    """Every lexicon medication mentioned in input_text, found in one pass, with nearby dose and
+    administration: [{'start', 'end', 'text', 'nume', 'doza_span', 'administrare_span'}, ...].
+    Dose and administration are looked up after the mention (up to the next medication), then
+    before it (back to the previous one), so they are not borrowed from a neighbouring drug"""
+    if not input_text:
+        return []
+    mentions = (lexicon or medlex.default_lexicon()).find(input_text)
+    input_lower = input_text.lower()
+    for i, mention in enumerate(mentions):
+        next_start = mentions[i + 1]['start'] if i + 1 < len(mentions) else len(input_text)
+        previous_end = mentions[i - 1]['end'] if i > 0 else 0
+        after = _medication_details(input_text, input_lower, mention['start'], min(next_start, mention['end'] + 150))
+        before = _medication_details(input_text, input_lower, max(previous_end, mention['start'] - 100), mention['start'])
+        mention['doza_span'] = after[0] or before[0]
+        mention['administrare_span'] = after[1] or before[1]
+    return mentions
+
+def _span_text(text, span, default):
+    return text[span[0]:span[1]] if span else default
+
+def extract_medicamente_from_input(input_text, formatted_result, include_unlisted=False):
+    """Extract medications from input text using exact words from input.
+    Medications suggested by the model are located in the input (lexicon first, then by name).
+    With include_unlisted, lexicon medications mentioned in the input but missing from the
+    model's list are added after them, marked with 'mentionat_in_input': True. A mention is not
+    a recommendation (allergies, failed past treatments), so the prescription never uses them"""
+    if not input_text:
+        return []
+    
+    # Get medications from formatted result
+    tratament = formatted_result.get('tratament_recomandat', [])
+    if not tratament:
+        return []
+    
+    medications_found = []
+    input_lower = input_text.lower()
+    lexicon = medlex.default_lexicon()
+    mentions = find_medication_mentions(input_text, lexicon)
+    first_mention = {}
+    for mention in mentions:
+        first_mention.setdefault(mention['nume'], mention)
+    listed = set()
+    
+    for item in tratament:
+        if isinstance(item, dict):
+            nume_model = item.get('nume', '').lower()
+            doza_model = item.get('doza', '')
+            administrare_model = item.get('administrare', '')
+        else:
+            # If it's a string, try to extract name
+            nume_model = item.lower() if isinstance(item, str) else ''
+            doza_model = ''
+            administrare_model = ''
+        
+        # Medications known to the lexicon are matched by substance, whatever name the input uses
+        substance = lexicon.lookup(nume_model) if nume_model else None
+        if substance:
+            if substance in listed:
+                # Brand and generic of the same substance (e.g. Ibuprofen, Nurofen 400): prescribe once
+                continue
+            listed.add(substance)
+        if substance in first_mention:
+            mention = first_mention[substance]
+            medications_found.append({
+                'nume': mention['text'],  # Use exact case from input
+                'doza': _span_text(input_text, mention['doza_span'], doza_model),
+                'administrare': _span_text(input_text, mention['administrare_span'],
+                                           administrare_model if administrare_model else 'Conform indicațiilor medicale')
+            })
+            continue
+        
+        # Search for medication name in input text (try partial matches too)
+        if nume_model:
+            # Split medication name into words for better matching
+            nume_words = nume_model.split()
+            # Try to find the medication name in input (exact or partial)
+            pattern = re.escape(nume_model)
+            match = re.search(pattern, input_lower, re.IGNORECASE)
+            
+            # If exact match not found, try to find first significant word
+            if not match and len(nume_words) > 0:
+                first_word = nume_words[0]
+                if len(first_word) > 3:  # Only if word is significant
+                    pattern = r'\b' + re.escape(first_word) + r'\b'
+                    match = re.search(pattern, input_lower, re.IGNORECASE)
+            
+            if match:
+                # Extract medication name with exact case from input
+                med_name_in_input = input_text[match.start():match.end()]
+                # Get wider context around the medication (100 chars before and 150 after)
+                context_start = max(0, match.start() - 100)
+                context_end = min(len(input_text), match.start() + len(nume_model) + 150)
+                dose_span, admin_span = _medication_details(input_text, input_lower, context_start, context_end)
+                # If no dose / administration found in context, use from model (or default)
+                medications_found.append({
+                    'nume': med_name_in_input,  # Use exact case from input
+                    'doza': _span_text(input_text, dose_span, doza_model),
+                    'administrare': _span_text(input_text, admin_span,
+                                               administrare_model if administrare_model else 'Conform indicațiilor medicale')
+                })
+            else:
+                # Medication not found in input, use formatted result but keep original format
+                medications_found.append({
+                    'nume': item.get('nume', item) if isinstance(item, dict) else item,
+                    'doza': doza_model,
+                    'administrare': administrare_model if administrare_model else 'Conform indicațiilor medicale'
+                })
+        else:
+            # Fallback to formatted result
+            medications_found.append({
+                'nume': item.get('nume', item) if isinstance(item, dict) else item,
+                'doza': doza_model,
+                'administrare': administrare_model if administrare_model else 'Conform indicațiilor medicale'
+            })
+    
+    # Medications dictated in the input that the model did not name (not when it recommended none)
+    if include_unlisted and tratament != [NO_MEDICATION]:
+        for substance, mention in first_mention.items():
+            if substance not in listed:
+                medications_found.append({
+                    'nume': mention['text'],
+                    'doza': _span_text(input_text, mention['doza_span'], ''),
+                    'administrare': _span_text(input_text, mention['administrare_span'], 'Conform indicațiilor medicale'),
+                    'mentionat_in_input': True
+                })
+    
+    return medications_found
+
+def generate_nota_clinica(formatted_result, input_text=None, patient_info=None):
+    """Generate Notă Clinică (Clinical Note) from formatted result"""
+    nota = "NOTĂ CLINICĂ\n"
+    nota += "=" * 80 + "\n\n"
+    
+    if patient_info:
+        if patient_info.get('varsta'):
+            nota += f"Vârsta: {patient_info['varsta']} ani\n"
+        if patient_info.get('sex'):
+            nota += f"Sex: {patient_info['sex']}\n"
+        nota += "\n"
+    
+    nota += "DIAGNOSTIC:\n"
+    if formatted_result.get('boala'):
+        boala = formatted_result['boala']
+        # Try to extract ICD-10 code if present
+        icd_match = None
+        if isinstance(boala, str):
+            icd_match = _ICD10_RE.search(boala)
+        if icd_match:
+            nota += f"{boala}\n"
+        else:
+            nota += f"{boala}\n"
+    else:
+        nota += "Nu a fost identificat\n"
+    nota += "\n"
+    
+    nota += "TRATAMENT RECOMANDAT:\n"
+    tratament = formatted_result.get('tratament_recomandat', [])
+    if tratament and len(tratament) > 0:
+        for item in tratament:
+            if isinstance(item, dict):
+                nume = item.get('nume', '')
+                doza = item.get('doza', '')
+                administrare = item.get('administrare', '')
+                nota += f"  • {nume}"
+                if doza:
+                    nota += f" {doza}"
+                if administrare:
+                    nota += f", {administrare}"
+                nota += "\n"
+            else:
+                nota += f"  • {item}\n"
+    else:
+        nota += "  Nu sunt recomandate medicamente\n"
+    nota += "\n"
+    
+    nota += "INVESTIGAȚII RECOMANDATE:\n"
+    investigatii = formatted_result.get('investigatii_suplimentare', [])
+    if investigatii and len(investigatii) > 0:
+        for item in investigatii:
+            nota += f"  • {item}\n"
+    else:
+        nota += "  Nu sunt recomandate investigații\n"
+    nota += "\n"
+    
+    nota += "RECOMANDĂRI:\n"
+    recomandari = formatted_result.get('recomandari_suplimentare', [])
+    if recomandari and len(recomandari) > 0:
+        for item in recomandari:
+            nota += f"  • {item}\n"
+    else:
+        nota += "  Nu sunt recomandări suplimentare\n"
+    
+    return nota
+
+def generate_reteta_mediala(formatted_result, input_text=None, patient_info=None):
+    """Generate Rețetă Medicală (Medical Prescription) from formatted result using exact words from input"""
+    reteta = "REȚETĂ MEDICALĂ\n"
+    reteta += "=" * 80 + "\n\n"
+    
+    reteta += f"Data: {datetime.now().strftime('%d.%m.%Y')}\n"
+    
+    if patient_info:
+        if patient_info.get('nume'):
+            reteta += f"Pacient: {patient_info['nume']}\n"
+    else:
+        reteta += "Pacient: [Nume pacient]\n"
+    reteta += "\n"
+    
+    reteta += "MEDICAMENTE:\n"
+    # Extract medications using exact words from input
+    medications = extract_medicamente_from_input(input_text, formatted_result) if input_text else []
+    
+    if medications and len(medications) > 0:
+        for idx, med in enumerate(medications, 1):
+            nume = med.get('nume', '')
+            doza = med.get('doza', '')
+            administrare = med.get('administrare', '')
+            
+            reteta += f"{idx}. {nume}"
+            if doza:
+                reteta += f" {doza}"
+            reteta += "\n"
+            if administrare:
+                reteta += f"   Administrare: {administrare}\n"
+    else:
+        # Fallback to formatted result if extraction failed
+        tratament = formatted_result.get('tratament_recomandat', [])
+        if tratament and len(tratament) > 0:
+            for idx, item in enumerate(tratament, 1):
+                if isinstance(item, dict):
+                    nume = item.get('nume', '')
+                    doza = item.get('doza', '')
+                    administrare = item.get('administrare', '')
+                    reteta += f"{idx}. {nume}"
+                    if doza:
+                        reteta += f" {doza}"
+                    reteta += "\n"
+                    if administrare:
+                        reteta += f"   Administrare: {administrare}\n"
+                else:
+                    reteta += f"{idx}. {item}\n"
+                    reteta += f"   Administrare: Conform indicațiilor medicale\n"
+        else:
+            reteta += "Nu sunt recomandate medicamente\n"
+    reteta += "\n"
+    
+    reteta += "Diagnostic: "
+    if formatted_result.get('boala'):
+        boala = formatted_result['boala']
+        # Extract ICD-10 if present
+        icd_match = _ICD10_RE.search(boala)
+        if icd_match:
+            reteta += f"{boala}\n"
+        else:
+            reteta += f"{boala}\n"
+    else:
+        reteta += "Nu a fost identificat\n"
+    
+    return reteta
@@ -0,0 +1,147 @@
+"""
+Subsistem de job-uri asincrone pentru procesări lungi (audio, batch-uri).
+
+Un job este acceptat imediat (se returnează id-ul), rulat pe un pool limitat de workeri,
+iar starea și rezultatul sunt persistate în SQLite ca să poată fi interogate ulterior.
+Când pool-ul și coada de așteptare sunt pline, submit() ridică QueueFullError.
+"""
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Pool-ul de workeri și coada de așteptare sunt saturate."""
+
+
+class JobManager:
+    def __init__(self, database, max_workers=2, max_pending=16):
+        """
+        - database: db.Database partajat cu restul serverului (pool limitat de conexiuni, WAL)
+        - max_workers: câte job-uri rulează simultan
+        - max_pending: câte job-uri pot aștepta în coadă înainte de a refuza altele noi
+        """
+        self.db = database
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'done': 0, 'failed': 0}
+        self._init_db()
+
+    def _init_db(self):
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        ''')
+
+    def recover_interrupted(self):
+        """Marchează ca eșuate job-urile rămase neterminate de la o rulare anterioară (apelat la pornire)."""
+        cursor = self.db.execute('''
+            UPDATE jobs SET status = ?, error = ?, finished_at = ?
+            WHERE status IN (?, ?)
+        ''', (STATUS_FAILED, 'Job întrerupt de repornirea serverului', time.time(), STATUS_QUEUED, STATUS_RUNNING))
+        return cursor.rowcount
+
+    def submit(self, user_id, kind, fn, *args, **kwargs):
+        """
+        Programează fn(*args, **kwargs) și returnează imediat id-ul job-ului.
+        Rezultatul lui fn trebuie să fie serializabil JSON.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFullError('Prea multe procesări în curs. Încercați din nou mai târziu.')
+
+        job_id = uuid.uuid4().hex
+        inserted = False
+        try:
+            self.db.execute('''
+                INSERT INTO jobs (id, user_id, kind, status, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (job_id, user_id, kind, STATUS_QUEUED, time.time()))
+            inserted = True
+            self._executor.submit(self._run, job_id, fn, args, kwargs)
+        except BaseException as e:
+            # Job-ul nu a ajuns în executor: _run nu va elibera slotul
+            self._slots.release()
+            if inserted:
+                try:
+                    self._update(job_id, status=STATUS_FAILED, error=str(e), finished_at=time.time())
+                except Exception:
+                    pass
+            raise
+
+        with self._lock:
+            self._stats['submitted'] += 1
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        try:
+            self._update(job_id, status=STATUS_RUNNING, started_at=time.time())
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._update(job_id, status=STATUS_FAILED, error=str(e), finished_at=time.time())
+                with self._lock:
+                    self._stats['failed'] += 1
+                return
+            self._update(job_id, status=STATUS_DONE, result=json.dumps(result, ensure_ascii=False),
+                         finished_at=time.time())
+            with self._lock:
+                self._stats['done'] += 1
+        finally:
+            self._slots.release()
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        self.db.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id, user_id=None):
+        """Returnează job-ul ca dict (cu rezultatul decodat) sau None; user_id restricționează accesul."""
+        row = self.db.query_one('''
+            SELECT id, user_id, kind, status, result, error, created_at, started_at, finished_at
+            FROM jobs WHERE id = ?
+        ''', (job_id,))
+        if not row or (user_id is not None and row[1] != user_id):
+            return None
+        return {
+            'id': row[0],
+            'kind': row[2],
+            'status': row[3],
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+            'created_at': row[6],
+            'started_at': row[7],
+            'finished_at': row[8],
+        }
+
+    def metrics(self):
+        """Contoare pentru monitorizare."""
+        counts = dict(self.db.query_all('''
+            SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status
+        ''', (STATUS_QUEUED, STATUS_RUNNING)))
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = counts.get(STATUS_QUEUED, 0)
+        stats['running'] = counts.get(STATUS_RUNNING, 0)
+        stats['max_workers'] = self.max_workers
+        stats['max_pending'] = self.max_pending
+        return stats
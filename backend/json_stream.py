@@ -0,0 +1,185 @@
+"""
+Parser JSON incremental și tolerant pentru output-ul structurat al modelului.
+
+Textul decodat este consumat pe bucăți, pe măsură ce vine din stream: feed() întoarce câmpurile de
+nivel superior (ex. "boala", "medicamente_recomandate") imediat ce sunt complete, iar finish()
+întoarce obiectul reconstruit până în acel punct. Greșelile obișnuite ale modelului sunt tolerate
+(text înainte de acoladă, ghilimele simple, virgule finale sau lipsă, valori fără ghilimele), iar
+un output tăiat păstrează ce a fost generat complet: câmpurile complete, elementele complete ale unei
+liste și textul deja generat al ultimului element dintr-o listă de texte. O valoare neterminată a
+unei chei (ex. "nume": "Salb") și un obiect neterminat (ex. un medicament tăiat) sunt eliminate, ca
+un fragment să nu ajungă în rezultat drept valoare completă.
+"""
+import json
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '/': '/', '\\': '\\', '"': '"', "'": "'"}
+_BARE_END = ',:]}"\n'
+_BARE_VALUES = {'null': None, 'true': True, 'false': False}
+
+
+def _bare_value(text):
+    """Valoarea unui literal fără ghilimele: null/true/false, număr sau, altfel, textul ca atare."""
+    if text in _BARE_VALUES:
+        return _BARE_VALUES[text]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+class _Frame:
+    """Un obiect sau o listă deschisă; pentru obiecte, cheia care își așteaptă valoarea."""
+    __slots__ = ('container', 'key')
+
+    def __init__(self, container):
+        self.container = container
+        self.key = None
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.root = None
+        self.done = False
+        self._stack = []
+        self._string = None   # caracterele string-ului curent, sau None
+        self._quote = None
+        self._escape = None   # None, '' după '\\', sau cifrele unei secvențe \\uXXXX
+        self._bare = None     # caracterele unui literal fără ghilimele, sau None
+        self._completed = []
+
+    def feed(self, chunk):
+        """Consumă un fragment de text; returnează [(cheie, valoare)] pentru câmpurile de nivel superior terminate."""
+        for c in chunk:
+            if self.done:
+                break
+            self._consume(c)
+        completed, self._completed = self._completed, []
+        return completed
+
+    def finish(self):
+        """Încheie parsarea (output complet sau tăiat) și returnează obiectul rădăcină, sau None dacă nu a început."""
+        # un string sau literal neterminat este păstrat doar ca element al unei liste de texte
+        partial = None
+        if self._bare is not None:
+            partial, self._bare = ''.join(self._bare).strip(), None
+            partial = _bare_value(partial) if partial else None
+        elif self._string is not None and not self.done:
+            partial, self._string = ''.join(self._string) or None, None
+        if partial is not None and isinstance(self._stack[-1].container, list):
+            self._value(partial)
+        # listele rămase deschise se închid; obiectele neterminate și listele goale din liste sunt eliminate
+        while self._stack:
+            frame = self._stack.pop()
+            if not self._stack:
+                break
+            parent = self._stack[-1]
+            incomplete = isinstance(frame.container, dict)
+            if isinstance(parent.container, list):
+                if (incomplete or not frame.container) and parent.container and parent.container[-1] is frame.container:
+                    parent.container.pop()
+            elif incomplete and parent.key is not None and parent.container.get(parent.key) is frame.container:
+                del parent.container[parent.key]
+        self.done = True
+        return self.root
+
+    def _consume(self, c):
+        if self._string is not None:
+            self._consume_string(c)
+            return
+        if self._bare is not None:
+            if c not in _BARE_END:
+                self._bare.append(c)
+                return
+            self._end_bare()
+        if not self._stack:
+            # textul dinaintea rădăcinii este ignorat
+            if c in '{[':
+                self._open({} if c == '{' else [])
+            return
+        if c.isspace() or c in ',:':
+            return
+        if c in '{[':
+            self._open({} if c == '{' else [])
+        elif c in '}]':
+            self._close()
+        elif c in '"\'':
+            self._string, self._quote = [], c
+        else:
+            self._bare = [c]
+
+    def _consume_string(self, c):
+        if self._escape is not None:
+            if self._escape:
+                self._escape += c
+                if len(self._escape) == 5:
+                    try:
+                        self._string.append(chr(int(self._escape[1:], 16)))
+                    except ValueError:
+                        self._string.append(self._escape)
+                    self._escape = None
+            elif c == 'u':
+                self._escape = 'u'
+            else:
+                self._string.append(_ESCAPES.get(c, c))
+                self._escape = None
+        elif c == '\\':
+            self._escape = ''
+        elif c == self._quote:
+            text = ''.join(self._string)
+            self._string = None
+            self._token(text)
+        else:
+            self._string.append(c)
+
+    def _end_bare(self):
+        text = ''.join(self._bare).strip()
+        self._bare = None
+        self._token(_bare_value(text))
+
+    def _token(self, value):
+        """Un string sau literal: într-un obiect alternează între cheie și valoare."""
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict) and frame.key is None:
+            frame.key = str(value)
+        else:
+            self._value(value)
+
+    def _value(self, value):
+        frame = self._stack[-1]
+        if isinstance(frame.container, list):
+            frame.container.append(value)
+        elif frame.key is not None:
+            frame.container[frame.key] = value
+            if len(self._stack) == 1:
+                self._completed.append((frame.key, value))
+            frame.key = None
+
+    def _open(self, container):
+        if not self._stack:
+            self.root = container
+        else:
+            frame = self._stack[-1]
+            if isinstance(frame.container, list):
+                frame.container.append(container)
+            elif frame.key is not None:
+                frame.container[frame.key] = container
+            # cheia rămâne pe cadrul părinte până la închidere, pentru raportarea câmpului complet
+        self._stack.append(_Frame(container))
+
+    def _close(self):
+        frame = self._stack.pop()
+        if not self._stack:
+            self.done = True
+            return
+        parent = self._stack[-1]
+        if isinstance(parent.container, dict) and parent.key is not None:
+            if len(self._stack) == 1:
+                self._completed.append((parent.key, frame.container))
+            parent.key = None
+
+
+def parse(text):
+    """Parsează un output complet sau tăiat; returnează obiectul rădăcină sau None."""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.finish()
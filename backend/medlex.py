@@ -0,0 +1,156 @@
+"""
+Lexicon de medicamente compilat într-un automat Aho-Corasick.
+
+Lexiconul (data/lexicon/medicamente.txt) are câte o substanță pe linie: denumirea comună,
+urmată de denumiri comerciale și variante de scriere separate prin '|'. Toate variantele sunt
+compilate într-un singur automat, astfel încât o singură trecere prin text găsește toate
+mențiunile de medicamente, indiferent de câte nume are lexiconul. Căutarea ignoră majusculele
+și diacriticele și acceptă doar potriviri de cuvinte întregi.
+"""
+import os
+import threading
+from collections import deque
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(BASE_DIR), 'data', 'lexicon', 'medicamente.txt')
+
+# Diacriticele românești (inclusiv variantele cu sedilă) -> litera de bază, caracter cu caracter,
+# ca pozițiile din textul normalizat să coincidă cu cele din textul original
+_FOLD = str.maketrans('ăâîșşțţ', 'aaiisst')
+
+
+def normalize(text):
+    """Litere mici, fără diacritice, cu aceeași lungime ca textul original."""
+    folded = text.lower()
+    if len(folded) != len(text):
+        # câteva caractere (ex. 'İ') se extind la lower(); sunt lăsate neschimbate
+        folded = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+    return folded.translate(_FOLD)
+
+
+def _is_word_char(c):
+    return c.isalnum() or c == '_'
+
+
+class MedicationLexicon:
+    def __init__(self, entries):
+        """
+        entries: listă de (denumire comună, [variante]); denumirea comună este și ea o variantă.
+        La variante duplicate câștigă prima intrare.
+        """
+        self.names = []
+        # Automatul: tranzițiile, legăturile de eșec și, per stare, (lungime, indice denumire)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        seen = set()
+        for name, variants in entries:
+            index = len(self.names)
+            self.names.append(name)
+            for variant in [name] + list(variants):
+                key = ' '.join(normalize(variant).split())
+                if key and key not in seen:
+                    seen.add(key)
+                    self._add(key, index)
+        self._build()
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_LEXICON_PATH):
+        entries = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                variants = [part.strip() for part in line.split('|') if part.strip()]
+                entries.append((variants[0], variants[1:]))
+        return cls(entries)
+
+    def _add(self, key, index):
+        state = 0
+        for c in key:
+            nxt = self._goto[state].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(key), index))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(c, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """
+        Toate mențiunile de medicamente din text, într-o singură trecere, ca listă de dict-uri
+        {'start', 'end', 'text', 'nume'} (nume = denumirea comună), ordonate după poziție.
+        Când mențiunile se suprapun, se păstrează cea mai lungă (ex. "Aspirin Cardio", nu "Aspirin").
+        Spațiile multiple din text se potrivesc cu un singur spațiu din lexicon.
+        """
+        if not text:
+            return []
+        folded = normalize(text)
+        candidates = []
+        state = 0
+        previous_space = False
+        # poziția din text pentru fiecare caracter consumat de automat (spațiile repetate sunt sărite)
+        positions = []
+        for i, c in enumerate(folded):
+            if c.isspace():
+                if previous_space:
+                    continue
+                c = ' '
+                previous_space = True
+            else:
+                previous_space = False
+            positions.append(i)
+            while state and c not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(c, 0)
+            for length, index in self._out[state]:
+                start = positions[len(positions) - length]
+                end = i + 1
+                if (start == 0 or not _is_word_char(folded[start - 1])) and \
+                        (end == len(folded) or not _is_word_char(folded[end])):
+                    candidates.append((start, -end, index))
+
+        mentions = []
+        last_end = 0
+        for start, neg_end, index in sorted(candidates):
+            if start >= last_end:
+                mentions.append({'start': start, 'end': -neg_end, 'text': text[start:-neg_end], 'nume': self.names[index]})
+                last_end = -neg_end
+        return mentions
+
+    def lookup(self, name):
+        """Denumirea comună pentru un nume de medicament (ex. sugerat de model), sau None."""
+        mentions = self.find(name)
+        return mentions[0]['nume'] if mentions else None
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_lexicon():
+    """Lexiconul din DEFAULT_LEXICON_PATH, încărcat o singură dată; gol dacă fișierul lipsește."""
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            if os.path.exists(DEFAULT_LEXICON_PATH):
+                _DEFAULT = MedicationLexicon.from_file(DEFAULT_LEXICON_PATH)
+            else:
+                _DEFAULT = MedicationLexicon([])
+        return _DEFAULT
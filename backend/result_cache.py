@@ -0,0 +1,139 @@
+"""
+Cache de rezultate adresat după conținut pentru intrări clinice identice.
+
+Cheia este un hash peste textul normalizat, versiunea modelului, flag-ul structured și
+parametrii de generare. Intrările stau în memorie cu evacuare LRU și, opțional, sunt
+persistate într-o bază SQLite, astfel încât să supraviețuiască repornirii serverului.
+Tabela persistentă este și ea limitată: peste max_entries rânduri se șterg cele mai vechi, iar
+cu ttl_seconds rezultatele expiră (textele clinice nu sunt păstrate pe disc la nesfârșit).
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Normalizare Unicode (NFC) și spații colapsate, ca retrimiterile identice să aibă aceeași cheie."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+class ResultCache:
+    def __init__(self, max_entries=512, db_path=None, ttl_seconds=None):
+        """
+        - max_entries: câte rezultate se păstrează în memorie (LRU) și, cu persistență, în SQLite
+        - db_path: fișier SQLite pentru persistență; None dezactivează persistența
+        - ttl_seconds: după cât timp expiră un rezultat (None = doar limita max_entries)
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stats = {"hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "stores": 0}
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS result_cache_created_at ON result_cache (created_at)')
+            self._conn.commit()
+            with self._lock:
+                self._prune()
+
+    @staticmethod
+    def make_key(text, model_version, structured=False, params=None):
+        """Cheia de cache pentru un text și configurația de generare care l-a produs."""
+        payload = json.dumps({
+            "text": normalize_text(text),
+            "model": model_version,
+            "structured": bool(structured),
+            "params": params or {},
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returnează valoarea din cache sau None (miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+
+            if self._conn is not None:
+                row = self._conn.execute('SELECT value, created_at FROM result_cache WHERE key = ?', (key,)).fetchone()
+                if row and not self._expired(row[1]):
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self._stats["hits"] += 1
+                    self._stats["persistent_hits"] += 1
+                    return value
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        """Salvează un rezultat (trebuie să fie serializabil JSON)."""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+            self._stats["stores"] += 1
+            if self._conn is not None:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO result_cache (key, value, created_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value, ensure_ascii=False), created_at))
+                self._prune()
+
+    def clear(self):
+        """Golește cache-ul din memorie și de pe disc."""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM result_cache')
+                self._conn.commit()
+
+    def metrics(self):
+        """Contoare hit/miss/evacuare pentru monitorizare."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["persistent"] = self._conn is not None
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+    def _expired(self, created_at):
+        return self.ttl_seconds is not None and created_at < time.time() - self.ttl_seconds
+
+    def _prune(self):
+        """Șterge din SQLite rândurile expirate și pe cele mai vechi peste max_entries (apelat cu lock-ul luat)."""
+        if self.ttl_seconds is not None:
+            self._conn.execute('DELETE FROM result_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        self._conn.execute('''
+            DELETE FROM result_cache WHERE key IN (
+                SELECT key FROM result_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+        self._conn.commit()
+
+    def _remember(self, key, value, created_at):
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
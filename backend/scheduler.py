@@ -0,0 +1,141 @@
+"""
+Scheduler de micro-batching pentru inferența T5.
+
+Request-urile concurente sunt adunate într-o fereastră scurtă (window_ms), până la
+max_batch_size texte, și rulate ca un singur batch cu padding prin testModel.generate_texts.
+Fiecare apelant primește un Future cu propriul text generat.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import testModel
+
+
+class BatchScheduler:
+    def __init__(self, model_dir=testModel.MODEL_DIR, window_ms=10, max_batch_size=8, runner=None, load_options=None,
+                 concurrency=1):
+        """
+        - window_ms: cât așteaptă primul request din batch după alte request-uri
+        - max_batch_size: numărul maxim de texte rulate într-un singur model.generate
+        - runner: funcție (inputs, max_out_len, profile, sections) -> list[str]; implicit modelul din registry
+        - load_options: opțiunile de încărcare ale modelului din registry (ex. quantize)
+        - concurrency: câte batch-uri pot rula simultan (ex. numărul de workeri ai unui InferencePool)
+        """
+        self.model_dir = model_dir
+        self.load_options = load_options or {}
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.runner = runner or self._run_local
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self.concurrency = concurrency
+        self._threads = []
+        self._batch_sizes = {}
+        self._stats = {
+            "requests": 0,
+            "completed": 0,
+            "batches": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+            "total_wait_ms": 0.0,
+            "total_batch_ms": 0.0,
+        }
+
+    def submit(self, text, max_out_len=testModel.MAX_OUTPUT_LEN, profile=testModel.DEFAULT_TEXT_PROFILE, sections=None):
+        """
+        Pune un text (fără prefix) în coadă; returnează un Future cu textul generat.
+        sections: oprire timpurie după secțiunile date (vezi testModel.generate_texts)
+        """
+        sections = tuple(sorted(sections)) if sections else None
+        future = Future()
+        with self._cond:
+            if not self._threads:
+                for i in range(self.concurrency):
+                    thread = threading.Thread(target=self._loop, name=f"batch-scheduler-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            self._queue.append(((max_out_len, profile, sections), testModel.build_input(text), future, time.time()))
+            self._stats["requests"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            self._cond.notify()
+        return future
+
+    def generate(self, text, max_out_len=testModel.MAX_OUTPUT_LEN, profile=testModel.DEFAULT_TEXT_PROFILE, sections=None,
+                 timeout=None):
+        """Varianta blocantă a submit()."""
+        return self.submit(text, max_out_len=max_out_len, profile=profile, sections=sections).result(timeout=timeout)
+
+    def metrics(self):
+        """Metrici pentru monitorizare: adâncimea cozii și distribuția dimensiunii batch-urilor."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._queue)
+            stats["batch_sizes"] = dict(sorted(self._batch_sizes.items()))
+        processed = stats["completed"]
+        batches = stats["batches"]
+        stats["avg_batch_size"] = processed / batches if batches else 0.0
+        stats["avg_wait_ms"] = stats.pop("total_wait_ms") / processed if processed else 0.0
+        stats["avg_batch_ms"] = stats.pop("total_batch_ms") / batches if batches else 0.0
+        stats["window_ms"] = self.window * 1000.0
+        stats["max_batch_size"] = self.max_batch_size
+        return stats
+
+    def _run_local(self, inputs, max_out_len, profile, sections=None):
+        tokenizer, model, device = testModel.get_model(model_dir=self.model_dir, **self.load_options)
+        return testModel.generate_texts(tokenizer, model, device, inputs, max_out_len, profile=profile, sections=sections)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                while not self._queue:
+                    self._cond.wait()
+                # Așteaptă alte request-uri până expiră fereastra primului sau se umple batch-ul
+                if len(self._queue) >= self.max_batch_size:
+                    break
+                remaining = self._queue[0][3] + self.window - time.time()
+                if remaining <= 0:
+                    break
+                # Cu concurrency > 1, alt thread poate goli coada (sau schimba primul request) cât timp
+                # acesta așteaptă; după fiecare wait() se reiau verificarea și termenul de la capul cozii
+                self._cond.wait(remaining)
+            # Se grupează doar request-urile cu aceiași parametri de generare
+            key = self._queue[0][0]
+            batch = []
+            rest = deque()
+            while self._queue:
+                item = self._queue.popleft()
+                if item[0] == key and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    rest.append(item)
+            self._queue = rest
+            return key, batch
+
+    def _loop(self):
+        while True:
+            (max_out_len, profile, sections), batch = self._next_batch()
+            started = time.time()
+            try:
+                outputs = self.runner([item[1] for item in batch], max_out_len, profile, sections)
+                error = None
+            except Exception as e:
+                outputs = None
+                error = e
+            finished = time.time()
+
+            with self._cond:
+                self._stats["batches"] += 1
+                self._stats["completed"] += len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._stats["total_batch_ms"] += (finished - started) * 1000.0
+                self._stats["total_wait_ms"] += sum((started - item[3]) * 1000.0 for item in batch)
+                if error is not None:
+                    self._stats["errors"] += 1
+
+            for i, (_, _, future, _) in enumerate(batch):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(outputs[i])
@@ -0,0 +1,86 @@
+"""
+Oprirea timpurie a generării text când secțiunile cerute sunt complete.
+
+format_result păstrează doar patru secțiuni (Boala, Tratament recomandat, Investigații
+suplimentare, Recomandări suplimentare), fiecare până la primul punct. SectionStoppingCriteria
+urmărește textul decodat al fiecărei secvențe (rază) și oprește generarea când toate secțiunile
+cerute pot fi deja extrase, în loc să continue până la </s> sau max_length.
+"""
+import threading
+import weakref
+
+import torch
+import transformers
+from transformers import StoppingCriteria
+
+from documents import RESULT_SECTIONS, completed_sections
+
+# Din transformers 4.39, criteriile de oprire întorc un tensor bool per secvență; înainte, un bool
+_PER_SEQUENCE = tuple(int(part) for part in transformers.__version__.split(".")[:2] if part.isdigit()) >= (4, 39)
+
+_PIECES_CACHE = weakref.WeakKeyDictionary()
+_PIECES_LOCK = threading.Lock()
+
+
+def validate_sections(sections):
+    """Secțiunile cerute ca frozenset; ValueError pentru nume necunoscute."""
+    sections = frozenset(sections)
+    unknown = sections - set(RESULT_SECTIONS)
+    if unknown or not sections:
+        raise ValueError(f"Secțiuni necunoscute: {', '.join(sorted(unknown)) or '(niciuna)'} "
+                         f"(disponibile: {', '.join(RESULT_SECTIONS)})")
+    return sections
+
+
+def _token_pieces(tokenizer):
+    """Textul fiecărui token ('▁' devine spațiu; tokenurile speciale nu adaugă text), cache-uit per tokenizer."""
+    with _PIECES_LOCK:
+        pieces = _PIECES_CACHE.get(tokenizer)
+        if pieces is None:
+            special = set(tokenizer.all_special_ids)
+            pieces = ['' if i in special else piece.replace('▁', ' ')
+                      for i, piece in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer)))))]
+            _PIECES_CACHE[tokenizer] = pieces
+        return pieces
+
+
+class SectionStoppingCriteria(StoppingCriteria):
+    """
+    Criteriu de oprire pentru un singur apel model.generate. O secvență este gata când toate
+    secțiunile cerute sunt complete (sau când s-a terminat deja cu </s>); generarea se oprește
+    când toate secvențele sunt gata. stopped_at este lungimea la care criteriul a oprit generarea.
+    """
+
+    def __init__(self, tokenizer, sections=RESULT_SECTIONS):
+        self.sections = validate_sections(sections)
+        self.pieces = _token_pieces(tokenizer)
+        self.finished_ids = {tokenizer.eos_token_id, tokenizer.pad_token_id}
+        self.stopped_at = None
+        self._texts = {}  # textul fiecărei secvențe de la pasul anterior, după prefix
+
+    def _text(self, ids):
+        previous = self._texts.get(tuple(ids[:-1]))
+        if previous is None:
+            return ''.join(self.pieces[i] for i in ids if i < len(self.pieces))
+        return previous + (self.pieces[ids[-1]] if ids[-1] < len(self.pieces) else '')
+
+    def __call__(self, input_ids, scores, **kwargs):
+        texts = {}
+        done = []
+        stopped_by_sections = False
+        for ids in input_ids.tolist():
+            text = self._text(ids)
+            texts[tuple(ids)] = text
+            if len(ids) > 1 and ids[-1] in self.finished_ids:
+                done.append(True)
+            elif self.sections <= completed_sections(text):
+                done.append(True)
+                stopped_by_sections = True
+            else:
+                done.append(False)
+        self._texts = texts
+        if all(done) and stopped_by_sections and self.stopped_at is None:
+            self.stopped_at = input_ids.shape[-1]
+        if _PER_SEQUENCE:
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+        return all(done)
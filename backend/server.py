@@ -1,15 +1,16 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, Request, current_app, render_template, request, g, jsonify, session, redirect, url_for, send_file, Response, stream_with_context
 import os
 import sys
 from datetime import datetime
 import json
 import sqlite3
 import hashlib
-import uuid
 import speech_recognition as sr
 from werkzeug.utils import secure_filename
-import tempfile
-from pydub import AudioSegment
+import io
+import multiprocessing
+import threading
+import time
 
 # Add backend directory to path for imports
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,70 +18,179 @@ PARENT_DIR = os.path.dirname(BASE_DIR)
 sys.path.insert(0, BASE_DIR)
 
 import testModel
+import asr
+from scheduler import BatchScheduler
+from result_cache import ResultCache
+from jobs import JobManager, QueueFullError
+import db
+from worker_pool import InferencePool
+import bulk
+from section_stopping import validate_sections
+from json_stream import IncrementalJSONParser
+try:
+    from flask_sock import Sock  # Optional: live dictation over WebSocket
+except ImportError:
+    Sock = None
+from documents import (RESULT_SECTIONS, format_result, merge_formatted_results, structured_to_formatted,
+                       generate_nota_clinica, generate_reteta_mediala)
+
+class InMemoryUploadRequest(Request):
+    """Keep multipart uploads in memory (bounded by MAX_CONTENT_LENGTH) instead of spooling them to temp files.
+    /api/batch is the exception: its body is read line by line, so it has its own limit (BATCH_MAX_CONTENT_LENGTH)
+    and an uploaded JSONL file is spooled to a temp file instead of being held in memory"""
+    def _is_batch(self):
+        return self.endpoint == 'process_batch'
+    
+    @property
+    def max_content_length(self):
+        if self._is_batch():
+            return current_app.config['BATCH_MAX_CONTENT_LENGTH']
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self._is_batch():
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return io.BytesIO()
 
 app = Flask(__name__, 
             template_folder=os.path.join(PARENT_DIR, 'frontend', 'templates'),
             static_folder=os.path.join(PARENT_DIR, 'frontend', 'static'))
 
+app.request_class = InMemoryUploadRequest
+
 app.config['SECRET_KEY'] = 'medly-secret-key-change-in-production-2024'
 app.config['DATABASE'] = os.path.join(PARENT_DIR, 'data', 'medical_records.db')
-app.config['UPLOAD_FOLDER'] = os.path.join(PARENT_DIR, 'data', 'uploads')
+app.config['DATABASE_POOL_SIZE'] = 8  # SQLite connections shared by all request threads
+app.config['DATABASE_BUSY_TIMEOUT_MS'] = 5000  # How long a write waits for the database lock before failing
 app.config['RESULTS_FOLDER'] = os.path.join(PARENT_DIR, 'data', 'results')
 app.config['MODEL_DIR'] = os.path.join(PARENT_DIR, 'data', 'models', 'finetuned_t5_model')
+app.config['MODEL_WARMUP'] = True  # Load the model at startup instead of on the first request
+app.config['MODEL_IDLE_EVICT_S'] = None  # Unload models unused for this long; reloaded on the next request (None = keep)
+app.config['MODEL_QUANTIZE'] = False  # int8 dynamic quantization for CPU-only nodes (cached next to MODEL_DIR)
+app.config['MODEL_MMAP'] = False  # Memory-map model.safetensors so worker processes share one copy of the weights
+app.config['MODEL_BACKEND'] = None  # None (PyTorch) or 'onnx' (exported to ONNX Runtime, cached next to MODEL_DIR)
+app.config['STOP_AFTER_SECTIONS'] = True  # End text generation once the 4 sections kept by format_result are complete
+app.config['LONG_INPUT_CHUNKING'] = True  # Inputs over the encoder limit are split into overlapping chunks instead of truncated
+app.config['BATCH_WINDOW_MS'] = 10  # How long a request waits for others to share its batch
+app.config['BATCH_MAX_SIZE'] = 8  # Max texts per model.generate call
+app.config['RESULT_CACHE_SIZE'] = 512  # In-memory LRU entries
+app.config['RESULT_CACHE_DB'] = None  # SQLite file to keep results across restarts (None = memory only)
+app.config['RESULT_CACHE_TTL_S'] = None  # Cached results expire after this long (None = only the size bound)
+app.config['INFERENCE_WORKERS'] = 0  # Model replica processes; 0 = run inference in the server process
+app.config['INFERENCE_THREADS_PER_WORKER'] = None  # torch intra-op threads per replica (None = cores / workers)
+app.config['INFERENCE_TASK_TIMEOUT_S'] = 300  # A batch sent to a replica fails after this long (None = wait forever)
+app.config['ASR_BACKEND'] = 'vosk'  # Speech recognition: 'vosk' (local, offline), 'google' or 'stub'
+app.config['ASR_MODEL_DIR'] = os.path.join(PARENT_DIR, 'data', 'models', 'vosk-model-ro')
+app.config['ASR_FALLBACK'] = ['google']  # Tried in order when the configured backend is unavailable
+app.config['ASR_SEGMENT_MAX_MS'] = 30000  # Longer recordings are split at pauses into segments of at most this length
+app.config['ASR_WORKERS'] = 4  # Segments of one recording transcribed in parallel
+app.config['DICTATION_END_SILENCE_MS'] = 800  # Pause that ends an utterance in live dictation
+app.config['JOB_WORKERS'] = 2  # Background jobs (audio, batches) running at the same time
+app.config['JOB_MAX_PENDING'] = 16  # Jobs allowed to wait before new ones are rejected
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['BATCH_MAX_CONTENT_LENGTH'] = None  # /api/batch streams its JSONL input line by line (None = no size limit)
 app.config['ALLOWED_EXTENSIONS'] = {'wav', 'mp3', 'm4a', 'flac', 'ogg', 'webm'}
 
+# Inference worker processes (spawned by worker_pool) re-import this module and
+# must not repeat the server's startup side effects
+IS_INFERENCE_WORKER = multiprocessing.parent_process() is not None
+
 # Create necessary directories
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
 
+# Bounded connection pool (WAL, busy timeout, cached statements) instead of one connection per request
+database = db.Database(app.config['DATABASE'], pool_size=app.config['DATABASE_POOL_SIZE'],
+                       busy_timeout_ms=app.config['DATABASE_BUSY_TIMEOUT_MS'])
+
 # Initialize database
 def init_db():
     """Initialize SQLite database for users"""
-    conn = sqlite3.connect(app.config['DATABASE'])
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            full_name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create default users if they don't exist
-    c.execute('SELECT COUNT(*) FROM users')
-    if c.fetchone()[0] == 0:
-        # Admin user
-        admin_password = hashlib.sha256('admin123'.encode()).hexdigest()
-        c.execute('''
-            INSERT INTO users (username, password_hash, full_name)
-            VALUES (?, ?, ?)
-        ''', ('admin', admin_password, 'Administrator'))
+    with database.transaction() as conn:
+        # Users table
+        conn.execute(db.CREATE_USERS)
         
-        # Patient users (2 conturi pacient)
-        patient_password1 = hashlib.sha256('pacient123'.encode()).hexdigest()
-        patient_password2 = hashlib.sha256('pacient456'.encode()).hexdigest()
-        
-        patients = [
-            ('pacient1', patient_password1, 'Pacient 1'),
-            ('pacient2', patient_password2, 'Pacient 2')
-        ]
-        
-        for username, password, full_name in patients:
-            c.execute('''
-                INSERT INTO users (username, password_hash, full_name)
-                VALUES (?, ?, ?)
-            ''', (username, password, full_name))
-    
-    conn.commit()
-    conn.close()
+        # Create default users if they don't exist
+        if conn.execute(db.COUNT_USERS).fetchone()[0] == 0:
+            # Admin user
+            admin_password = hashlib.sha256('admin123'.encode()).hexdigest()
+            
+            # Patient users (2 conturi pacient)
+            patient_password1 = hashlib.sha256('pacient123'.encode()).hexdigest()
+            patient_password2 = hashlib.sha256('pacient456'.encode()).hexdigest()
+            
+            users = [
+                ('admin', admin_password, 'Administrator'),
+                ('pacient1', patient_password1, 'Pacient 1'),
+                ('pacient2', patient_password2, 'Pacient 2')
+            ]
+            conn.executemany(db.INSERT_USER, users)
 
 init_db()
 
+def model_load_options():
+    """Options the model registry is keyed on (see testModel.load_model)"""
+    return {'quantize': app.config['MODEL_QUANTIZE'], 'mmap': app.config['MODEL_MMAP'],
+            'backend': app.config['MODEL_BACKEND']}
+
+def model_version():
+    """Model identity used in result cache keys"""
+    options = ','.join(f'{name}={value}' for name, value in sorted(model_load_options().items()) if value)
+    fingerprint = testModel.model_fingerprint(app.config['MODEL_DIR'])
+    return f'{fingerprint}+{options}' if options else fingerprint
+
+def warm_up_model():
+    """Load the model into the process-wide registry so all requests share one handle"""
+    if not app.config['MODEL_WARMUP'] or app.config['INFERENCE_WORKERS'] > 0 or IS_INFERENCE_WORKER:
+        return
+    try:
+        testModel.warmup_model(app.config['MODEL_DIR'], **model_load_options())
+    except Exception as e:
+        # The server can still start; the model will be loaded on the first request
+        print(f"Avertisment: modelul nu a putut fi încărcat la pornire: {str(e)}")
+
+warm_up_model()
+
+def evict_idle_models_loop(max_idle_s):
+    """Periodically unload models that no request has used for max_idle_s seconds"""
+    while True:
+        time.sleep(min(max_idle_s / 2, 60))
+        for evicted in testModel.evict_idle_models(max_idle_s):
+            print(f"Model descărcat din memorie după {max_idle_s}s de inactivitate: {evicted['model_dir']}")
+
+# Only the server process holds models when inference runs in-process; pool workers keep their replica
+if app.config['MODEL_IDLE_EVICT_S'] and app.config['INFERENCE_WORKERS'] == 0 and not IS_INFERENCE_WORKER:
+    threading.Thread(target=evict_idle_models_loop, args=(app.config['MODEL_IDLE_EVICT_S'],),
+                     name='model-idle-evictor', daemon=True).start()
+
+# Optional pool of model replica processes; batches go to the least-loaded worker
+inference_pool = None
+if app.config['INFERENCE_WORKERS'] > 0 and not IS_INFERENCE_WORKER:
+    inference_pool = InferencePool(workers=app.config['INFERENCE_WORKERS'],
+                                   threads_per_worker=app.config['INFERENCE_THREADS_PER_WORKER'],
+                                   model_dir=app.config['MODEL_DIR'],
+                                   load_options=model_load_options(),
+                                   task_timeout=app.config['INFERENCE_TASK_TIMEOUT_S'])
+
+# All /api/process requests go through one micro-batching scheduler in front of the model
+scheduler = BatchScheduler(model_dir=app.config['MODEL_DIR'],
+                           window_ms=app.config['BATCH_WINDOW_MS'],
+                           max_batch_size=app.config['BATCH_MAX_SIZE'],
+                           load_options=model_load_options(),
+                           runner=inference_pool.generate_texts if inference_pool else None,
+                           concurrency=app.config['INFERENCE_WORKERS'] or 1)
+
+# Identical (normalised) inputs reuse the stored generation instead of a new beam search
+result_cache = ResultCache(max_entries=app.config['RESULT_CACHE_SIZE'],
+                           db_path=app.config['RESULT_CACHE_DB'],
+                           ttl_seconds=app.config['RESULT_CACHE_TTL_S'])
+
+# Long audio / batch work runs on a bounded worker pool; state is kept in the jobs table
+job_manager = JobManager(database,
+                         max_workers=app.config['JOB_WORKERS'],
+                         max_pending=app.config['JOB_MAX_PENDING'])
+if not IS_INFERENCE_WORKER:
+    job_manager.recover_interrupted()
+
 def hash_password(password):
     """Hash a password"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -94,432 +204,33 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def convert_audio_to_text(audio_file_path):
-    """Convert audio file to text using SpeechRecognition"""
+# Speech recognition backend, loaded once and shared by all requests
+asr_backend = asr.create_backend(app.config['ASR_BACKEND'],
+                                 model_dir=app.config['ASR_MODEL_DIR'],
+                                 fallback=app.config['ASR_FALLBACK'])
+if not IS_INFERENCE_WORKER:
+    asr_backend.warmup()
+
+def convert_audio_to_text(audio_data, filename=None):
+    """Convert uploaded audio bytes to text; decoding happens in memory, without temp files"""
+    file_ext = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else None
     try:
-        # Convert to WAV if needed (SpeechRecognition works best with WAV)
-        temp_wav_path = None
-        try:
-            # Check file extension
-            file_ext = audio_file_path.rsplit('.', 1)[1].lower() if '.' in audio_file_path else ''
-            
-            if file_ext != 'wav':
-                # Convert to WAV using pydub
-                audio = AudioSegment.from_file(audio_file_path)
-                temp_wav_path = audio_file_path.rsplit('.', 1)[0] + '_converted.wav'
-                audio.export(temp_wav_path, format="wav")
-                audio_file_path = temp_wav_path
-        except Exception as conv_error:
-            # If conversion fails, try direct processing
-            pass
-        
-        recognizer = sr.Recognizer()
-        
-        # Handle different audio formats
-        with sr.AudioFile(audio_file_path) as source:
-            # Adjust for ambient noise
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            audio = recognizer.record(source)
-        
-        # Try to recognize speech using Google Speech Recognition
-        try:
-            text = recognizer.recognize_google(audio, language='ro-RO')
-            
-            # Clean up temporary file if created
-            if temp_wav_path and os.path.exists(temp_wav_path):
-                try:
-                    os.remove(temp_wav_path)
-                except:
-                    pass
-            
-            return {'success': True, 'text': text}
-        except sr.UnknownValueError:
-            # Clean up temporary file if created
-            if temp_wav_path and os.path.exists(temp_wav_path):
-                try:
-                    os.remove(temp_wav_path)
-                except:
-                    pass
-            return {'success': False, 'error': 'Nu s-a putut recunoaște vorbirea din audio'}
-        except sr.RequestError as e:
-            # Clean up temporary file if created
-            if temp_wav_path and os.path.exists(temp_wav_path):
-                try:
-                    os.remove(temp_wav_path)
-                except:
-                    pass
-            return {'success': False, 'error': f'Eroare la serviciul de recunoaștere: {str(e)}'}
+        audio = asr.decode_segment(audio_data, format=file_ext)
     except Exception as e:
         return {'success': False, 'error': f'Eroare la procesarea audio: {str(e)}'}
-
-def format_result(result):
-    """Format result to show only the 4 required fields by parsing the generated text"""
-    import re
-    
-    # Extract generated_text from result
-    generated_text = ""
-    if isinstance(result, dict):
-        generated_text = result.get("generated_text", "")
-    elif isinstance(result, str):
-        generated_text = result
-    
-    if not generated_text:
-        return {
-            "boala": "Nu a fost identificată",
-            "tratament_recomandat": ["Nu sunt recomandate medicamente"],
-            "investigatii_suplimentare": ["Nu sunt recomandate investigații"],
-            "recomandari_suplimentare": ["Nu sunt recomandări suplimentare"]
-        }
-    
-    # Parse the text format: "Boala: ... Tratament recomandat: ... Investigații suplimentare: ... Recomandări suplimentare: ..."
-    
-    # Extract Boala: text after "Boala:" until next field or end
-    boala_match = re.search(r'Boala:\s*([^.]*?)(?:\s*\.|$)', generated_text, re.IGNORECASE)
-    boala = boala_match.group(1).strip() if boala_match else ""
-    
-    # Extract Tratament recomandat: text after "Tratament recomandat:" until next field
-    tratament_match = re.search(r'Tratament\s+recomandat:\s*([^.]*?)(?:\s*\.|$)', generated_text, re.IGNORECASE)
-    tratament_text = tratament_match.group(1).strip() if tratament_match else ""
-    # Split by comma and clean
-    tratament_list = [item.strip() for item in tratament_text.split(',') if item.strip()] if tratament_text else []
-    
-    # Extract Investigații suplimentare: text after "Investigații suplimentare:" until next field
-    investigatii_match = re.search(r'Investigații\s+suplimentare:\s*([^.]*?)(?:\s*\.|$)', generated_text, re.IGNORECASE)
-    investigatii_text = investigatii_match.group(1).strip() if investigatii_match else ""
-    # Split by comma and clean
-    investigatii_list = [item.strip() for item in investigatii_text.split(',') if item.strip()] if investigatii_text else []
     
-    # Extract Recomandări suplimentare: text after "Recomandări suplimentare:" until end
-    recomandari_match = re.search(r'Recomandări\s+suplimentare:\s*([^.]*?)(?:\s*\.|$)', generated_text, re.IGNORECASE)
-    recomandari_text = recomandari_match.group(1).strip() if recomandari_match else ""
-    # Split by comma and clean
-    recomandari_list = [item.strip() for item in recomandari_text.split(',') if item.strip()] if recomandari_text else []
-    
-    return {
-        "boala": boala if boala else "Nu a fost identificată",
-        "tratament_recomandat": tratament_list if tratament_list else ["Nu sunt recomandate medicamente"],
-        "investigatii_suplimentare": investigatii_list if investigatii_list else ["Nu sunt recomandate investigații"],
-        "recomandari_suplimentare": recomandari_list if recomandari_list else ["Nu sunt recomandări suplimentare"]
-    }
-
-def extract_istoric_medical(input_text):
-    """Extract only medical history from input text (e.g., 'fumător de 30 de ani', 'istoric de hipertensiune')"""
-    if not input_text:
-        return ""
-    
-    import re
-    
-    istoric_parts = []
-    text_lower = input_text.lower()
-    
-    # Specific patterns for medical history
-    history_patterns = [
-        # Smoking history
-        (r'fumător\s+(?:de\s+)?\d+\s+ani', 'fumător'),
-        (r'fumat\s+(?:de\s+)?\d+\s+ani', 'fumat'),
-        (r'fumător\s+activ', 'fumător'),
-        (r'fumător\s+în\s+trecut', 'fumător'),
-        # Medical history phrases
-        (r'istoric\s+de\s+[^.!?]+', 'istoric'),
-        (r'antecedente\s+[^.!?]+', 'antecedente'),
-        (r'în\s+trecut\s+[^.!?]+', 'trecut'),
-        (r'precedent\s+[^.!?]+', 'precedent'),
-        # Chronic conditions
-        (r'hipertensiune\s+(?:de\s+)?\d+\s+ani', 'hipertensiune'),
-        (r'diabet\s+(?:de\s+)?\d+\s+ani', 'diabet'),
-    ]
-    
-    # Extract specific history patterns
-    for pattern, keyword in history_patterns:
-        matches = re.finditer(pattern, text_lower, re.IGNORECASE)
-        for match in matches:
-            start, end = match.span()
-            # Get original case from input
-            extracted = input_text[start:end].strip()
-            # Clean up - remove if it's too long (probably not just history)
-            if len(extracted) < 100:  # Reasonable length for history
-                istoric_parts.append(extracted)
-    
-    # If no specific patterns, extract sentences with history keywords (but exclude current symptoms/treatment)
-    if not istoric_parts:
-        sentences = re.split(r'[.!?]\s+', input_text)
-        history_keywords = ['fumător', 'fumat', 'istoric', 'antecedente', 'în trecut', 'precedent', 'hipertensiune', 'diabet']
-        exclude_keywords = ['simptome', 'tratament', 'medicament', 'recomand', 'diagnostic', 'examen', 'investigație']
-        
-        for sentence in sentences:
-            sentence_lower = sentence.lower().strip()
-            # Check if sentence contains history keywords
-            has_history = any(keyword in sentence_lower for keyword in history_keywords)
-            # Check if sentence is about current treatment/symptoms (exclude these)
-            has_current = any(keyword in sentence_lower for keyword in exclude_keywords)
-            
-            if has_history and not has_current and len(sentence.strip()) < 150:
-                istoric_parts.append(sentence.strip())
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_parts = []
-    for part in istoric_parts:
-        part_lower = part.lower()
-        if part_lower not in seen:
-            seen.add(part_lower)
-            unique_parts.append(part)
-    
-    # Join all history parts
-    if unique_parts:
-        return ', '.join(unique_parts)
-    
-    return ""
-
-def extract_medicamente_from_input(input_text, formatted_result):
-    """Extract medications from input text using exact words from input"""
-    if not input_text:
-        return []
-    
-    import re
-    
-    # Get medications from formatted result
-    tratament = formatted_result.get('tratament_recomandat', [])
-    if not tratament:
-        return []
-    
-    medications_found = []
-    input_lower = input_text.lower()
-    
-    for item in tratament:
-        if isinstance(item, dict):
-            nume_model = item.get('nume', '').lower()
-            doza_model = item.get('doza', '')
-            administrare_model = item.get('administrare', '')
-        else:
-            # If it's a string, try to extract name
-            nume_model = item.lower() if isinstance(item, str) else ''
-            doza_model = ''
-            administrare_model = ''
-        
-        # Search for medication name in input text (try partial matches too)
-        if nume_model:
-            # Split medication name into words for better matching
-            nume_words = nume_model.split()
-            # Try to find the medication name in input (exact or partial)
-            pattern = re.escape(nume_model)
-            match = re.search(pattern, input_lower, re.IGNORECASE)
-            
-            # If exact match not found, try to find first significant word
-            if not match and len(nume_words) > 0:
-                first_word = nume_words[0]
-                if len(first_word) > 3:  # Only if word is significant
-                    pattern = r'\b' + re.escape(first_word) + r'\b'
-                    match = re.search(pattern, input_lower, re.IGNORECASE)
-            
-            if match:
-                # Find the sentence or phrase containing this medication
-                start_pos = match.start()
-                # Get wider context around the medication (100 chars before and 150 after)
-                context_start = max(0, start_pos - 100)
-                context_end = min(len(input_text), start_pos + len(nume_model) + 150)
-                context = input_text[context_start:context_end]
-                context_lower = context.lower()
-                
-                # Extract medication name with exact case from input
-                med_name_in_input = input_text[match.start():match.end()]
-                
-                # Try to extract dose from context - look for patterns like "100-200 mcg", "200 mg", etc.
-                dose_patterns = [
-                    r'(\d+\s*-\s*\d+\s*(?:mg|mcg|ml|g|comprim|tablet|pastil|doz))',
-                    r'(\d+\s*(?:mg|mcg|ml|g|comprim|tablet|pastil|doz))',
-                ]
-                extracted_dose = ''
-                for pattern in dose_patterns:
-                    dose_match = re.search(pattern, context_lower, re.IGNORECASE)
-                    if dose_match:
-                        # Get exact case from context
-                        dose_start = context_start + dose_match.start()
-                        dose_end = context_start + dose_match.end()
-                        extracted_dose = input_text[dose_start:dose_end]
-                        break
-                
-                # If no dose found in context, use from model
-                if not extracted_dose:
-                    extracted_dose = doza_model
-                
-                # Try to extract administration - look for "pe zi", "de X ori", "X comprimat pe zi"
-                admin_patterns = [
-                    r'(\d+\s*(?:comprim|tablet|pastil|doz)[^.]*(?:pe\s+zi|zi))',
-                    r'(\d+\s*(?:comprim|tablet|pastil|doz)[^.]*)',
-                    r'(\d+\s*(?:ori|dat)[^.]*(?:pe\s+zi|zi))',
-                    r'(pe\s+zi)',
-                    r'(de\s+\d+\s+ori[^.]*)',
-                ]
-                extracted_admin = ''
-                for pattern in admin_patterns:
-                    admin_match = re.search(pattern, context_lower, re.IGNORECASE)
-                    if admin_match:
-                        # Get exact case from context
-                        admin_start = context_start + admin_match.start()
-                        admin_end = context_start + admin_match.end()
-                        extracted_admin = input_text[admin_start:admin_end]
-                        break
-                
-                # If no administration found, use from model or default
-                if not extracted_admin:
-                    extracted_admin = administrare_model if administrare_model else 'Conform indicațiilor medicale'
-                
-                medications_found.append({
-                    'nume': med_name_in_input,  # Use exact case from input
-                    'doza': extracted_dose,
-                    'administrare': extracted_admin
-                })
-            else:
-                # Medication not found in input, use formatted result but keep original format
-                medications_found.append({
-                    'nume': item.get('nume', item) if isinstance(item, dict) else item,
-                    'doza': doza_model,
-                    'administrare': administrare_model if administrare_model else 'Conform indicațiilor medicale'
-                })
-        else:
-            # Fallback to formatted result
-            medications_found.append({
-                'nume': item.get('nume', item) if isinstance(item, dict) else item,
-                'doza': doza_model,
-                'administrare': administrare_model if administrare_model else 'Conform indicațiilor medicale'
-            })
-    
-    return medications_found
-
-def generate_nota_clinica(formatted_result, input_text=None, patient_info=None):
-    """Generate Notă Clinică (Clinical Note) from formatted result"""
-    nota = "NOTĂ CLINICĂ\n"
-    nota += "=" * 80 + "\n\n"
-    
-    if patient_info:
-        if patient_info.get('varsta'):
-            nota += f"Vârsta: {patient_info['varsta']} ani\n"
-        if patient_info.get('sex'):
-            nota += f"Sex: {patient_info['sex']}\n"
-        nota += "\n"
-    
-    nota += "DIAGNOSTIC:\n"
-    if formatted_result.get('boala'):
-        boala = formatted_result['boala']
-        # Try to extract ICD-10 code if present
-        icd_match = None
-        if isinstance(boala, str):
-            import re
-            icd_match = re.search(r'\(ICD-10:\s*([^)]+)\)', boala)
-        if icd_match:
-            nota += f"{boala}\n"
-        else:
-            nota += f"{boala}\n"
-    else:
-        nota += "Nu a fost identificat\n"
-    nota += "\n"
-    
-    nota += "TRATAMENT RECOMANDAT:\n"
-    tratament = formatted_result.get('tratament_recomandat', [])
-    if tratament and len(tratament) > 0:
-        for item in tratament:
-            if isinstance(item, dict):
-                nume = item.get('nume', '')
-                doza = item.get('doza', '')
-                administrare = item.get('administrare', '')
-                nota += f"  • {nume}"
-                if doza:
-                    nota += f" {doza}"
-                if administrare:
-                    nota += f", {administrare}"
-                nota += "\n"
-            else:
-                nota += f"  • {item}\n"
-    else:
-        nota += "  Nu sunt recomandate medicamente\n"
-    nota += "\n"
-    
-    nota += "INVESTIGAȚII RECOMANDATE:\n"
-    investigatii = formatted_result.get('investigatii_suplimentare', [])
-    if investigatii and len(investigatii) > 0:
-        for item in investigatii:
-            nota += f"  • {item}\n"
-    else:
-        nota += "  Nu sunt recomandate investigații\n"
-    nota += "\n"
-    
-    nota += "RECOMANDĂRI:\n"
-    recomandari = formatted_result.get('recomandari_suplimentare', [])
-    if recomandari and len(recomandari) > 0:
-        for item in recomandari:
-            nota += f"  • {item}\n"
-    else:
-        nota += "  Nu sunt recomandări suplimentare\n"
-    
-    return nota
-
-def generate_reteta_mediala(formatted_result, input_text=None, patient_info=None):
-    """Generate Rețetă Medicală (Medical Prescription) from formatted result using exact words from input"""
-    reteta = "REȚETĂ MEDICALĂ\n"
-    reteta += "=" * 80 + "\n\n"
-    
-    reteta += f"Data: {datetime.now().strftime('%d.%m.%Y')}\n"
-    
-    if patient_info:
-        if patient_info.get('nume'):
-            reteta += f"Pacient: {patient_info['nume']}\n"
-    else:
-        reteta += "Pacient: [Nume pacient]\n"
-    reteta += "\n"
-    
-    reteta += "MEDICAMENTE:\n"
-    # Extract medications using exact words from input
-    medications = extract_medicamente_from_input(input_text, formatted_result) if input_text else []
-    
-    if medications and len(medications) > 0:
-        for idx, med in enumerate(medications, 1):
-            nume = med.get('nume', '')
-            doza = med.get('doza', '')
-            administrare = med.get('administrare', '')
-            
-            reteta += f"{idx}. {nume}"
-            if doza:
-                reteta += f" {doza}"
-            reteta += "\n"
-            if administrare:
-                reteta += f"   Administrare: {administrare}\n"
-    else:
-        # Fallback to formatted result if extraction failed
-        tratament = formatted_result.get('tratament_recomandat', [])
-        if tratament and len(tratament) > 0:
-            for idx, item in enumerate(tratament, 1):
-                if isinstance(item, dict):
-                    nume = item.get('nume', '')
-                    doza = item.get('doza', '')
-                    administrare = item.get('administrare', '')
-                    reteta += f"{idx}. {nume}"
-                    if doza:
-                        reteta += f" {doza}"
-                    reteta += "\n"
-                    if administrare:
-                        reteta += f"   Administrare: {administrare}\n"
-                else:
-                    reteta += f"{idx}. {item}\n"
-                    reteta += f"   Administrare: Conform indicațiilor medicale\n"
-        else:
-            reteta += "Nu sunt recomandate medicamente\n"
-    reteta += "\n"
-    
-    reteta += "Diagnostic: "
-    if formatted_result.get('boala'):
-        boala = formatted_result['boala']
-        # Extract ICD-10 if present
-        import re
-        icd_match = re.search(r'\(ICD-10:\s*([^)]+)\)', boala)
-        if icd_match:
-            reteta += f"{boala}\n"
-        else:
-            reteta += f"{boala}\n"
-    else:
-        reteta += "Nu a fost identificat\n"
-    
-    return reteta
+    # Long dictations are split at pauses and the segments transcribed in parallel
+    try:
+        transcription = asr.transcribe_segments(asr_backend, audio,
+                                                max_workers=app.config['ASR_WORKERS'],
+                                                max_segment_ms=app.config['ASR_SEGMENT_MAX_MS'])
+        return {'success': True, 'text': transcription['text'], 'transcription': transcription}
+    except sr.UnknownValueError:
+        return {'success': False, 'error': 'Nu s-a putut recunoaște vorbirea din audio'}
+    except sr.RequestError as e:
+        return {'success': False, 'error': f'Eroare la serviciul de recunoaștere: {str(e)}'}
+    except Exception as e:
+        return {'success': False, 'error': f'Eroare la procesarea audio: {str(e)}'}
 
 def save_nota_clinica_to_file(user_id, nota_content):
     """Save Notă Clinică to a text file"""
@@ -588,6 +299,86 @@ def save_result_to_file(user_id, input_text, result, result_type='text'):
     except Exception as e:
         return {'success': False, 'error': f'Eroare la salvarea fișierului: {str(e)}'}
 
+def resolve_sections(params):
+    """Sections text generation may stop after: the 'sections' parameter (comma-separated names from
+    documents.RESULT_SECTIONS) or, with STOP_AFTER_SECTIONS, all of them. Raises ValueError"""
+    value = params.get('sections')
+    if value:
+        names = value.split(',') if isinstance(value, str) else value
+        return tuple(sorted(validate_sections(name.strip() for name in names)))
+    return tuple(RESULT_SECTIONS) if app.config['STOP_AFTER_SECTIONS'] else None
+
+def generation_params(profile, sections=None):
+    """Generation settings that identify a cached result"""
+    params = testModel.generation_kwargs(profile)
+    if sections:
+        params['sections'] = list(sections)
+    return params
+
+def split_input(input_text):
+    """Chunks of an input longer than the encoder limit (see testModel.split_long_input), or [input_text]"""
+    if not app.config['LONG_INPUT_CHUNKING']:
+        return [input_text]
+    return testModel.split_long_input(testModel.get_tokenizer(app.config['MODEL_DIR']), input_text)
+
+def generate_formatted_result(input_text, profile=testModel.DEFAULT_TEXT_PROFILE, sections=None):
+    """Run the model (or reuse a cached result) and format it to the 4 required fields"""
+    chunks = split_input(input_text)
+    params = generation_params(profile, sections)
+    if len(chunks) > 1:
+        params['long_input'] = True
+    cache_key = result_cache.make_key(
+        input_text,
+        model_version(),
+        structured=False,
+        params=params)
+    cached = result_cache.get(cache_key)
+    if cached:
+        return cached['formatted_result']
+    
+    # Chunks of a long input are submitted together, so the scheduler runs them in the same batch
+    futures = [scheduler.submit(chunk, profile=profile, sections=sections) for chunk in chunks]
+    generated_texts = [future.result() for future in futures]
+    
+    # Format result to show only the 4 required fields, merged across chunks
+    formatted_result = merge_formatted_results([format_result(text) for text in generated_texts])
+    result_cache.put(cache_key, {
+        'generated_text': '\n'.join(generated_texts),
+        'formatted_result': formatted_result
+    })
+    return formatted_result
+
+def run_processing_pipeline(input_text, profile, patient_info, sections=None):
+    """Model inference + document generation; returns the /api/process response payload"""
+    formatted_result = generate_formatted_result(input_text, profile, sections)
+    
+    # Generate Notă Clinică and Rețetă Medicală
+    nota_clinica = generate_nota_clinica(formatted_result, input_text, patient_info)
+    reteta_mediala = generate_reteta_mediala(formatted_result, input_text, patient_info)
+    
+    return {
+        'success': True,
+        'input_text': input_text,
+        'result': formatted_result,
+        'nota_clinica': nota_clinica,
+        'reteta_mediala': reteta_mediala,
+        'profile': profile
+    }
+
+def run_process_job(input_text=None, audio_data=None, audio_filename=None, profile=testModel.DEFAULT_TEXT_PROFILE,
+                    patient_info=None, sections=None):
+    """Background job: optional audio conversion followed by the processing pipeline"""
+    if audio_data is not None:
+        conversion_result = convert_audio_to_text(audio_data, audio_filename)
+        if not conversion_result['success']:
+            raise RuntimeError(conversion_result.get('error', 'Eroare la conversia audio'))
+        input_text = conversion_result['text']
+    
+    result = run_processing_pipeline(input_text, profile, patient_info, sections)
+    if audio_data is not None:
+        result['transcription'] = conversion_result['transcription']
+    return result
+
 # Routes
 @app.route('/')
 def index():
@@ -607,11 +398,7 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Username și parolă sunt obligatorii'}), 400
         
-        conn = sqlite3.connect(app.config['DATABASE'])
-        c = conn.cursor()
-        c.execute('SELECT id, username, password_hash, full_name FROM users WHERE username = ?', (username,))
-        user = c.fetchone()
-        conn.close()
+        user = database.query_one(db.SELECT_USER_BY_USERNAME, (username,))
         
         if user and verify_password(password, user[2]):
             session['user_id'] = user[0]
@@ -648,25 +435,15 @@ def register():
         if len(password) < 6:
             return jsonify({'error': 'Parola trebuie să aibă cel puțin 6 caractere'}), 400
         
-        conn = sqlite3.connect(app.config['DATABASE'])
-        c = conn.cursor()
-        
         # Check if username already exists
-        c.execute('SELECT id FROM users WHERE username = ?', (username,))
-        if c.fetchone():
-            conn.close()
+        if database.query_one(db.SELECT_USER_ID_BY_USERNAME, (username,)):
             return jsonify({'error': 'Username-ul este deja folosit'}), 400
         
         # Create new user
         password_hash = hash_password(password)
         try:
-            c.execute('''
-                INSERT INTO users (username, password_hash, full_name)
-                VALUES (?, ?, ?)
-            ''', (username, password_hash, full_name))
-            conn.commit()
-            user_id = c.lastrowid
-            conn.close()
+            with database.transaction() as conn:
+                user_id = conn.execute(db.INSERT_USER, (username, password_hash, full_name)).lastrowid
             
             # Auto-login after registration
             session['user_id'] = user_id
@@ -681,8 +458,10 @@ def register():
                     'full_name': full_name
                 }
             })
+        except sqlite3.IntegrityError:
+            # Registered concurrently by another request
+            return jsonify({'error': 'Username-ul este deja folosit'}), 400
         except Exception as e:
-            conn.close()
             return jsonify({'error': f'Eroare la crearea contului: {str(e)}'}), 500
     
     # GET request - show register page
@@ -708,13 +487,9 @@ def get_current_user():
         'full_name': session.get('full_name')
     })
 
-@app.route('/api/process', methods=['POST'])
-def process_text_or_audio():
-    """Process text or audio input"""
-    if 'user_id' not in session:
-        return jsonify({'error': 'Autentificare necesară'}), 401
-    
-    user_id = session['user_id']
+def read_process_input():
+    """Read the input text from an audio upload, a form field or a JSON body.
+    Returns (input_text, result_type, error_response)"""
     input_text = None
     result_type = request.form.get('result_type', 'structured')  # 'structured' or 'text'
     
@@ -722,26 +497,17 @@ def process_text_or_audio():
     if 'audio_file' in request.files:
         audio_file = request.files['audio_file']
         if audio_file.filename and allowed_file(audio_file.filename):
-            # Save uploaded file temporarily
-            filename = secure_filename(f"{uuid.uuid4()}_{audio_file.filename}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            audio_file.save(filepath)
-            
-            # Convert audio to text
-            conversion_result = convert_audio_to_text(filepath)
-            
-            # Clean up uploaded file
-            try:
-                os.remove(filepath)
-            except:
-                pass
+            # Convert audio to text straight from the request stream
+            conversion_result = convert_audio_to_text(audio_file.read(), audio_file.filename)
             
             if not conversion_result['success']:
-                return jsonify({'error': conversion_result.get('error', 'Eroare la conversia audio')}), 400
+                return None, result_type, (jsonify({'error': conversion_result.get('error', 'Eroare la conversia audio')}), 400)
             
             input_text = conversion_result['text']
+            # Segment timings / partial-transcription flag, added to the response by the caller
+            g.transcription = conversion_result['transcription']
         else:
-            return jsonify({'error': 'Fișier audio invalid sau format neacceptat'}), 400
+            return None, result_type, (jsonify({'error': 'Fișier audio invalid sau format neacceptat'}), 400)
     
     # Check if text is provided directly
     elif 'text' in request.form:
@@ -754,39 +520,400 @@ def process_text_or_audio():
         result_type = data.get('result_type', 'structured')
     
     if not input_text:
-        return jsonify({'error': 'Text sau fișier audio necesar'}), 400
+        return None, result_type, (jsonify({'error': 'Text sau fișier audio necesar'}), 400)
+    
+    return input_text, result_type, None
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/process', methods=['POST'])
+def process_text_or_audio():
+    """Process text or audio input"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    
+    input_text, result_type, error = read_process_input()
+    if error:
+        return error
+    
+    # Decoding profile: explicit 'profile' or the best one that fits 'latency_budget_ms'
+    params = request.get_json(silent=True) or request.form
+    try:
+        profile = testModel.resolve_profile(params.get('profile'), params.get('latency_budget_ms'))
+        sections = resolve_sections(params)
+    except ValueError as e:
+        return jsonify({'error': f'Parametri de decodare invalizi: {str(e)}'}), 400
     
     try:
         # Process text using testModel
-        structured = (result_type == 'structured')
-        result = testModel.run_with_input(input_text, structured=False, model_dir=app.config['MODEL_DIR'])
-        
-        # Format result to show only the 4 required fields
-        formatted_result = format_result(result)
-        
-        # Generate Notă Clinică and Rețetă Medicală
         patient_info = {
             'nume': session.get('full_name', ''),
             'varsta': None,
             'sex': None
         }
-        nota_clinica = generate_nota_clinica(formatted_result, input_text, patient_info)
-        reteta_mediala = generate_reteta_mediala(formatted_result, input_text, patient_info)
-        
-        # Return both documents
-        response_data = {
-            'success': True,
-            'input_text': input_text,
-            'result': formatted_result,
-            'nota_clinica': nota_clinica,
-            'reteta_mediala': reteta_mediala
-        }
-        
-        return jsonify(response_data)
+        response = run_processing_pipeline(input_text, profile, patient_info, sections)
+        if g.get('transcription'):
+            response['transcription'] = g.transcription
+        return jsonify(response)
     
     except Exception as e:
         return jsonify({'error': f'Eroare la procesarea textului: {str(e)}'}), 500
 
+@app.route('/api/process-stream', methods=['POST'])
+def process_text_or_audio_stream():
+    """Process text or audio input, streaming decoded tokens as Server-Sent Events.
+    Events: 'token' while generating, then 'result', 'documents' and 'done' (or 'error').
+    With 'structured', the model answers in JSON and each top-level field is also sent as a
+    'field' event ({name, value}) as soon as it is complete; 'constrained' limits decoding to the schema.
+    With inference workers (the model is not in this process) or an input longer than the encoder
+    limit (split into chunks), no 'token' events are sent: the input goes through the /api/process
+    pipeline and only 'result', 'documents' and 'done' follow"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    
+    input_text, result_type, error = read_process_input()
+    if error:
+        return error
+    
+    params = request.get_json(silent=True) or request.form
+    sampling = str(params.get('sampling', '')).lower() in ('1', 'true', 'yes')
+    structured = str(params.get('structured', '')).lower() in ('1', 'true', 'yes')
+    constrained = structured and str(params.get('constrained', '')).lower() in ('1', 'true', 'yes')
+    try:
+        profile = testModel.resolve_profile(params.get('profile'), params.get('latency_budget_ms'))
+        pipeline_sections = resolve_sections(params)
+        sections = None if structured else pipeline_sections
+    except ValueError as e:
+        return jsonify({'error': f'Parametri de decodare invalizi: {str(e)}'}), 400
+    patient_info = {
+        'nume': session.get('full_name', ''),
+        'varsta': None,
+        'sex': None
+    }
+    
+    transcription = g.get('transcription')
+    
+    def events():
+        yield sse_event('start', {'input_text': input_text, 'transcription': transcription})
+        try:
+            if inference_pool or len(split_input(input_text)) > 1:
+                # Replicas return whole results, and a long input is generated chunk by chunk instead of
+                # being truncated; same profile, batching, pool and chunking as /api/process
+                result = run_processing_pipeline(input_text, profile, patient_info, pipeline_sections)
+                yield sse_event('result', {'result': result['result']})
+                yield sse_event('documents', {
+                    'nota_clinica': result['nota_clinica'],
+                    'reteta_mediala': result['reteta_mediala']
+                })
+                yield sse_event('done', {'success': True})
+                return
+            
+            # Streaming needs a single beam, so it always decodes with the greedy profile
+            stream_params = generation_params('fast', sections)
+            if structured:
+                stream_params['constrained'] = constrained
+            cache_key = result_cache.make_key(
+                input_text,
+                model_version(),
+                structured=structured,
+                params=stream_params)
+            cached = None if sampling else result_cache.get(cache_key)
+            # Structured output is parsed while it streams, so complete fields can be rendered right away
+            parser = IncrementalJSONParser() if structured else None
+            if cached:
+                generated_text = cached['generated_text']
+                formatted_result = cached['formatted_result']
+                yield sse_event('token', {'text': generated_text})
+                for name, value in parser.feed(generated_text) if parser else []:
+                    yield sse_event('field', {'name': name, 'value': value})
+            else:
+                tokenizer, model, device = testModel.get_model(model_dir=app.config['MODEL_DIR'], **model_load_options())
+                if structured:
+                    stream = testModel.stream_structured(tokenizer, model, device, testModel.build_input(input_text),
+                                                         profile='fast', sampling=sampling, constrained=constrained)
+                else:
+                    stream = testModel.stream_text(tokenizer, model, device, testModel.build_input(input_text),
+                                                   profile='fast', sampling=sampling, sections=sections)
+                chunks = []
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield sse_event('token', {'text': chunk})
+                    for name, value in parser.feed(chunk) if parser else []:
+                        yield sse_event('field', {'name': name, 'value': value})
+                generated_text = ''.join(chunks)
+                if parser:
+                    # A truncated output keeps the fields and list items generated so far
+                    formatted_result = structured_to_formatted(parser.finish())
+                else:
+                    formatted_result = format_result({'generated_text': generated_text})
+                if not sampling:
+                    result_cache.put(cache_key, {
+                        'generated_text': generated_text,
+                        'formatted_result': formatted_result
+                    })
+            
+            yield sse_event('result', {'result': formatted_result})
+            yield sse_event('documents', {
+                'nota_clinica': generate_nota_clinica(formatted_result, input_text, patient_info),
+                'reteta_mediala': generate_reteta_mediala(formatted_result, input_text, patient_info)
+            })
+            yield sse_event('done', {'success': True})
+        except Exception as e:
+            yield sse_event('error', {'error': f'Eroare la procesarea textului: {str(e)}'})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def dictation_socket(ws):
+    """Live dictation: binary messages are 16 kHz mono 16-bit PCM chunks, the text message
+    {"type": "stop"} ends the session. Sends 'partial' and 'final' transcripts while the doctor
+    speaks, and a 'result' with the documents for the dictation so far after each utterance
+    (utterances that end while the model is still running are processed together)."""
+    if 'user_id' not in session:
+        ws.send(json.dumps({'type': 'error', 'error': 'Autentificare necesară'}))
+        return
+    
+    try:
+        profile = testModel.resolve_profile(request.args.get('profile'), request.args.get('latency_budget_ms'))
+        sections = resolve_sections(request.args)
+    except ValueError as e:
+        ws.send(json.dumps({'type': 'error', 'error': f'Parametri de decodare invalizi: {str(e)}'}))
+        return
+    patient_info = {
+        'nume': session.get('full_name', ''),
+        'varsta': None,
+        'sex': None
+    }
+    transcriber = asr.StreamingTranscriber(asr_backend, end_silence_ms=app.config['DICTATION_END_SILENCE_MS'])
+    utterances = []
+    send_lock = threading.Lock()
+    # Dictation waiting for inference: only the latest one is kept, so utterances that end while a
+    # run is in progress are processed together in the next run
+    latest = {'text': None, 'closed': False}
+    latest_changed = threading.Condition()
+    
+    def send(message):
+        with send_lock:
+            ws.send(json.dumps(message, ensure_ascii=False))
+    
+    def process_latest():
+        """Runs inference off the receive loop, so incoming audio is not held up by the model"""
+        while True:
+            with latest_changed:
+                while latest['text'] is None and not latest['closed']:
+                    latest_changed.wait()
+                text, latest['text'] = latest['text'], None
+            if text is None:
+                return
+            try:
+                result = run_processing_pipeline(text, profile, patient_info, sections)
+                send(dict(result, type='result'))
+            except Exception as e:
+                try:
+                    send({'type': 'error', 'error': f'Eroare la procesarea textului: {str(e)}'})
+                except Exception:
+                    pass  # the client is already gone
+    
+    def close_processing(discard=False):
+        with latest_changed:
+            if discard:
+                latest['text'] = None
+            latest['closed'] = True
+            latest_changed.notify()
+        processor.join()
+    
+    processor = threading.Thread(target=process_latest, name='dictation-inference', daemon=True)
+    processor.start()
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            stop = isinstance(message, str) and json.loads(message).get('type') == 'stop'
+            events = transcriber.finish() if stop else transcriber.feed(message)
+            for kind, text in events:
+                send({'type': kind, 'text': text})
+                if kind == 'final':
+                    # Inference starts as soon as the utterance ends, on everything dictated so far
+                    utterances.append(text)
+                    with latest_changed:
+                        latest['text'] = ' '.join(utterances)
+                        latest_changed.notify()
+            if stop:
+                # The result for the last utterance is sent before 'done'
+                close_processing()
+                send({'type': 'done', 'text': ' '.join(utterances)})
+                break
+    except Exception as e:
+        try:
+            send({'type': 'error', 'error': f'Eroare la dictare: {str(e)}'})
+        except Exception:
+            pass  # the client is already gone
+    finally:
+        close_processing(discard=True)
+
+if Sock is not None:
+    Sock(app).route('/ws/dictation')(dictation_socket)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue text or audio processing in the background; returns a job id immediately"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    
+    params = request.get_json(silent=True) or request.form
+    try:
+        profile = testModel.resolve_profile(params.get('profile'), params.get('latency_budget_ms'))
+        sections = resolve_sections(params)
+    except ValueError as e:
+        return jsonify({'error': f'Parametri de decodare invalizi: {str(e)}'}), 400
+    
+    job_args = {
+        'profile': profile,
+        'sections': sections,
+        'patient_info': {
+            'nume': session.get('full_name', ''),
+            'varsta': None,
+            'sex': None
+        }
+    }
+    
+    # Audio is only read here; conversion happens on the worker
+    if 'audio_file' in request.files:
+        audio_file = request.files['audio_file']
+        if not (audio_file.filename and allowed_file(audio_file.filename)):
+            return jsonify({'error': 'Fișier audio invalid sau format neacceptat'}), 400
+        job_args['audio_data'] = audio_file.read()
+        job_args['audio_filename'] = audio_file.filename
+        kind = 'audio'
+    else:
+        input_text = str(params.get('text', '')).strip()
+        if not input_text:
+            return jsonify({'error': 'Text sau fișier audio necesar'}), 400
+        job_args['input_text'] = input_text
+        kind = 'text'
+    
+    try:
+        job_id = job_manager.submit(session['user_id'], kind, run_process_job, **job_args)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('get_job_status', job_id=job_id),
+        'result_url': url_for('get_job_result', job_id=job_id)
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Job status (without the result payload)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    
+    job = job_manager.get(job_id, user_id=session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job negăsit'}), 404
+    job.pop('result')
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Job result once finished (202 while it is still queued or running)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    
+    job = job_manager.get(job_id, user_id=session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job negăsit'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error'] or 'Eroare la procesare', 'status': job['status']}), 500
+    if job['status'] != 'done':
+        return jsonify({'status': job['status']}), 202
+    return jsonify(job['result'])
+
+@app.route('/api/batch', methods=['POST'])
+def process_batch():
+    """Process a JSONL upload (file 'jsonl_file' or raw body), streaming one JSONL result line per record.
+    The raw body is read line by line, so it can be of any size (BATCH_MAX_CONTENT_LENGTH, not MAX_CONTENT_LENGTH);
+    a 'jsonl_file' upload is first spooled to a temp file. Pass ?start_line=N to resume after the last line already received"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    
+    try:
+        profile = testModel.resolve_profile(request.args.get('profile'), request.args.get('latency_budget_ms'))
+        start_line = int(request.args.get('start_line', 0))
+        batch_size = max(1, min(int(request.args.get('batch_size', app.config['BATCH_MAX_SIZE'])), 64))
+        sections = resolve_sections(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Parametri invalizi: {str(e)}'}), 400
+    
+    if 'jsonl_file' in request.files:
+        lines = request.files['jsonl_file'].stream
+    else:
+        lines = request.stream
+    
+    patient_info = {
+        'nume': session.get('full_name', ''),
+        'varsta': None,
+        'sex': None
+    }
+    
+    def results():
+        try:
+            for out in bulk.process_lines(lines, model_dir=app.config['MODEL_DIR'], batch_size=batch_size,
+                                          profile=profile, start_line=start_line, patient_info=patient_info,
+                                          load_options=model_load_options(), sections=sections,
+                                          runner=inference_pool.generate_texts if inference_pool else None,
+                                          long_input_chunking=app.config['LONG_INPUT_CHUNKING']):
+                yield json.dumps(out, ensure_ascii=False) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': f'Eroare la procesarea batch-ului: {str(e)}'}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model():
+    """Reload the model from disk (admin only), e.g. after a new fine-tuning run"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    if session.get('username') != 'admin':
+        return jsonify({'error': 'Acces neautorizat'}), 403
+    
+    try:
+        if inference_pool:
+            # The model lives in the worker replicas, not in the server process
+            return jsonify({'success': True, 'models': inference_pool.reload()})
+        testModel.reload_model(app.config['MODEL_DIR'], **model_load_options())
+        return jsonify({'success': True, 'models': testModel.loaded_models()})
+    except Exception as e:
+        return jsonify({'error': f'Eroare la reîncărcarea modelului: {str(e)}'}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Inference metrics for monitoring (admin only; no patient data, but process and model details)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Autentificare necesară'}), 401
+    if session.get('username') != 'admin':
+        return jsonify({'error': 'Acces neautorizat'}), 403
+    
+    return jsonify({
+        'scheduler': scheduler.metrics(),
+        'result_cache': result_cache.metrics(),
+        'decoding_profiles': testModel.profile_stats(),
+        'section_stopping': testModel.section_stop_stats(),
+        'jobs': job_manager.metrics(),
+        'database': database.stats(),
+        'inference_pool': inference_pool.metrics() if inference_pool else None,
+        'asr': asr_backend.metrics(),
+        'models': testModel.loaded_models(),
+        'memory': dict(testModel.memory_report() or {}, pid=os.getpid())
+    })
+
 @app.route('/api/save-result', methods=['POST'])
 def save_result():
     """Save result to file when user clicks download button"""
@@ -0,0 +1,110 @@
+"""
+Decodare speculativă cu propuneri din prompt (prompt lookup / input copy).
+
+Notele generate copiază des fragmente din textul clinicianului (denumiri de medicamente, doze,
+moduri de administrare). La fiecare pas, ultimele n tokenuri generate sunt căutate în prompt, iar
+tokenurile care le urmează acolo sunt propuse ca continuare. Propunerea este verificată într-un
+singur forward al decoderului: se acceptă cel mai lung prefix pe care decodarea greedy l-ar fi
+produs oricum, plus tokenul prezis după el. Rezultatul este identic cu decodarea greedy, dar un
+fragment copiat costă un singur pas în loc de câte un pas per token.
+"""
+import torch
+
+
+def _ngram_index(source, ngram_size):
+    """Pozițiile (în ordine) la care începe fiecare n-gram din source, pentru n = 1..ngram_size."""
+    index = {}
+    for n in range(1, ngram_size + 1):
+        for i in range(len(source) - n + 1):
+            index.setdefault(tuple(source[i:i + n]), []).append(i)
+    return index
+
+
+def _draft(source, index, generated, ngram_size, num_draft, copy_end):
+    """
+    Tokenurile care urmează în source după cel mai lung sufix al lui generated găsit acolo.
+    Dintre aparițiile sufixului e preferată prima de după fragmentul copiat anterior (copy_end),
+    ca o copiere începută să continue pe același loc. Returnează (propunere, poziția ei în source).
+    """
+    for n in range(min(ngram_size, len(generated) - 1), 0, -1):
+        positions = index.get(tuple(generated[-n:]))
+        if not positions:
+            continue
+        candidates = [p + n for p in positions if p + n < len(source)]
+        if not candidates:
+            continue
+        start = next((p for p in candidates if p >= copy_end), candidates[0])
+        return source[start:start + num_draft], start
+    return [], 0
+
+
+def _crop_past(past_key_values, length):
+    """Păstrează în cache-ul self-attention doar primele length poziții (cache-ul cross-attention rămâne)."""
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(length)
+        return past_key_values
+    # Format vechi: per strat (self_k, self_v, cross_k, cross_v), cu lungimea secvenței pe dimensiunea 2
+    return tuple((layer[0][:, :, :length], layer[1][:, :, :length]) + tuple(layer[2:]) for layer in past_key_values)
+
+
+def prompt_lookup_generate(model, input_ids, attention_mask=None, max_length=200, num_draft=10, ngram_size=3):
+    """
+    Decodare greedy speculativă pentru un singur prompt (input_ids de formă (1, L)).
+    Returnează (id-urile generate, inclusiv tokenul de start al decoderului, statistici), unde
+    statisticile sunt: steps (forward-uri ale decoderului), tokens, drafted, accepted.
+    """
+    if not hasattr(model, "get_encoder"):
+        raise ValueError("Decodarea speculativă necesită un model PyTorch (backend torch)")
+    config = model.config
+    eos_token_id = config.eos_token_id
+    source = input_ids[0].tolist()
+    if source and source[-1] == eos_token_id:
+        source = source[:-1]  # </s> din prompt nu trebuie copiat în output
+    index = _ngram_index(source, ngram_size)
+
+    encoder_outputs = model.get_encoder()(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+    generated = [config.decoder_start_token_id]
+    cached = 0  # câte tokenuri din generated sunt deja în past_key_values
+    past_key_values = None
+    copy_end = 0
+    stats = {"steps": 0, "tokens": 0, "drafted": 0, "accepted": 0}
+
+    while len(generated) < max_length:
+        draft, draft_start = _draft(source, index, generated, ngram_size, num_draft, copy_end)
+        draft = draft[:max_length - len(generated) - 1]  # loc pentru tokenul prezis după propunere
+        feed = generated[cached:] + draft
+        out = model(encoder_outputs=encoder_outputs, attention_mask=attention_mask,
+                    decoder_input_ids=torch.tensor([feed], device=input_ids.device),
+                    past_key_values=past_key_values, use_cache=True, return_dict=True)
+        # predicted[j] = tokenul greedy după generated + draft[:j]
+        predicted = out.logits[0, -(len(draft) + 1):].argmax(-1).tolist()
+        accepted = 0
+        while accepted < len(draft) and predicted[accepted] == draft[accepted]:
+            accepted += 1
+        new_tokens = draft[:accepted] + [predicted[accepted]]
+
+        stats["steps"] += 1
+        stats["drafted"] += len(draft)
+        stats["accepted"] += accepted
+        if accepted:
+            copy_end = draft_start + accepted
+        # pozițiile propunerii respinse sunt scoase din cache
+        past_key_values = _crop_past(out.past_key_values, len(generated) + accepted)
+        generated.extend(new_tokens)
+        cached = len(generated) - 1
+
+        if eos_token_id in new_tokens:
+            generated = generated[:generated.index(eos_token_id, len(generated) - len(new_tokens)) + 1]
+            break
+
+    stats["tokens"] = len(generated) - 1
+    return generated, stats
+
+
+def summarize(stats):
+    """Statisticile agregate: rata de acceptare a propunerilor și tokenuri per forward."""
+    return {
+        **stats,
+        "acceptance_rate": stats["accepted"] / stats["drafted"] if stats["drafted"] else 0.0,
+        "tokens_per_step": stats["tokens"] / stats["steps"] if stats["steps"] else 0.0,
+    }
@@ -0,0 +1,256 @@
+"""
+Decodare constrânsă pentru output-ul structurat (JSON) al modelului.
+
+Schema cu cele patru chei (boala, medicamente_recomandate cu nume/doza/administrare,
+investigatii_recomandate, recomandari_suplimentare) este compilată într-un automat pe caractere.
+La fiecare pas de generare, tokenurile care ar ieși din schemă primesc scor -inf, iar după acolada
+de închidere singurul token permis este </s>. Orice output terminat este astfel JSON valid, cu
+cheile în ordinea din STRUCTURED_INSTRUCTION.
+
+Automatul și măștile de tokenuri (calculate o singură dată per stare, parcurgând un trie al
+vocabularului grupat după primul caracter) sunt cache-uite per tokenizer.
+"""
+import threading
+import weakref
+
+import torch
+from transformers import LogitsProcessor
+
+# Caracterele structurale care trebuie să existe ca tokenuri (eventual precedate de spațiu)
+_STRUCTURAL_CHARS = '{}[]":,'
+_ESCAPES = set('"\\/bfnrt')
+
+
+def _string_char(c):
+    return c not in '"\\' and ord(c) >= 0x20
+
+
+def _escape_char(c):
+    return c in _ESCAPES
+
+
+class _NFA:
+    """Automat nedeterminist pe caractere, construit din combinatori (literal, string, listă, obiect)."""
+
+    def __init__(self):
+        self.edges = []  # per nod: [(caracter sau predicat, nod destinație)]
+        self.eps = []    # per nod: tranziții fără caracter
+        self.start = self.node()
+
+    def node(self):
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    def literal(self, start, text):
+        current = start
+        for c in text:
+            nxt = self.node()
+            self.edges[current].append((c, nxt))
+            current = nxt
+        return current
+
+    def whitespace(self, start):
+        """Spații opționale (tokenurile SentencePiece încep adesea cu spațiu)."""
+        loop = self.node()
+        self.eps[start].append(loop)
+        self.edges[loop].append((' ', loop))
+        return loop
+
+    def string(self, start):
+        body = self.literal(start, '"')
+        escape = self.node()
+        self.edges[body].append((_string_char, body))
+        self.edges[body].append(('\\', escape))
+        self.edges[escape].append((_escape_char, body))
+        return self.literal(body, '"')
+
+    def array(self, start, item):
+        opened = self.whitespace(self.literal(start, '['))
+        closed = self.node()
+        self.edges[opened].append((']', closed))
+        item_start = self.node()
+        self.eps[opened].append(item_start)
+        after = self.whitespace(item(item_start))
+        self.edges[after].append((']', closed))
+        # după virgulă urmează obligatoriu un alt element (fără virgulă finală)
+        self.eps[self.whitespace(self.literal(after, ','))].append(item_start)
+        return closed
+
+    def object(self, start, fields):
+        current = self.literal(start, '{')
+        for i, (key, value) in enumerate(fields):
+            current = self.whitespace(current)
+            if i:
+                current = self.whitespace(self.literal(current, ','))
+            current = self.whitespace(self.literal(current, f'"{key}"'))
+            current = self.whitespace(self.literal(current, ':'))
+            current = value(self, current)
+        return self.literal(self.whitespace(current), '}')
+
+
+def _string(nfa, start):
+    return nfa.string(start)
+
+
+def _string_list(nfa, start):
+    return nfa.array(start, nfa.string)
+
+
+def _medication(nfa, start):
+    return nfa.object(start, [("nume", _string), ("doza", _string), ("administrare", _string)])
+
+
+def _medication_list(nfa, start):
+    return nfa.array(start, lambda item_start: _medication(nfa, item_start))
+
+
+STRUCTURED_SCHEMA = [
+    ("boala", _string),
+    ("medicamente_recomandate", _medication_list),
+    ("investigatii_recomandate", _string_list),
+    ("recomandari_suplimentare", _string_list),
+]
+
+
+class JSONSchemaConstraint:
+    """
+    Automatul schemei, determinizat leneș (o stare = mulțimea nodurilor active), și măștile de
+    tokenuri permise per stare. Este independent de request și poate fi partajat între thread-uri.
+    """
+
+    def __init__(self, tokenizer, schema=STRUCTURED_SCHEMA):
+        nfa = _NFA()
+        self.final = nfa.object(nfa.whitespace(nfa.start), schema)
+        self._nfa = nfa
+        self.initial = self._closure({nfa.start})
+        self.eos_token_id = tokenizer.eos_token_id
+        self._transitions = {}
+        self._token_transitions = {}
+        self._allowed = {}
+
+        # Textul adăugat de fiecare token ('▁' marchează spațiul din SentencePiece); tokenurile
+        # speciale (</s>, <pad>, <extra_id_*>) nu pot apărea în JSON
+        special = set(tokenizer.all_special_ids)
+        self._token_text = {}
+        self._trie = {}
+        for token_id, piece in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+            if token_id in special or not piece:
+                continue
+            text = piece.replace('▁', ' ')
+            self._token_text[token_id] = text
+            node = self._trie
+            for c in text:
+                node = node.setdefault(c, {})
+            node.setdefault(None, []).append(token_id)
+
+        missing = [c for c in _STRUCTURAL_CHARS
+                   if not any(text.lstrip(' ') == c for text in self._token_text.values())]
+        if missing:
+            raise ValueError(f"Vocabularul tokenizer-ului nu poate reprezenta caracterele JSON: {' '.join(missing)}")
+
+    def _closure(self, nodes):
+        stack = list(nodes)
+        seen = set(nodes)
+        while stack:
+            for nxt in self._nfa.eps[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return frozenset(seen)
+
+    def step(self, state, c):
+        """Starea după caracterul c, sau None dacă c iese din schemă."""
+        key = (state, c)
+        if key not in self._transitions:
+            targets = {target for node in state for match, target in self._nfa.edges[node]
+                       if (match == c if isinstance(match, str) else match(c))}
+            self._transitions[key] = self._closure(targets) if targets else None
+        return self._transitions[key]
+
+    def advance(self, state, token_id):
+        """Starea după tokenul token_id; None dacă tokenul nu e permis. </s> păstrează starea."""
+        if state is None or token_id == self.eos_token_id:
+            return state
+        key = (state, token_id)
+        if key not in self._token_transitions:
+            nxt = state
+            for c in self._token_text.get(token_id, '\0'):
+                nxt = self.step(nxt, c)
+                if nxt is None:
+                    break
+            self._token_transitions[key] = nxt
+        return self._token_transitions[key]
+
+    def is_complete(self, state):
+        return state is not None and self.final in state
+
+    def allowed_token_ids(self, state):
+        """Tensorul id-urilor de tokenuri permise în starea dată (cache-uit)."""
+        allowed = self._allowed.get(state)
+        if allowed is None:
+            ids = []
+            if state is not None:
+                # Parcurgerea trie-ului abandonează imediat ramurile al căror prim caracter nu e permis
+                stack = [(self._trie, state)]
+                while stack:
+                    node, current = stack.pop()
+                    for c, child in node.items():
+                        if c is None:
+                            continue
+                        nxt = self.step(current, c)
+                        if nxt is None:
+                            continue
+                        ids.extend(child.get(None, ()))
+                        stack.append((child, nxt))
+            if state is None or self.is_complete(state):
+                ids.append(self.eos_token_id)
+            allowed = torch.tensor(sorted(ids), dtype=torch.long)
+            self._allowed[state] = allowed
+        return allowed
+
+
+class JSONSchemaLogitsProcessor(LogitsProcessor):
+    """
+    LogitsProcessor pentru un singur apel model.generate: urmărește starea automatului pentru
+    fiecare secvență (rază) și lasă doar tokenurile permise de schemă.
+    """
+
+    def __init__(self, constraint):
+        self.constraint = constraint
+        # starea per prefix generat (fără tokenul de start al decoderului)
+        self._states = {(): constraint.initial}
+
+    def _state(self, ids):
+        key = tuple(ids)
+        state = self._states.get(key)
+        if state is None and key not in self._states:
+            cut = len(key) - 1
+            while key[:cut] not in self._states:
+                cut -= 1
+            state = self._states[key[:cut]]
+            for i in range(cut, len(key)):
+                state = self.constraint.advance(state, key[i])
+                self._states[key[:i + 1]] = state
+        return state
+
+    def __call__(self, input_ids, scores):
+        mask = torch.full_like(scores, float('-inf'))
+        for row, ids in enumerate(input_ids.tolist()):
+            allowed = self.constraint.allowed_token_ids(self._state(ids[1:]))
+            mask[row, allowed.to(scores.device)] = 0
+        return scores + mask
+
+
+_CONSTRAINT_CACHE = weakref.WeakKeyDictionary()
+_CONSTRAINT_LOCK = threading.Lock()
+
+
+def get_constraint(tokenizer):
+    """Automatul schemei structurate pentru tokenizer, construit o singură dată."""
+    with _CONSTRAINT_LOCK:
+        constraint = _CONSTRAINT_CACHE.get(tokenizer)
+        if constraint is None:
+            constraint = JSONSchemaConstraint(tokenizer)
+            _CONSTRAINT_CACHE[tokenizer] = constraint
+        return constraint
@@ -1,114 +1,787 @@
 import argparse
+import difflib
+import hashlib
+import itertools
 import json
+import re
+import shutil
+import sys
+import threading
+import time
+import weakref
+from collections import deque
 import torch
-from transformers import T5Tokenizer, T5ForConditionalGeneration
+from transformers import (T5Config, T5Tokenizer, T5ForConditionalGeneration, GenerationConfig, LogitsProcessorList,
+                          StoppingCriteriaList)
 
 import os
+import json_stream
+import section_stopping
+import speculative
+import structured_decoding
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(BASE_DIR)
 MODEL_DIR = os.path.join(PARENT_DIR, "data", "models", "finetuned_t5_model")
 MAX_INPUT_LEN = 256
 MAX_OUTPUT_LEN = 300
+PROMPT_PREFIX = "Completează fișa medicală: "
 
-def run_with_input(input_text, structured=False, model_dir=MODEL_DIR, max_out_len=MAX_OUTPUT_LEN):
+# Profiluri de decodare, de la cel mai ieftin la cel mai scump (ordinea contează pentru bugetul de latență)
+DECODING_PROFILES = {
+    "fast": {"num_beams": 1, "max_length": 200},  # greedy
+    "balanced": {"num_beams": 4, "max_length": MAX_OUTPUT_LEN},
+    "quality": {"num_beams": 5, "max_length": MAX_OUTPUT_LEN},
+}
+DEFAULT_TEXT_PROFILE = "balanced"
+DEFAULT_STRUCTURED_PROFILE = "quality"
+
+# Motoarele de inferență acceptate de load_model (None = PyTorch eager)
+MODEL_BACKENDS = (None, "torch", "onnx")
+
+def build_input(text):
+    """Adaugă prefixul de task folosit la antrenare."""
+    return f"{PROMPT_PREFIX}{text}"
+
+def run_with_input(input_text, structured=False, model_dir=MODEL_DIR, max_out_len=MAX_OUTPUT_LEN,
+                   profile=None, latency_budget_ms=None, constrained=False, **load_options):
     """
     Rulează procesul de generare pentru un text (sau listă de texte) și returnează rezultatul.
     - input_text: str sau list[str]
     - structured: if True returnează structurat (JSON normalizat), altfel text generat
+    - profile / latency_budget_ms: profilul de decodare (vezi resolve_profile)
+    - constrained: pentru structured, decodare limitată la schema JSON (vezi generate_structured)
+    - load_options: opțiuni de încărcare a modelului (vezi load_model)
     - returnează dict sau list[dict]
     """
-    tokenizer, model, device = load_model(model_dir=model_dir)
+    tokenizer, model, device = get_model(model_dir=model_dir, **load_options)
+    profile = resolve_profile(profile, latency_budget_ms, structured=structured)
 
     if isinstance(input_text, list):
-        inputs = [f"Completează fișa medicală: {t}" for t in input_text]
+        inputs = [build_input(t) for t in input_text]
     else:
-        inputs = [f"Completează fișa medicală: {input_text}"]
+        inputs = [build_input(input_text)]
 
     if structured:
-        res = generate_structured(tokenizer, model, device, inputs, max_out_len)
+        res = generate_structured(tokenizer, model, device, inputs, max_out_len, profile=profile,
+                                  constrained=constrained)
         # dacă a fost un singur text, returnăm un singur obiect
         return res if len(res) > 1 else (res[0] if res else {})
     else:
-        preds = generate_texts(tokenizer, model, device, inputs, max_out_len)
+        preds = generate_texts(tokenizer, model, device, inputs, max_out_len, profile=profile)
         outs = [{"generated_text": p} for p in preds]
         return outs if len(outs) > 1 else outs[0]
 
-def load_model(model_dir=MODEL_DIR):
+def load_model(model_dir=MODEL_DIR, quantize=False, mmap=False, backend=None):
+    """
+    Încarcă tokenizer-ul și modelul.
+    - quantize: modelul cu straturile liniare cuantizate dinamic la int8 (doar CPU), cache-uit pe disc
+    - mmap: greutățile sunt vederi read-only peste model.safetensors mapat în memorie (doar CPU),
+      astfel încât procesele care încarcă același fișier își împart paginile fizice
+    - backend: None / "torch" (PyTorch eager) sau "onnx": encoder-ul și decoder-ul cu past exportate
+      în ONNX Runtime (CPU), cache-uite pe disc; modelul are aceeași interfață generate()
+    """
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Backend necunoscut: {backend} (disponibile: {', '.join(b for b in MODEL_BACKENDS if b)})")
+    if quantize and mmap:
+        raise ValueError("quantize și mmap nu pot fi folosite împreună")
+    if backend == "onnx" and (quantize or mmap):
+        raise ValueError("backend-ul onnx nu se combină cu quantize sau mmap")
     tokenizer = T5Tokenizer.from_pretrained(model_dir)
-    model = T5ForConditionalGeneration.from_pretrained(model_dir)
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if backend == "onnx":
+        # Sesiunile ONNX Runtime nu au .to()/.eval() ca un nn.Module; rulează pe CPU
+        return tokenizer, _load_onnx_model(model_dir), torch.device("cpu")
+    if quantize:
+        model = _load_quantized_model(model_dir)
+        device = torch.device("cpu")
+    elif mmap:
+        model = _load_mmap_model(model_dir)
+        device = torch.device("cpu")
+    else:
+        model = T5ForConditionalGeneration.from_pretrained(model_dir)
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model.to(device)
+    model.eval()
     return tokenizer, model, device
 
-def generate_texts(tokenizer, model, device, inputs, max_out_len=MAX_OUTPUT_LEN):
+def model_fingerprint(model_dir=MODEL_DIR):
+    """Identificator de versiune pentru model_dir, derivat din dimensiunea și mtime-ul fișierelor modelului."""
+    parts = [os.path.abspath(model_dir)]
+    for name in ("config.json", "generation_config.json", "model.safetensors", "pytorch_model.bin", "spiece.model"):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            parts.append(f"{name}:{st.st_size}:{int(st.st_mtime)}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def quantized_cache_dir(model_dir=MODEL_DIR):
+    """Directorul (lângă model_dir) în care se păstrează artefactul int8."""
+    return os.path.abspath(model_dir).rstrip(os.sep) + "-int8"
+
+def onnx_cache_dir(model_dir=MODEL_DIR):
+    """Directorul (lângă model_dir) cu exporturile ONNX, câte un subdirector per amprentă a modelului."""
+    return os.path.abspath(model_dir).rstrip(os.sep) + "-onnx"
+
+def _load_onnx_model(model_dir):
+    """
+    Exportă modelul în ONNX (encoder, decoder și decoder-with-past) la prima folosire și îl încarcă
+    în ONNX Runtime. Exportul este salvat în onnx_cache_dir(model_dir)/<amprentă>, deci un model
+    reantrenat este reexportat automat; exporturile versiunilor vechi sunt șterse.
+    """
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError("Backend-ul onnx necesită optimum cu onnxruntime: pip install optimum[onnxruntime]") from e
+
+    cache_root = onnx_cache_dir(model_dir)
+    fingerprint = model_fingerprint(model_dir)
+    export_dir = os.path.join(cache_root, fingerprint)
+    if not os.path.isdir(export_dir):
+        # Export într-un director temporar, redenumit la final: procesele care pornesc simultan
+        # (ex. workerii de inferență) nu văd niciodată un export pe jumătate scris
+        tmp_dir = os.path.join(cache_root, f".{fingerprint}.tmp-{os.getpid()}")
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_dir, export=True, use_cache=True)
+        model.save_pretrained(tmp_dir)
+        try:
+            os.rename(tmp_dir, export_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)  # alt proces a terminat primul
+        for name in os.listdir(cache_root):
+            if name != fingerprint and not name.startswith("."):
+                shutil.rmtree(os.path.join(cache_root, name), ignore_errors=True)
+    # Același număr de thread-uri ca PyTorch (limitat per worker de InferencePool)
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = torch.get_num_threads()
+    return ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True, provider="CPUExecutionProvider",
+                                                session_options=session_options)
+
+def _quantize(model):
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _with_generation_config(model, model_dir):
+    """
+    Setările de decodare din generation_config.json: from_pretrained le citește, dar un model construit
+    direct din config (cuantizat din cache, mmap) ar rămâne cu cele implicite și ar decoda altfel.
+    """
+    if os.path.exists(os.path.join(model_dir, "generation_config.json")):
+        model.generation_config = GenerationConfig.from_pretrained(model_dir)
+    return model
+
+def _load_quantized_model(model_dir):
+    """
+    Cuantizare dinamică int8 a straturilor liniare. Rezultatul este salvat lângă model_dir,
+    împreună cu amprenta modelului sursă, ca pornirile următoare să nu refacă conversia.
+    """
+    cache_dir = quantized_cache_dir(model_dir)
+    weights_path = os.path.join(cache_dir, "model_int8.pt")
+    stamp_path = os.path.join(cache_dir, "source_fingerprint.txt")
+    fingerprint = model_fingerprint(model_dir)
+
+    cached = False
+    if os.path.exists(weights_path) and os.path.exists(stamp_path):
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            cached = f.read().strip() == fingerprint
+
+    if cached:
+        # Structura cuantizată se reconstruiește din config, apoi se încarcă greutățile int8
+        model = _quantize(T5ForConditionalGeneration(T5Config.from_pretrained(model_dir)).eval())
+        model.load_state_dict(torch.load(weights_path, map_location="cpu", weights_only=False))
+        return _with_generation_config(model, model_dir)
+
+    model = _quantize(T5ForConditionalGeneration.from_pretrained(model_dir).eval())
+    os.makedirs(cache_dir, exist_ok=True)
+    torch.save(model.state_dict(), weights_path)
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        f.write(fingerprint)
+    return model
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+def _mmap_safetensors(path):
+    """
+    Tensorii din fișierul safetensors ca vederi peste un mmap privat (copy-on-write) al fișierului.
+    Paginile sunt citite din page cache-ul kernelului la primul acces și nu sunt copiate cât timp
+    nu se scrie în ele, deci toate procesele care mapează fișierul folosesc aceeași memorie fizică.
+    """
+    with open(path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    data_start = 8 + header_len
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    file_bytes = torch.empty(0, dtype=torch.uint8).set_(storage)
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        raw = file_bytes[data_start + begin:data_start + end]
+        if raw.storage_offset() % torch.empty(0, dtype=dtype).element_size():
+            # offset nealiniat la dimensiunea elementului: singurul caz în care tensorul se copiază
+            raw = raw.clone()
+        tensors[name] = raw.view(dtype).view(info["shape"])
+    return tensors
+
+def _set_tensor(model, name, tensor):
+    module_name, _, attr = name.rpartition(".")
+    module = model.get_submodule(module_name)
+    if attr in module._parameters:
+        module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+    elif attr in module._buffers:
+        module._buffers[attr] = tensor
+    else:
+        return False
+    return True
+
+def _load_mmap_model(model_dir):
+    """Construiește modelul fără greutăți (device meta) și îi atașează tensorii mapați din model.safetensors."""
+    path = os.path.join(model_dir, "model.safetensors")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Încărcarea mmap necesită {path}")
+
+    config = T5Config.from_pretrained(model_dir)
+    with torch.device("meta"):
+        model = T5ForConditionalGeneration(config)
+    unexpected = []
+    for name, tensor in _mmap_safetensors(path).items():
+        if tensor.is_floating_point() and tensor.dtype != torch.float32:
+            # aceeași conversie ca from_pretrained; tensorii convertiți nu mai sunt partajați
+            tensor = tensor.float()
+        if not _set_tensor(model, name, tensor):
+            unexpected.append(name)
+    # lm_head / embed_tokens sunt legate de shared.weight și lipsesc de obicei din fișier
+    model.tie_weights()
+
+    missing = [name for name, t in itertools.chain(model.named_parameters(), model.named_buffers()) if t.is_meta]
+    if missing:
+        raise ValueError(f"Greutăți lipsă în {path}: {', '.join(missing)}")
+    if unexpected:
+        print(f"Avertisment: tensori necunoscuți ignorați din {path}: {', '.join(unexpected)}")
+    return _with_generation_config(model, model_dir)
+
+def memory_report(pid=None):
+    """
+    Memoria unui proces (implicit cel curent) din /proc/<pid>/smaps_rollup, în MB:
+    rss (rezidentă), pss (proporțională, paginile partajate împărțite între procese),
+    shared (pagini folosite și de alte procese) și private. None în afara Linux-ului.
+    """
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return None
+
+    def mb(*names):
+        return round(sum(fields.get(name, 0) for name in names) / 1024.0, 1)
+
+    return {
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "shared_mb": mb("Shared_Clean", "Shared_Dirty"),
+        "private_mb": mb("Private_Clean", "Private_Dirty"),
+    }
+
+# Registry de modele rezidente: fiecare model_dir (cu opțiunile lui de încărcare) este încărcat
+# o singură dată per proces și partajat de toate request-urile (server) sau apelurile din CLI.
+_MODEL_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def _registry_key(model_dir, load_options):
+    return (os.path.abspath(model_dir), tuple(sorted((k, v) for k, v in load_options.items() if v)))
+
+def get_model(model_dir=MODEL_DIR, **load_options):
+    """
+    Returnează (tokenizer, model, device) pentru model_dir, încărcând modelul doar la primul apel.
+    Apelurile concurente pentru același model_dir așteaptă o singură încărcare.
+    load_options sunt transmise la load_model (ex. quantize=True) și fac parte din cheie.
+    """
+    key = _registry_key(model_dir, load_options)
+    with _REGISTRY_LOCK:
+        entry = _MODEL_REGISTRY.get(key)
+        if entry is None:
+            entry = {"lock": threading.Lock(), "handle": None, "loaded_at": None, "last_used": None}
+            _MODEL_REGISTRY[key] = entry
+    with entry["lock"]:
+        if entry["handle"] is None:
+            entry["handle"] = load_model(model_dir=model_dir, **load_options)
+            entry["loaded_at"] = time.time()
+        entry["last_used"] = time.time()
+        return entry["handle"]
+
+_TOKENIZERS = {}
+
+def get_tokenizer(model_dir=MODEL_DIR):
+    """Doar tokenizer-ul lui model_dir (ex. pentru împărțirea intrărilor în procesul serverului, când
+    modelul rulează în workeri), încărcat o singură dată."""
+    key = os.path.abspath(model_dir)
+    with _REGISTRY_LOCK:
+        tokenizer = _TOKENIZERS.get(key)
+        if tokenizer is None:
+            tokenizer = T5Tokenizer.from_pretrained(model_dir)
+            _TOKENIZERS[key] = tokenizer
+        return tokenizer
+
+def warmup_model(model_dir=MODEL_DIR, **load_options):
+    """Încarcă modelul în registry (ex. la pornirea serverului) și rulează o generare scurtă de încălzire."""
+    tokenizer, model, device = get_model(model_dir=model_dir, **load_options)
+    generate_texts(tokenizer, model, device, [build_input("tuse")], max_out_len=8, record_latency=False)
+    return tokenizer, model, device
+
+def reload_model(model_dir=MODEL_DIR, **load_options):
+    """Reîncarcă explicit modelul de pe disc (ex. după un nou fine-tuning)."""
+    evict_model(model_dir)
+    return get_model(model_dir=model_dir, **load_options)
+
+def _evict_key(key):
+    with _REGISTRY_LOCK:
+        entry = _MODEL_REGISTRY.pop(key, None)
+    if entry is None or entry["handle"] is None:
+        return False
+    entry["handle"] = None
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return True
+
+def evict_model(model_dir=MODEL_DIR):
+    """Scoate din registry toate variantele încărcate din model_dir; returnează True dacă exista vreuna."""
+    path = os.path.abspath(model_dir)
+    with _REGISTRY_LOCK:
+        keys = [key for key in _MODEL_REGISTRY if key[0] == path]
+    evicted = [_evict_key(key) for key in keys]
+    return any(evicted)
+
+def evict_idle_models(max_idle_seconds):
+    """Scoate din registry modelele nefolosite de cel puțin max_idle_seconds; returnează lista celor scoase."""
+    now = time.time()
+    with _REGISTRY_LOCK:
+        idle = [key for key, entry in _MODEL_REGISTRY.items()
+                if entry["last_used"] is not None and now - entry["last_used"] >= max_idle_seconds]
+    for key in idle:
+        _evict_key(key)
+    return [{"model_dir": key[0], "options": dict(key[1])} for key in idle]
+
+def loaded_models():
+    """Returnează informații despre modelele rezidente (pentru monitorizare)."""
+    with _REGISTRY_LOCK:
+        return [
+            {"model_dir": key[0], "options": dict(key[1]),
+             "loaded_at": entry["loaded_at"], "last_used": entry["last_used"]}
+            for key, entry in _MODEL_REGISTRY.items() if entry["handle"] is not None
+        ]
+
+# Istoricul latenței (secunde per request) pentru fiecare profil, folosit de modul cu buget de latență
+_PROFILE_LATENCY = {name: deque(maxlen=50) for name in DECODING_PROFILES}
+_LATENCY_LOCK = threading.Lock()
+
+def generation_kwargs(profile, max_out_len=MAX_OUTPUT_LEN):
+    """Parametrii model.generate pentru un profil de decodare."""
+    if profile not in DECODING_PROFILES:
+        raise ValueError(f"Profil de decodare necunoscut: {profile} (disponibile: {', '.join(DECODING_PROFILES)})")
+    cfg = DECODING_PROFILES[profile]
+    kwargs = {"max_length": min(max_out_len, cfg["max_length"]), "num_beams": cfg["num_beams"], "do_sample": False}
+    if cfg["num_beams"] > 1:
+        kwargs["early_stopping"] = True
+    return kwargs
+
+def record_profile_latency(profile, seconds):
+    with _LATENCY_LOCK:
+        _PROFILE_LATENCY[profile].append(seconds)
+
+def estimate_profile_latency(profile):
+    """Latența estimată (secunde, percentila 90 din istoric) sau None dacă profilul nu a fost încă rulat."""
+    with _LATENCY_LOCK:
+        history = sorted(_PROFILE_LATENCY[profile])
+    if not history:
+        return None
+    return history[min(len(history) - 1, int(len(history) * 0.9))]
+
+# La fiecare al BUDGET_EXPLORE_EVERY-lea request cu buget, profilul imediat mai scump decât cel ales
+# este încercat cât timp are mai puțin de BUDGET_MIN_SAMPLES măsurători
+BUDGET_EXPLORE_EVERY = 20
+BUDGET_MIN_SAMPLES = 5
+_BUDGET_REQUESTS = itertools.count(1)
+
+def _profile_cost(profile):
+    cfg = DECODING_PROFILES[profile]
+    return cfg["num_beams"] * cfg["max_length"]
+
+def profile_latency_estimates():
+    """
+    Latența estimată (secunde) per profil: percentila 90 din istoric sau, pentru un profil încă nerulat,
+    latența celui mai apropiat profil măsurat scalată cu num_beams x max_length. None dacă niciun
+    profil nu a fost rulat.
+    """
+    measured = {name: estimate_profile_latency(name) for name in DECODING_PROFILES}
+    known = [name for name, estimate in measured.items() if estimate is not None]
+    estimates = {}
+    for name, estimate in measured.items():
+        if estimate is None and known:
+            reference = min(known, key=lambda k: abs(_profile_cost(k) - _profile_cost(name)))
+            estimate = measured[reference] * _profile_cost(name) / _profile_cost(reference)
+        estimates[name] = estimate
+    return estimates
+
+def select_profile_for_budget(latency_budget_ms):
+    """
+    Cel mai scump profil estimat să se încadreze în termen; altfel cel mai ieftin. Din când în când
+    este încercat profilul următor, dacă are puține măsurători, ca estimarea lui să nu rămână doar
+    cea derivată (altfel un profil supraestimat nu ar mai fi ales niciodată).
+    """
+    names = list(DECODING_PROFILES)
+    estimates = profile_latency_estimates()
+    chosen = next((name for name in reversed(names)
+                   if estimates[name] is not None and estimates[name] * 1000.0 <= latency_budget_ms), names[0])
+    if next(_BUDGET_REQUESTS) % BUDGET_EXPLORE_EVERY == 0 and chosen != names[-1]:
+        candidate = names[names.index(chosen) + 1]
+        with _LATENCY_LOCK:
+            samples = len(_PROFILE_LATENCY[candidate])
+        if samples < BUDGET_MIN_SAMPLES:
+            return candidate
+    return chosen
+
+def resolve_profile(profile=None, latency_budget_ms=None, structured=False):
+    """Profilul efectiv: cel cerut explicit, cel ales după bugetul de latență sau cel implicit."""
+    if profile:
+        if profile not in DECODING_PROFILES:
+            raise ValueError(f"Profil de decodare necunoscut: {profile} (disponibile: {', '.join(DECODING_PROFILES)})")
+        return profile
+    if latency_budget_ms is not None:
+        return select_profile_for_budget(float(latency_budget_ms))
+    return DEFAULT_STRUCTURED_PROFILE if structured else DEFAULT_TEXT_PROFILE
+
+def profile_stats():
+    """Latența estimată și numărul de măsurători per profil (pentru monitorizare)."""
+    stats = {}
+    estimates = profile_latency_estimates()
+    for name in DECODING_PROFILES:
+        estimate = estimate_profile_latency(name)
+        with _LATENCY_LOCK:
+            samples = len(_PROFILE_LATENCY[name])
+        stats[name] = {"p90_ms": estimate * 1000.0 if estimate is not None else None, "samples": samples,
+                       "estimate_ms": estimates[name] * 1000.0 if estimates[name] is not None else None}
+    return stats
+
+# Oprirea timpurie după secțiuni: câte generări au fost oprite și câți pași (până la max_length) s-au economisit
+_SECTION_STOP_STATS = {"generations": 0, "early_stops": 0, "steps": 0, "steps_saved": 0}
+_SECTION_STOP_LOCK = threading.Lock()
+
+def section_stop_stats():
+    with _SECTION_STOP_LOCK:
+        stats = dict(_SECTION_STOP_STATS)
+    stats["early_stop_ratio"] = stats["early_stops"] / stats["generations"] if stats["generations"] else 0.0
+    return stats
+
+def generate_texts(tokenizer, model, device, inputs, max_out_len=MAX_OUTPUT_LEN, profile=DEFAULT_TEXT_PROFILE,
+                   sections=None, record_latency=True):
+    """
+    Generează textul pentru un batch de prompturi.
+    - sections: secțiunile de format_result după care generarea se poate opri (ex. toate
+      documents.RESULT_SECTIONS sau doar ("boala",)); None = până la </s> sau max_length
+    - record_latency: False pentru generări nereprezentative (ex. încălzirea), care nu intră în
+      istoricul folosit de bugetul de latență
+    """
     enc = tokenizer(inputs, return_tensors="pt", padding=True, truncation=True, max_length=MAX_INPUT_LEN)
     enc = {k: v.to(device) for k, v in enc.items()}
+    kwargs = generation_kwargs(profile, max_out_len)
+    criteria = section_stopping.SectionStoppingCriteria(tokenizer, sections) if sections else None
+    if criteria is not None:
+        kwargs["stopping_criteria"] = StoppingCriteriaList([criteria])
+    started = time.time()
     with torch.no_grad():
-        outs = model.generate(
-            **enc,
-            max_length=max_out_len,
-            num_beams=4,
-            early_stopping=True,
-        )
+        outs = model.generate(**enc, **kwargs)
+    if record_latency:
+        record_profile_latency(profile, time.time() - started)
+    if criteria is not None:
+        with _SECTION_STOP_LOCK:
+            _SECTION_STOP_STATS["generations"] += 1
+            _SECTION_STOP_STATS["steps"] += outs.shape[-1] - 1
+            if criteria.stopped_at is not None:
+                _SECTION_STOP_STATS["early_stops"] += 1
+                _SECTION_STOP_STATS["steps_saved"] += kwargs["max_length"] - criteria.stopped_at
     return [tokenizer.decode(o, skip_special_tokens=True, clean_up_tokenization_spaces=True) for o in outs]
 
+# Granițele de propoziție la care se taie intrările lungi (semn de punctuație urmat de spațiu, sau rând nou)
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?;])\s+|\n+')
+
+def input_token_budget(tokenizer):
+    """Câte tokenuri din textul clinicianului încap în MAX_INPUT_LEN, după prefix și </s>."""
+    return MAX_INPUT_LEN - 1 - len(_prompt_token_ids(tokenizer)[0])
+
+def split_long_input(tokenizer, text, overlap_sentences=1):
+    """
+    Împarte un text mai lung decât input_token_budget în fragmente care încap fără trunchiere, tăiate
+    la granițe de propoziție (o propoziție prea lungă e tăiată între cuvinte). Fiecare fragment
+    reia ultimele overlap_sentences propoziții ale celui anterior, ca o informație aflată la graniță
+    să apară întreagă într-unul dintre ele. Fiecare propoziție e tokenizată o singură dată, deci
+    costul crește liniar cu lungimea. Un text care încape este returnat ca [text].
+    """
+    budget = input_token_budget(tokenizer)
+    sentences = [sentence.strip() for sentence in _SENTENCE_BOUNDARY_RE.split(text) if sentence.strip()]
+    if not sentences:
+        return [text]
+    lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+    if sum(lengths) <= budget:
+        return [text]
+
+    units = []
+    for sentence, length in zip(sentences, lengths):
+        if length <= budget:
+            units.append((sentence, length))
+            continue
+        words = sentence.split()
+        word_lengths = [len(ids) for ids in tokenizer(words, add_special_tokens=False)["input_ids"]]
+        piece, piece_length = [], 0
+        for word, word_length in zip(words, word_lengths):
+            if piece and piece_length + word_length > budget:
+                units.append((" ".join(piece), piece_length))
+                piece, piece_length = [], 0
+            piece.append(word)
+            piece_length += word_length
+        if piece:
+            units.append((" ".join(piece), piece_length))
+
+    chunks = []
+    chunk, chunk_length = [], 0
+    for unit in units:
+        if chunk and chunk_length + unit[1] > budget:
+            chunks.append(chunk)
+            overlap = chunk[-overlap_sentences:] if overlap_sentences else []
+            while overlap and sum(length for _, length in overlap) + unit[1] > budget:
+                overlap = overlap[1:]
+            chunk, chunk_length = list(overlap), sum(length for _, length in overlap)
+        chunk.append(unit)
+        chunk_length += unit[1]
+    chunks.append(chunk)
+    return [" ".join(sentence for sentence, _ in chunk) for chunk in chunks]
+
+def generate_texts_long(tokenizer, model, device, text, max_out_len=MAX_OUTPUT_LEN, profile=DEFAULT_TEXT_PROFILE,
+                        sections=None, overlap_sentences=1):
+    """
+    Generare pentru un text (fără prefix) care poate depăși MAX_INPUT_LEN: fragmentele din
+    split_long_input rulează ca un singur batch. Returnează (fragmentele, textul generat per
+    fragment); rezultatele formatate se combină cu documents.merge_formatted_results.
+    """
+    chunks = split_long_input(tokenizer, text, overlap_sentences)
+    preds = generate_texts(tokenizer, model, device, [build_input(chunk) for chunk in chunks], max_out_len,
+                           profile=profile, sections=sections)
+    return chunks, preds
+
+def generate_texts_speculative(tokenizer, model, device, inputs, max_out_len=MAX_OUTPUT_LEN,
+                               num_draft=10, ngram_size=3):
+    """
+    Ca generate_texts cu profilul greedy, dar cu decodare speculativă din prompt (vezi speculative):
+    fragmentele copiate din textul clinicianului sunt verificate într-un singur pas.
+    Rulează câte un prompt pe rând; returnează (textele generate, statistici agregate).
+    """
+    max_length = generation_kwargs("fast", max_out_len)["max_length"]
+    totals = {"steps": 0, "tokens": 0, "drafted": 0, "accepted": 0}
+    texts = []
+    started = time.time()
+    for text in inputs:
+        enc = tokenizer([text], return_tensors="pt", truncation=True, max_length=MAX_INPUT_LEN)
+        enc = {k: v.to(device) for k, v in enc.items()}
+        with torch.no_grad():
+            ids, stats = speculative.prompt_lookup_generate(model, enc["input_ids"], enc["attention_mask"], max_length,
+                                                            num_draft=num_draft, ngram_size=ngram_size)
+        texts.append(tokenizer.decode(ids, skip_special_tokens=True, clean_up_tokenization_spaces=True))
+        for name in totals:
+            totals[name] += stats[name]
+    elapsed = time.time() - started
+    report = speculative.summarize(totals)
+    report["tokens_per_sec"] = totals["tokens"] / elapsed if elapsed else None
+    return texts, report
+
+def _stream_kwargs(profile, max_out_len, sampling):
+    kwargs = generation_kwargs(profile, max_out_len)
+    kwargs["num_beams"] = 1
+    kwargs.pop("early_stopping", None)
+    if sampling:
+        kwargs.update({"do_sample": True, "top_p": 0.9, "temperature": 0.7})
+    return kwargs
+
+def _stream_generate(tokenizer, model, enc, kwargs, clean_up_tokenization_spaces=True):
+    """Rulează model.generate pe un thread separat și produce fragmentele de text decodate."""
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(tokenizer, skip_special_tokens=True,
+                                    clean_up_tokenization_spaces=clean_up_tokenization_spaces)
+    errors = []
+
+    def _generate():
+        try:
+            with torch.no_grad():
+                model.generate(**enc, **kwargs, streamer=streamer)
+        except Exception as e:
+            errors.append(e)
+            # deblochează consumatorul dacă generarea a eșuat
+            streamer.end()
+
+    thread = threading.Thread(target=_generate, daemon=True)
+    thread.start()
+    for chunk in streamer:
+        if chunk:
+            yield chunk
+    thread.join()
+    if errors:
+        raise errors[0]
+
+def stream_text(tokenizer, model, device, input_text, max_out_len=MAX_OUTPUT_LEN, profile="fast", sampling=False,
+                sections=None):
+    """
+    Generator care produce fragmentele de text pe măsură ce sunt decodate.
+    Streaming-ul funcționează doar cu o singură rază: greedy (implicit) sau sampling.
+    sections: oprire timpurie după secțiunile date (vezi generate_texts)
+    """
+    kwargs = _stream_kwargs(profile, max_out_len, sampling)
+    if sections:
+        kwargs["stopping_criteria"] = StoppingCriteriaList([section_stopping.SectionStoppingCriteria(tokenizer, sections)])
+    enc = tokenizer([input_text], return_tensors="pt", truncation=True, max_length=MAX_INPUT_LEN)
+    enc = {k: v.to(device) for k, v in enc.items()}
+
+    started = time.time()
+    yield from _stream_generate(tokenizer, model, enc, kwargs)
+    if not sampling:
+        record_profile_latency(profile, time.time() - started)
+
+def stream_structured(tokenizer, model, device, input_text, max_out_len=MAX_OUTPUT_LEN, profile="fast",
+                      sampling=False, constrained=False):
+    """
+    Ca stream_text, dar cu promptul structurat (JSON); fragmentele pot fi date unui
+    json_stream.IncrementalJSONParser pentru a obține câmpurile pe măsură ce sunt complete.
+    """
+    kwargs = _stream_kwargs(profile, max_out_len, sampling)
+    if constrained:
+        constraint = structured_decoding.get_constraint(tokenizer)
+        kwargs["logits_processor"] = LogitsProcessorList([structured_decoding.JSONSchemaLogitsProcessor(constraint)])
+    encoded, _ = _encode_structured_prompts(tokenizer, [input_text])
+    enc = {k: v.to(device) for k, v in tokenizer.pad({"input_ids": encoded}, return_tensors="pt").items()}
+
+    started = time.time()
+    yield from _stream_generate(tokenizer, model, enc, kwargs, clean_up_tokenization_spaces=not constrained)
+    if not sampling:
+        record_profile_latency(profile, time.time() - started)
+
 def _try_fix_and_parse_json(s):
-    s = s.strip()
-    if '{' in s and '}' in s:
-        start = s.find('{')
-        end = s.rfind('}')
-        s = s[start:end+1]
-    # common fixes: single -> double quotes
-    if "'" in s and '"' not in s:
-        s = s.replace("'", '"')
-    # remove trailing commas before closing brackets/braces
-    s = s.replace(",]", "]").replace(",}", "}")
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
+    """JSON-ul din textul generat, parsat tolerant (vezi json_stream); None dacă nu există un obiect/listă."""
+    return json_stream.parse(s)
+
+# Instrucțiunea fixă care cere modelului doar JSON valid cu cele 4 câmpuri cerute
+STRUCTURED_INSTRUCTION = ("\n\nRăspunsul trebuie să fie strict JSON valid cu următoarele chei:\n"
+        "boala (string) - numele bolii identificate,\n"
+        "medicamente_recomandate (list of objects with keys: nume, doza, administrare) - tratamentul recomandat,\n"
+        "investigatii_recomandate (list of strings) - investigații suplimentare necesare,\n"
+        "recomandari_suplimentare (list of strings) - recomandări suplimentare pentru pacient.\n"
+        "Exemplu: {\"boala\": \"astm bronșic\", "
+        "\"medicamente_recomandate\": [{\"nume\": \"Salbutamol\", \"doza\": \"100 mcg\", \"administrare\": \"inhalator\"}], "
+        "\"investigatii_recomandate\": [\"spirometrie\", \"radiografie toracică\"], "
+        "\"recomandari_suplimentare\": [\"evitați expunerea la praf\", \"monitorizare simptome\"]}\n"
+        "Returnează doar JSON valid, fără explicații.")
+
+def _normalize_structured(parsed):
+    """Normalizează structura pentru a conține întotdeauna cheile așteptate."""
+    parsed = parsed if isinstance(parsed, dict) else {}
+    return {
+        "boala": parsed.get("boala") if parsed.get("boala") is not None else None,
+        "medicamente_recomandate": parsed.get("medicamente_recomandate") if isinstance(parsed.get("medicamente_recomandate"), list) else [],
+        "investigatii_recomandate": parsed.get("investigatii_recomandate") if isinstance(parsed.get("investigatii_recomandate"), list) else [],
+        "recomandari_suplimentare": parsed.get("recomandari_suplimentare") if isinstance(parsed.get("recomandari_suplimentare"), list) else [],
+    }
+
+def _length_buckets(lengths, batch_size):
+    """Sortează indicii după lungime și îi grupează în bucket-uri de cel mult batch_size (padding minim)."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+# Id-urile tokenizate ale prefixului și instrucțiunii structurate, calculate o singură dată per tokenizer
+_PROMPT_TOKEN_CACHE = weakref.WeakKeyDictionary()
 
-def generate_structured(tokenizer, model, device, inputs, max_out_len=MAX_OUTPUT_LEN):
-    results = []
-    for inp in inputs:
-        # Modificarea promptului pentru a cere modelului doar JSON valid cu cele 4 câmpuri cerute
-        prompt = (inp + "\n\nRăspunsul trebuie să fie strict JSON valid cu următoarele chei:\n"
-                "boala (string) - numele bolii identificate,\n"
-                "medicamente_recomandate (list of objects with keys: nume, doza, administrare) - tratamentul recomandat,\n"
-                "investigatii_recomandate (list of strings) - investigații suplimentare necesare,\n"
-                "recomandari_suplimentare (list of strings) - recomandări suplimentare pentru pacient.\n"
-                "Exemplu: {\"boala\": \"astm bronșic\", "
-                "\"medicamente_recomandate\": [{\"nume\": \"Salbutamol\", \"doza\": \"100 mcg\", \"administrare\": \"inhalator\"}], "
-                "\"investigatii_recomandate\": [\"spirometrie\", \"radiografie toracică\"], "
-                "\"recomandari_suplimentare\": [\"evitați expunerea la praf\", \"monitorizare simptome\"]}\n"
-                "Returnează doar JSON valid, fără explicații.")
-
-        enc = tokenizer(prompt, return_tensors="pt", truncation=True, padding=True, max_length=MAX_INPUT_LEN)
+def _prompt_token_ids(tokenizer):
+    """Returnează (prefix_ids, instruction_ids) fără tokenul </s>, din cache."""
+    cached = _PROMPT_TOKEN_CACHE.get(tokenizer)
+    if cached is None:
+        prefix_ids = tokenizer(PROMPT_PREFIX, add_special_tokens=False)["input_ids"]
+        instruction_ids = tokenizer(STRUCTURED_INSTRUCTION, add_special_tokens=False)["input_ids"]
+        cached = (prefix_ids, instruction_ids)
+        _PROMPT_TOKEN_CACHE[tokenizer] = cached
+    return cached
+
+def _encode_structured_prompts(tokenizer, inputs):
+    """
+    Construiește id-urile prompturilor structurate din id-urile cache-uite + textul clinicianului.
+    Trunchierea la MAX_INPUT_LEN păstrează comportamentul tokenizer-ului (se taie de la final, </s> rămâne).
+    Returnează (lista de id-uri, raport de trunchiere per intrare).
+    """
+    prefix_ids, instruction_ids = _prompt_token_ids(tokenizer)
+    budget = MAX_INPUT_LEN - 1  # ultima poziție e rezervată pentru </s>
+
+    # Doar textul clinicianului este tokenizat per request
+    has_prefix = [inp.startswith(PROMPT_PREFIX) for inp in inputs]
+    user_texts = [inp[len(PROMPT_PREFIX):] if p else inp for inp, p in zip(inputs, has_prefix)]
+    user_ids_list = tokenizer(user_texts, add_special_tokens=False)["input_ids"] if user_texts else []
+
+    encoded = []
+    report = []
+    for user_ids, p in zip(user_ids_list, has_prefix):
+        head = prefix_ids if p else []
+        ids = (head + user_ids + instruction_ids)[:budget] + [tokenizer.eos_token_id]
+        encoded.append(ids)
+
+        user_kept = max(0, min(len(user_ids), budget - len(head)))
+        instruction_kept = max(0, min(len(instruction_ids), budget - len(head) - len(user_ids)))
+        report.append({
+            "user_tokens": len(user_ids),
+            "user_tokens_kept": user_kept,
+            "user_tokens_dropped": len(user_ids) - user_kept,
+            "prefix_tokens": len(head),
+            "instruction_tokens": len(instruction_ids),
+            "instruction_tokens_kept": instruction_kept,
+        })
+    return encoded, report
+
+def truncation_report(tokenizer, inputs):
+    """Câte tokenuri din textul utilizatorului supraviețuiesc trunchierii la MAX_INPUT_LEN, per intrare."""
+    return _encode_structured_prompts(tokenizer, inputs)[1]
+
+def generate_structured(tokenizer, model, device, inputs, max_out_len=MAX_OUTPUT_LEN, batch_size=8,
+                        profile=DEFAULT_STRUCTURED_PROFILE, constrained=False):
+    """
+    Generează output structurat pentru toate intrările.
+    Prompturile sunt grupate pe lungimi, fiecare bucket e decodat într-un singur model.generate,
+    iar rezultatele sunt returnate în ordinea inițială a intrărilor.
+    Cu constrained=True, tokenurile sunt limitate la schema JSON (vezi structured_decoding), iar
+    generarea se oprește imediat după acolada de închidere; doar un output tăiat de max_length
+    mai poate eșua la parsare. Ridică ValueError dacă vocabularul nu poate reprezenta JSON.
+    """
+    encoded, _ = _encode_structured_prompts(tokenizer, inputs)
+    constraint = structured_decoding.get_constraint(tokenizer) if constrained else None
+
+    results = [None] * len(encoded)
+    for bucket in _length_buckets([len(ids) for ids in encoded], batch_size):
+        enc = tokenizer.pad({"input_ids": [encoded[i] for i in bucket]}, return_tensors="pt")
         enc = {k: v.to(device) for k, v in enc.items()}
+        kwargs = generation_kwargs(profile, max_out_len)
+        if constraint is not None:
+            kwargs["logits_processor"] = LogitsProcessorList([structured_decoding.JSONSchemaLogitsProcessor(constraint)])
+        started = time.time()
         with torch.no_grad():
-            out = model.generate(
-                **enc,
-                max_length=max_out_len,
-                num_beams=5,  # Folosim mai multe raze pentru a îmbunătăți generarea
-                early_stopping=True,
-                do_sample=False,  # Nu folosim sampling pentru a controla mai strict generarea
-            )
-        
-        # Decodifică rezultatul generat
-        text = tokenizer.decode(out[0], skip_special_tokens=True, clean_up_tokenization_spaces=True)
-
-        # Încearcă să convertești rezultatul în JSON
-        parsed = _try_fix_and_parse_json(text) or {}
-
-        # Normalizează structura pentru a conține întotdeauna cheile așteptate
-        normalized = {
-            "boala": parsed.get("boala") if parsed.get("boala") is not None else None,
-            "medicamente_recomandate": parsed.get("medicamente_recomandate") if isinstance(parsed.get("medicamente_recomandate"), list) else [],
-            "investigatii_recomandate": parsed.get("investigatii_recomandate") if isinstance(parsed.get("investigatii_recomandate"), list) else [],
-            "recomandari_suplimentare": parsed.get("recomandari_suplimentare") if isinstance(parsed.get("recomandari_suplimentare"), list) else [],
-        }
+            outs = model.generate(**enc, **kwargs)
+        record_profile_latency(profile, time.time() - started)
 
-        results.append(normalized)
+        for i, out in zip(bucket, outs):
+            # Decodifică rezultatul generat și încearcă să îl convertească în JSON;
+            # output-ul constrâns e decodat exact (curățarea spațiilor ar putea atinge textul din string-uri)
+            text = tokenizer.decode(out, skip_special_tokens=True, clean_up_tokenization_spaces=constraint is None)
+            results[i] = _normalize_structured(_try_fix_and_parse_json(text))
 
     return results
 
@@ -120,40 +793,204 @@ def load_inputs_from_json(path="data.json", limit=None):
     raw_filtered = []
     for item in data:
         if "input" in item:
-            inputs.append(f"Completează fișa medicală: {item['input']}")
+            inputs.append(build_input(item['input']))
             raw_filtered.append(item)
             if limit and len(inputs) >= limit:
                 break
     return inputs, raw_filtered
 
+def _model_size_mb(paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p)) / (1024 * 1024)
+
+def _word_similarity(a, b):
+    return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+def compare_quantized(model_dir=MODEL_DIR, path="data.json", limit=50, profile=DEFAULT_TEXT_PROFILE, batch_size=8):
+    """
+    Compară modelul int8 cu fp32 (ambele pe CPU) pe intrările din data.json: acordul ieșirilor,
+    acordul diagnosticului extras, similaritatea cu referința ("output", dacă există),
+    latența per intrare și dimensiunea pe disc. Ajută la decizia de a activa cuantizarea.
+    """
+    from documents import format_result
+
+    inputs, raw = load_inputs_from_json(path, limit=limit)
+    if not inputs:
+        raise ValueError(f"Nu s-au găsit intrări în {path} (cheia 'input').")
+
+    outputs = {}
+    latency_ms = {}
+    for name, quantize in (("fp32", False), ("int8", True)):
+        tokenizer, model, _ = load_model(model_dir, quantize=quantize)
+        device = torch.device("cpu")
+        model.to(device)
+        preds = []
+        started = time.time()
+        for i in range(0, len(inputs), batch_size):
+            preds.extend(generate_texts(tokenizer, model, device, inputs[i:i + batch_size], profile=profile))
+        latency_ms[name] = (time.time() - started) * 1000.0 / len(inputs)
+        outputs[name] = preds
+        del model
+
+    pairs = list(zip(outputs["fp32"], outputs["int8"]))
+    report = {
+        "inputs": len(inputs),
+        "profile": profile,
+        "exact_match_vs_fp32": sum(1 for a, b in pairs if a == b) / len(pairs),
+        "avg_similarity_vs_fp32": sum(_word_similarity(a, b) for a, b in pairs) / len(pairs),
+        "boala_agreement": sum(1 for a, b in pairs if format_result(a)["boala"] == format_result(b)["boala"]) / len(pairs),
+        "latency_ms_per_input": latency_ms,
+        "speedup": latency_ms["fp32"] / latency_ms["int8"] if latency_ms["int8"] else None,
+        "size_mb": {
+            "fp32": _model_size_mb([os.path.join(model_dir, "model.safetensors"), os.path.join(model_dir, "pytorch_model.bin")]),
+            "int8": _model_size_mb([os.path.join(quantized_cache_dir(model_dir), "model_int8.pt")]),
+        },
+    }
+
+    references = [item.get("output") for item in raw]
+    if all(isinstance(r, str) for r in references):
+        report["avg_similarity_vs_reference"] = {
+            name: sum(_word_similarity(p, r) for p, r in zip(preds, references)) / len(references)
+            for name, preds in outputs.items()
+        }
+    return report
+
+def compare_speculative(model_dir=MODEL_DIR, path="data.json", limit=20, profile=DEFAULT_TEXT_PROFILE,
+                        num_draft=10, ngram_size=3, **load_options):
+    """
+    Compară decodarea speculativă (greedy + propuneri din prompt) cu beam search-ul profilului dat,
+    câte o intrare pe rând: tokenuri/secundă, rata de acceptare a propunerilor și cât de apropiate
+    sunt ieșirile (similaritate pe cuvinte, acordul diagnosticului extras).
+    """
+    from documents import format_result
+
+    inputs, _ = load_inputs_from_json(path, limit=limit)
+    if not inputs:
+        raise ValueError(f"Nu s-au găsit intrări în {path} (cheia 'input').")
+    tokenizer, model, device = get_model(model_dir=model_dir, **load_options)
+
+    started = time.time()
+    beam = [generate_texts(tokenizer, model, device, [text], profile=profile)[0] for text in inputs]
+    beam_seconds = time.time() - started
+    beam_tokens = sum(len(ids) for ids in tokenizer(beam, add_special_tokens=True)["input_ids"])
+
+    spec, spec_report = generate_texts_speculative(tokenizer, model, device, inputs,
+                                                   num_draft=num_draft, ngram_size=ngram_size)
+    pairs = list(zip(beam, spec))
+    return {
+        "inputs": len(inputs),
+        "beam": {
+            "profile": profile,
+            "tokens_per_sec": beam_tokens / beam_seconds if beam_seconds else None,
+            "latency_ms_per_input": beam_seconds * 1000.0 / len(inputs),
+        },
+        "speculative": spec_report,
+        "speedup_tokens_per_sec": (spec_report["tokens_per_sec"] * beam_seconds / beam_tokens
+                                   if beam_tokens and spec_report["tokens_per_sec"] else None),
+        "avg_similarity_vs_beam": sum(_word_similarity(a, b) for a, b in pairs) / len(pairs),
+        "boala_agreement": sum(1 for a, b in pairs if format_result(a)["boala"] == format_result(b)["boala"]) / len(pairs),
+    }
+
 def main():
     parser = argparse.ArgumentParser(description="Testează modelul T5 finetuned.")
     parser.add_argument("--text", "-t", nargs="+", help="Text(e) de intrare pentru generare (escape spacing automat).")
     parser.add_argument("--from-json", "-j", action="store_true", help="Folosește intrările din data.json")
+    parser.add_argument("--json-path", default="data.json", help="Calea către data.json (implicit ./data.json).")
     parser.add_argument("--limit", "-n", type=int, default=10, help="Număr maxim de exemple din JSON (implicit 10).")
     parser.add_argument("--structured", "-s", action="store_true", help="Generează output structurat (JSON) cu cheile dorite.")
     parser.add_argument("--out-file", "-o", help="Salvează output-ul JSON într-un fișier (implicit stdout).")
+    parser.add_argument("--batch-size", "-b", type=int, default=8, help="Număr maxim de prompturi per model.generate (implicit 8).")
+    parser.add_argument("--profile", "-p", choices=list(DECODING_PROFILES), help="Profil de decodare (implicit balanced pentru text, quality pentru structurat).")
+    parser.add_argument("--latency-budget-ms", type=float, help="Alege cel mai scump profil care, istoric, se încadrează în bugetul de latență.")
+    parser.add_argument("--quantize", "-q", action="store_true", help="Folosește modelul cuantizat int8 (CPU), cache-uit lângă model.")
+    parser.add_argument("--mmap", action="store_true", help="Mapează model.safetensors în memorie în loc să copieze greutățile (CPU).")
+    parser.add_argument("--onnx", action="store_true", help="Rulează modelul exportat în ONNX Runtime (CPU), cache-uit lângă model.")
+    parser.add_argument("--compare-quantized", action="store_true", help="Compară int8 cu fp32 pe data.json (acord, latență, dimensiune) și iese.")
+    parser.add_argument("--sections", help="Secțiuni după care se oprește generarea text, separate prin virgulă (ex. boala,tratament sau all).")
+    parser.add_argument("--speculative", action="store_true", help="Generare text greedy cu decodare speculativă din prompt (copiere din input).")
+    parser.add_argument("--draft-tokens", type=int, default=10, help="Câte tokenuri propune decodarea speculativă per pas (implicit 10).")
+    parser.add_argument("--ngram-size", type=int, default=3, help="Lungimea maximă a n-gramului căutat în prompt (implicit 3).")
+    parser.add_argument("--compare-speculative", action="store_true", help="Compară decodarea speculativă cu beam search pe data.json (tokenuri/s, acceptare) și iese.")
+    parser.add_argument("--constrained", "-c", action="store_true", help="Cu --structured, limitează decodarea la schema JSON (output valid din prima).")
+    parser.add_argument("--long-input", action="store_true", help="Generare text: un input peste MAX_INPUT_LEN este împărțit în fragmente în loc să fie trunchiat.")
+    parser.add_argument("--truncation-report", action="store_true", help="Afișează câte tokenuri din text supraviețuiesc trunchierii promptului structurat, fără generare.")
     args = parser.parse_args()
 
-    tokenizer, model, device = load_model()
+    if args.truncation_report:
+        tokenizer = T5Tokenizer.from_pretrained(MODEL_DIR)
+        if args.text:
+            inputs = [build_input(" ".join(args.text))]
+        else:
+            inputs, _ = load_inputs_from_json(args.json_path, limit=args.limit)
+        report = truncation_report(tokenizer, inputs)
+        kept = sum(r["user_tokens_kept"] for r in report)
+        total = sum(r["user_tokens"] for r in report)
+        summary = {
+            "inputs": len(report),
+            "user_tokens": total,
+            "user_tokens_kept": kept,
+            "kept_ratio": kept / total if total else 1.0,
+            "truncated_inputs": sum(1 for r in report if r["user_tokens_dropped"]),
+        }
+        print(json.dumps({"summary": summary, "per_input": report}, ensure_ascii=False, indent=4))
+        return
+
+    if args.compare_quantized:
+        report = compare_quantized(path=args.json_path, limit=args.limit,
+                                   profile=resolve_profile(args.profile, args.latency_budget_ms), batch_size=args.batch_size)
+        print(json.dumps(report, ensure_ascii=False, indent=4))
+        return
+
+    load_options = {"quantize": args.quantize, "mmap": args.mmap, "backend": "onnx" if args.onnx else None}
+    if args.compare_speculative:
+        report = compare_speculative(path=args.json_path, limit=args.limit, profile=resolve_profile(args.profile, args.latency_budget_ms),
+                                     num_draft=args.draft_tokens, ngram_size=args.ngram_size, **load_options)
+        print(json.dumps(report, ensure_ascii=False, indent=4))
+        return
+
+    tokenizer, model, device = get_model(**load_options)
+    profile = resolve_profile(args.profile, args.latency_budget_ms, structured=args.structured)
+
+    sections = None
+    if args.sections:
+        from documents import RESULT_SECTIONS
+        sections = RESULT_SECTIONS if args.sections == "all" else section_stopping.validate_sections(args.sections.split(","))
+
+    def texts(inputs):
+        if not args.speculative:
+            preds = generate_texts(tokenizer, model, device, inputs, profile=profile, sections=sections)
+            if sections:
+                print(json.dumps({"section_stopping": section_stop_stats()}, ensure_ascii=False), file=sys.stderr)
+            return preds
+        preds, report = generate_texts_speculative(tokenizer, model, device, inputs,
+                                                   num_draft=args.draft_tokens, ngram_size=args.ngram_size)
+        print(json.dumps({"speculative": report}, ensure_ascii=False), file=sys.stderr)
+        return preds
+
+    def long_text(text):
+        # textele generate per fragment, unul pe linie (documents.merge_formatted_results le combină)
+        chunks, preds = generate_texts_long(tokenizer, model, device, text, profile=profile, sections=sections)
+        return {"generated_text": "\n".join(preds), "fragmente": len(chunks)}
 
     outputs = []
 
     if args.text:
         inputs = [" ".join(args.text)]
         if args.structured:
-            res = generate_structured(tokenizer, model, device, inputs)
+            res = generate_structured(tokenizer, model, device, inputs, profile=profile, constrained=args.constrained)
             outputs = res
+        elif args.long_input:
+            outputs = [long_text(inputs[0])]
         else:
-            preds = generate_texts(tokenizer, model, device, inputs)
+            preds = texts(inputs)
             outputs = [{"generated_text": p} for p in preds]
     elif args.from_json:
-        inputs, raw = load_inputs_from_json(limit=args.limit)
+        inputs, raw = load_inputs_from_json(args.json_path, limit=args.limit)
         if not inputs:
             print("Nu s-au găsit intrări în data.json (cheia 'input').")
             return
         if args.structured:
-            res = generate_structured(tokenizer, model, device, inputs)
+            res = generate_structured(tokenizer, model, device, inputs, batch_size=args.batch_size, profile=profile,
+                                      constrained=args.constrained)
             # păstrează și datele originale pentru referință, fără câmp raw
             for item, r in zip(raw, res):
                 # r is a normalized dict from generate_structured; ensure exact structure
@@ -168,12 +1005,14 @@ def main():
         txt = input("Introdu textul de test (Enter pentru a ieși): ").strip()
         if not txt:
             return
-        inp = f"Completează fișa medicală: {txt}"
+        inp = build_input(txt)
         if args.structured:
-            res = generate_structured(tokenizer, model, device, [inp])[0]
+            res = generate_structured(tokenizer, model, device, [inp], profile=profile, constrained=args.constrained)[0]
             outputs = [res]
+        elif args.long_input:
+            outputs = [long_text(txt)]
         else:
-            pred = generate_texts(tokenizer, model, device, [inp])[0]
+            pred = texts([inp])[0]
             outputs = [{"generated_text": pred}]
 
     # afișare / salvare
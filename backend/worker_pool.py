@@ -0,0 +1,238 @@
+"""
+Pool de procese pentru inferență pe CPU, cu câte o replică de model per worker.
+
+Fiecare worker are un buget fix de thread-uri intra-op (torch.set_num_threads) și, pe Linux,
+afinitate pe un set disjunct de nuclee, ca workerii să nu își împartă aceleași core-uri.
+Batch-urile sunt trimise workerului cu cele mai puține batch-uri în lucru. Împărțirea
+workers x threads se alege din configurație în funcție de hardware (throughput vs latență).
+Un worker oprit neașteptat (OOM, segfault) este scos din pool, iar batch-urile trimise lui eșuează
+în loc să aștepte la nesfârșit.
+"""
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import testModel
+
+# Cât de des verifică colectorul că procesele workerilor mai rulează (secunde)
+LIVENESS_INTERVAL = 1.0
+
+
+def _worker_main(worker_id, cpus, threads, model_dir, load_options, tasks, results):
+    import torch
+
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    try:
+        tokenizer, model, device = testModel.get_model(model_dir=model_dir, **load_options)
+    except Exception as e:
+        results.put(('failed', worker_id, None, str(e)))
+        return
+    results.put(('ready', worker_id, None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, inputs, max_out_len, profile, sections = task
+        if inputs is None:
+            # Reîncărcarea modelului de pe disc (ex. după un nou fine-tuning)
+            try:
+                tokenizer, model, device = testModel.reload_model(model_dir, **load_options)
+                results.put(('done', worker_id, task_id, testModel.loaded_models()))
+            except Exception as e:
+                results.put(('error', worker_id, task_id, str(e)))
+            continue
+        try:
+            outputs = testModel.generate_texts(tokenizer, model, device, inputs, max_out_len, profile=profile,
+                                               sections=sections)
+            results.put(('done', worker_id, task_id, outputs))
+        except Exception as e:
+            results.put(('error', worker_id, task_id, str(e)))
+
+
+def plan_cpu_sets(workers, threads_per_worker, cpus=None):
+    """Împarte nucleele disponibile în seturi disjuncte de câte threads_per_worker (None dacă nu ajung)."""
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    if workers * threads_per_worker > len(cpus):
+        return [None] * workers
+    return [set(cpus[i * threads_per_worker:(i + 1) * threads_per_worker]) for i in range(workers)]
+
+
+class InferencePool:
+    def __init__(self, workers=2, threads_per_worker=None, model_dir=testModel.MODEL_DIR, load_options=None,
+                 pin_cpus=True, task_timeout=None):
+        """
+        - workers: numărul de procese, fiecare cu propria replică a modelului
+        - threads_per_worker: thread-uri intra-op per worker (implicit nucleele împărțite egal)
+        - pin_cpus: fixează fiecare worker pe nucleele lui (Linux)
+        - task_timeout: cât așteaptă generate_texts rezultatul unui batch, în secunde (None = oricât)
+        """
+        cpu_count = os.cpu_count() or 1
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // workers)
+        self.model_dir = model_dir
+        self.load_options = load_options or {}
+        self.task_timeout = task_timeout
+        cpu_sets = plan_cpu_sets(workers, self.threads_per_worker) if pin_cpus else [None] * workers
+
+        # spawn: fiecare worker pornește curat, fără starea (thread-uri, modele) procesului Flask
+        ctx = multiprocessing.get_context('spawn')
+        self._results = ctx.Queue()
+        self._task_queues = []
+        self._processes = []
+        for worker_id in range(workers):
+            tasks = ctx.Queue()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(worker_id, cpu_sets[worker_id], self.threads_per_worker, model_dir, self.load_options,
+                      tasks, self._results),
+                name=f'inference-worker-{worker_id}',
+                daemon=True)
+            process.start()
+            self._task_queues.append(tasks)
+            self._processes.append(process)
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}  # task_id -> (worker_id, future)
+        self._in_flight = [0] * workers
+        self._completed = [0] * workers
+        self._ready = [False] * workers
+        self._failed = {}
+        self._collector = threading.Thread(target=self._collect, name='inference-pool-collector', daemon=True)
+        self._collector.start()
+
+    def _alive_workers(self):
+        alive = [i for i in range(self.workers) if i not in self._failed]
+        if not alive:
+            raise RuntimeError('Niciun worker de inferență disponibil: ' + '; '.join(self._failed.values()))
+        return alive
+
+    def _register_task(self, worker_id):
+        """Înregistrează un task nou al workerului; apelat cu self._lock luat, returnează (task_id, future)."""
+        future = Future()
+        task_id = next(self._ids)
+        self._pending[task_id] = (worker_id, future)
+        self._in_flight[worker_id] += 1
+        return task_id, future
+
+    def submit(self, inputs, max_out_len=testModel.MAX_OUTPUT_LEN, profile=testModel.DEFAULT_TEXT_PROFILE, sections=None):
+        """Trimite un batch de prompturi workerului cel mai puțin încărcat; returnează un Future."""
+        with self._lock:
+            worker_id = min(self._alive_workers(), key=lambda i: self._in_flight[i])
+            task_id, future = self._register_task(worker_id)
+        self._task_queues[worker_id].put((task_id, list(inputs), max_out_len, profile, sections))
+        return future
+
+    def generate_texts(self, inputs, max_out_len=testModel.MAX_OUTPUT_LEN, profile=testModel.DEFAULT_TEXT_PROFILE,
+                       sections=None):
+        """Varianta blocantă; are semnătura unui runner pentru BatchScheduler.
+        Ridică concurrent.futures.TimeoutError după task_timeout secunde."""
+        started = time.time()
+        outputs = self.submit(inputs, max_out_len, profile, sections).result(timeout=self.task_timeout)
+        # Workerii își țin istoricul în procesul lor; bugetul de latență se decide în procesul serverului
+        testModel.record_profile_latency(profile, time.time() - started)
+        return outputs
+
+    def reload(self):
+        """Reîncarcă modelul de pe disc în toți workerii activi (după batch-urile deja primite de fiecare);
+        returnează modelele încărcate, per worker."""
+        with self._lock:
+            sent = []
+            for worker_id in self._alive_workers():
+                task_id, future = self._register_task(worker_id)
+                sent.append((worker_id, task_id, future))
+        for worker_id, task_id, _ in sent:
+            self._task_queues[worker_id].put((task_id, None, None, None, None))
+        return {worker_id: future.result(timeout=self.task_timeout) for worker_id, _, future in sent}
+
+    def _fail_worker(self, worker_id, reason):
+        """Scoate workerul din pool; apelat cu self._lock luat, returnează future-urile rămase fără răspuns."""
+        self._failed[worker_id] = reason
+        orphans = [tid for tid, (wid, _) in self._pending.items() if wid == worker_id]
+        self._in_flight[worker_id] = 0
+        return [self._pending.pop(tid)[1] for tid in orphans]
+
+    def _check_liveness(self):
+        """Workerii al căror proces s-a oprit (după ce au raportat 'ready'): [(future-uri, motiv)]."""
+        failed = []
+        with self._lock:
+            for worker_id, process in enumerate(self._processes):
+                if worker_id not in self._failed and not process.is_alive():
+                    reason = f'Workerul {worker_id} s-a oprit neașteptat (exit code {process.exitcode})'
+                    failed.append((self._fail_worker(worker_id, reason), reason))
+        return failed
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                message = None
+            if message is None or time.monotonic() - last_check >= LIVENESS_INTERVAL:
+                last_check = time.monotonic()
+                for futures, reason in self._check_liveness():
+                    for future in futures:
+                        future.set_exception(RuntimeError(reason))
+            if message is None:
+                continue
+
+            kind, worker_id, task_id, payload = message
+            with self._lock:
+                if kind == 'ready':
+                    self._ready[worker_id] = True
+                    continue
+                if kind == 'failed':
+                    # request-urile deja trimise acestui worker nu vor mai primi răspuns
+                    futures = self._fail_worker(worker_id, payload)
+                else:
+                    futures = None
+                    # None: workerul a fost deja declarat oprit, iar future-ul a primit eroarea
+                    _, future = self._pending.pop(task_id, (None, None))
+                    if future is None:
+                        continue
+                    self._in_flight[worker_id] -= 1
+                    self._completed[worker_id] += 1
+            if kind == 'failed':
+                for future in futures:
+                    future.set_exception(RuntimeError(f'Workerul {worker_id} nu a putut încărca modelul: {payload}'))
+            elif kind == 'done':
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def metrics(self):
+        """Starea fiecărui worker pentru monitorizare."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'threads_per_worker': self.threads_per_worker,
+                'per_worker': [
+                    {
+                        'pid': self._processes[i].pid,
+                        'alive': self._processes[i].is_alive(),
+                        'ready': self._ready[i],
+                        'in_flight': self._in_flight[i],
+                        'completed': self._completed[i],
+                        'error': self._failed.get(i),
+                        'memory': testModel.memory_report(self._processes[i].pid),
+                    }
+                    for i in range(self.workers)
+                ],
+            }
+
+    def shutdown(self):
+        for tasks in self._task_queues:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modulele din backend se importă între ele după nume (ca în run.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
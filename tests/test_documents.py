@@ -0,0 +1,13 @@
+from documents import extract_medicamente_from_input
+
+
+def test_brand_and_generic_of_same_substance_prescribed_once():
+    input_text = "Pacient cu febră și cefalee. Se recomandă Nurofen 400 mg de 3 ori pe zi după masă."
+    formatted_result = {'tratament_recomandat': [
+        {'nume': 'Ibuprofen', 'doza': '400 mg', 'administrare': ''},
+        {'nume': 'Nurofen 400', 'doza': '', 'administrare': ''},
+    ]}
+
+    medicamente = extract_medicamente_from_input(input_text, formatted_result)
+
+    assert [med['nume'] for med in medicamente] == ['Nurofen']
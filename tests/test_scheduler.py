@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from scheduler import BatchScheduler
+
+
+def test_concurrent_threads_survive_drained_queue():
+    """Cu concurrency > 1, thread-urile care găsesc coada golită de altul trebuie să aștepte, nu să moară."""
+    concurrency = 4
+
+    def runner(inputs, max_out_len, profile, sections):
+        time.sleep(0.01)
+        return [f"out:{text}" for text in inputs]
+
+    scheduler = BatchScheduler(window_ms=20, max_batch_size=8, runner=runner, concurrency=concurrency)
+    for _ in range(5):
+        futures = [scheduler.submit(f"text {i}") for i in range(3)]
+        for i, future in enumerate(futures):
+            result = future.result(timeout=5)
+            assert result.startswith("out:") and result.endswith(f"text {i}")
+        time.sleep(0.05)
+
+    assert len(scheduler._threads) == concurrency
+    assert all(thread.is_alive() for thread in scheduler._threads)
+    assert scheduler.metrics()["completed"] == 15